@@ -0,0 +1,152 @@
+"""Benchmarks reading an object graph with a compiled layout against naive per-field rpcs.
+
+Spawns a child python process holding a ctypes game-like object graph (a roster of pointers to soldiers, each with an
+inline position, a pointer to a weapon and a pointer to a squad), attaches to it and reads the whole graph both ways.
+
+Usage:
+    bench_layout.py [-n <soldiers>] [-i <iterations>]
+
+Options:
+    -n <soldiers>    Number of soldiers in the graph [default: 64]
+    -i <iterations>  Number of timed reads of the graph per method [default: 20]
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+import frida
+import trio
+
+from docopt import docopt
+from loguru import logger
+
+from fridare.fridasync import FAsyncSession, Struct, Field, Pointer, Array, Chain, to_python
+
+CHILD_SOURCE = """
+import ctypes, sys
+n = int(sys.argv[1])
+class Weapon(ctypes.Structure):
+    _fields_ = [("ammo", ctypes.c_int32), ("magazines", ctypes.c_uint8), ("damage", ctypes.c_float)]
+class Squad(ctypes.Structure):
+    _fields_ = [("id", ctypes.c_uint32), ("size", ctypes.c_uint32)]
+class Soldier(ctypes.Structure):
+    _fields_ = [("x", ctypes.c_float), ("y", ctypes.c_float), ("z", ctypes.c_float), ("hp", ctypes.c_float),
+                ("weapon", ctypes.POINTER(Weapon)), ("squad", ctypes.POINTER(Squad))]
+class Roster(ctypes.Structure):
+    _fields_ = [("count", ctypes.c_uint32), ("soldiers", ctypes.POINTER(Soldier) * n)]
+class Game(ctypes.Structure):
+    _fields_ = [("tick", ctypes.c_uint32), ("roster", ctypes.POINTER(Roster))]
+squads = [Squad(i, 4) for i in range(n // 4 + 1)]
+weapons = [Weapon(30, 3, 1.5 * i) for i in range(n)]
+soldiers = [Soldier(i, i + 0.5, -i, 100.0, ctypes.pointer(weapons[i]), ctypes.pointer(squads[i // 4]))
+            for i in range(n)]
+roster = Roster(n, (ctypes.POINTER(Soldier) * n)(*[ctypes.pointer(s) for s in soldiers]))
+game = Game(1, ctypes.pointer(roster))
+# a static-like root, as a pointer chain would start from in a game module
+root = ctypes.pointer(game)
+print(hex(ctypes.addressof(root)), flush=True)
+sys.stdin.read()
+"""
+
+
+def layouts(n: int) -> Struct:
+    """Return the Game layout matching the child's ctypes structures on a 64 bit python."""
+    weapon = Struct("Weapon", [Field("ammo", "s32", 0), Field("magazines", "u8", 4), Field("damage", "float", 8)])
+    squad = Struct("Squad", [Field("id", "u32", 0), Field("size", "u32", 4)])
+    soldier = Struct("Soldier", [Field("x", "float", 0), Field("y", "float", 4), Field("z", "float", 8),
+                                 Field("hp", "float", 12), Field("weapon", Pointer(weapon), 16),
+                                 Field("squad", Pointer(squad), 24)])
+    roster = Struct("Roster", [Field("count", "u32", 0), Field("soldiers", Array(Pointer(soldier), n), 8)])
+    return Struct("Game", [Field("tick", "u32", 0), Field("roster", Pointer(roster), 8)])
+
+
+def read_naive(utils, root: str) -> tuple[dict, int]:
+    """Read the graph at root with one rpc per field and per pointer hop, as a host polling loop would."""
+    rpcs = 0
+
+    def rv(address: int, type_: str):
+        nonlocal rpcs
+        rpcs += 1
+        return utils.read_value(hex(address), type_)
+
+    def rp(address: int) -> int:
+        return int(rv(address, "Pointer"), 16)
+
+    game = rp(int(root, 16))
+    roster = rp(game + 8)
+    soldiers = []
+    for i in range(rv(roster, "U32")):
+        s = rp(roster + 8 + i * 8)
+        weapon, squad = rp(s + 16), rp(s + 24)
+        soldiers.append({"x": rv(s, "Float"), "y": rv(s + 4, "Float"), "z": rv(s + 8, "Float"),
+                         "hp": rv(s + 12, "Float"),
+                         "weapon": {"ammo": rv(weapon, "S32"), "magazines": rv(weapon + 4, "U8"),
+                                    "damage": rv(weapon + 8, "Float")},
+                         "squad": {"id": rv(squad, "U32"), "size": rv(squad + 4, "U32")}})
+    return {"tick": rv(game, "U32"), "soldiers": soldiers}, rpcs
+
+
+def summarise(name: str, times: list[float], rpcs: int):
+    """Log the median and spread of times (seconds) for method name."""
+    median = statistics.median(times) * 1000
+    logger.info(f"{name:>22}: median {median:8.2f}ms, min {min(times) * 1000:8.2f}ms, "
+                f"max {max(times) * 1000:8.2f}ms, {rpcs} rpc(s) per read")
+    return median
+
+
+async def bench(n: int, iterations: int):
+    """Run the benchmark against a child process holding a graph of n soldiers."""
+    child = subprocess.Popen([sys.executable, "-c", CHILD_SOURCE, str(n)],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        root = child.stdout.readline().strip()
+        frida_session = await trio.to_thread.run_sync(frida.attach, child.pid)
+        session = FAsyncSession(f"bench:{child.pid}", frida_session)
+        await session.init()
+        utils, game = session._utils_script.exports, layouts(n)
+
+        naive_times = []
+        for _ in range(iterations):
+            t = time.perf_counter()
+            naive, naive_rpcs = read_naive(utils, root)
+            naive_times.append(time.perf_counter() - t)
+
+        root_game = hex(int(utils.read_value(root, "Pointer"), 16))
+        await session.read_layout(game, root_game)
+        layout_times = []
+        for _ in range(iterations):
+            t = time.perf_counter()
+            record = await session.read_layout(game, root_game)
+            decoded = to_python(record)
+            layout_times.append(time.perf_counter() - t)
+
+        # the root isn't really a module static, but a chain only needs a base to offset from
+        module = (await trio.to_thread.run_sync(utils.enumerate_modules))[0]
+        chain = Chain(module["name"], int(root, 16) - int(module["base"], 16), [0])
+        chain_times = []
+        for _ in range(iterations):
+            t = time.perf_counter()
+            to_python(await session.read_layout(game, chain=chain))
+            chain_times.append(time.perf_counter() - t)
+
+        soldiers = decoded["roster"]["soldiers"]
+        assert decoded["tick"] == naive["tick"] and len(soldiers) == len(naive["soldiers"])
+        for a, b in zip(soldiers, naive["soldiers"]):
+            assert {k: a[k] for k in ("x", "y", "z", "hp")} == {k: b[k] for k in ("x", "y", "z", "hp")}
+            assert a["weapon"] == b["weapon"] and a["squad"] == b["squad"]
+        logger.info(f"Read {n} soldiers, layout blob {(await session.layout_reader.define(game)).size} bytes, "
+                    f"results match")
+        naive_median = summarise("naive per-field rpcs", naive_times, naive_rpcs)
+        layout_median = summarise("layout read", layout_times, 1)
+        summarise("layout read via chain", chain_times, 1)
+        logger.info(f"Layout read is {naive_median / layout_median:.1f}x faster than naive reads "
+                    f"[{session.layout_reader.stats()}]")
+        await trio.to_thread.run_sync(frida_session.detach)
+    finally:
+        child.kill()
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    trio.run(bench, int(arguments["-n"]), int(arguments["-i"]))
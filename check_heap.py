@@ -0,0 +1,126 @@
+"""Checks that creating and unloading patches doesn't grow the frida heap or leak pooled memory in the target.
+
+Spawns an idle child python process, attaches to it and repeatedly creates, applies, clears and unloads a jmp patch
+(pooled code cave and vars) and a nop patch on the code of Py_GetVersion, which the idle child never runs. After the
+warm up cycles the frida heap size is taken as the baseline, it must be back within the tolerance of it at the end,
+the size must not trend upwards across the measured cycles (the fitted growth over them must also be within the
+tolerance) and the session's garbage report must be clean. Exits non-zero if not.
+
+Usage:
+    check_heap.py [-n <cycles>] [-w <warmup>] [-t <tolerance>]
+
+Options:
+    -n <cycles>     Number of measured create/unload cycles [default: 50]
+    -w <warmup>     Number of cycles run before the baseline is taken [default: 5]
+    -t <tolerance>  Allowed frida heap growth over the baseline, in bytes [default: 65536]
+"""
+import statistics
+import subprocess
+import sys
+
+import frida
+import trio
+
+from docopt import docopt
+from loguru import logger
+
+from fridare.fridasync import FAsyncSession, FridAsyncException, PatchVarSpec
+
+CHILD_SOURCE = """
+import ctypes, sys
+print(hex(ctypes.cast(ctypes.pythonapi.Py_GetVersion, ctypes.c_void_p).value), flush=True)
+sys.stdin.read()
+"""
+
+
+async def target_pattern(session: FAsyncSession, address: int) -> tuple[str, str]:
+    """Return (module name, shortest unique pattern of at least 5 bytes) at address in the child."""
+    modules = await trio.to_thread.run_sync(session._utils_script.exports.enumerate_modules)
+    module = next(m for m in modules if int(m["base"], 16) <= address < int(m["base"], 16) + m["size"])
+    index = await session.build_signature_index(module["name"])
+    pattern = index.unique_pattern(address - int(module["base"], 16), min_length=8, wildcard_relocations=True)
+    if pattern is None:
+        raise FridAsyncException(f"No unique pattern for {module['name']} @ {address:#x} to patch")
+    return module["name"], pattern.source
+
+
+async def cycle(session: FAsyncSession, module_name: str, pattern: str):
+    """Create, apply, clear (by unloading) and unload a jmp and a nop patch."""
+    jmp_patch = await session.create_jmp_patch("heap_jmp", module_name, pattern,
+                                               [PatchVarSpec("a", "float", 4, "1.0"), PatchVarSpec("b", "u32", 4, "2")],
+                                               False, 32, 8, "")
+    nop_patch = await session.create_nop_patch("heap_nop", module_name, pattern, 0, 8)
+    await jmp_patch.apply()
+    if not jmp_patch.applied:
+        raise RuntimeError("jmp patch failed to apply")
+    # unloading an applied patch must clear it first
+    await session.unload_patch("heap_jmp")
+    await nop_patch.apply()
+    await session.unload_patch("heap_nop")
+
+
+async def heap_size(session: FAsyncSession) -> int:
+    """Return the frida heap size, after giving the agent a moment to finish tearing down unloaded scripts."""
+    await trio.sleep(0.05)
+    return await trio.to_thread.run_sync(lambda: session.frida_heap_size)
+
+
+async def check(cycles: int, warmup: int, tolerance: int) -> bool:
+    """Run the check against an idle child python, returning whether it passed."""
+    child = subprocess.Popen([sys.executable, "-c", CHILD_SOURCE], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                             text=True)
+    try:
+        address = int(child.stdout.readline(), 16)
+        frida_session = await trio.to_thread.run_sync(frida.attach, child.pid)
+        session = FAsyncSession(f"check_heap:{child.pid}", frida_session)
+        await session.init()
+        module_name, pattern = await target_pattern(session, address)
+        logger.info(f"Patching {module_name} @ {address:#x} with pattern \"{pattern}\"")
+
+        initial = await heap_size(session)
+        for _ in range(warmup):
+            await cycle(session, module_name, pattern)
+        baseline = await heap_size(session)
+        sizes = []
+        for i in range(cycles):
+            await cycle(session, module_name, pattern)
+            sizes.append(await heap_size(session))
+        final = sizes[-1]
+        garbage = await trio.to_thread.run_sync(session.garbage_report)
+        await trio.to_thread.run_sync(frida_session.detach)
+    finally:
+        child.kill()
+
+    logger.info(f"frida heap: {initial} bytes before warm up, {baseline} baseline, {final} after {cycles} cycles "
+                f"(min {min(sizes)}, max {max(sizes)})")
+    logger.info(f"garbage report: {garbage}")
+    growth = final - baseline
+    # a slow leak can hide in the noise of the final size, but not in the trend of every cycle's size
+    trend = statistics.linear_regression(range(len(sizes)), sizes).slope if len(sizes) > 1 else 0.0
+    clean = not (garbage["stale_scripts"] or garbage["orphan_patches"] or garbage["leaked_allocations"]
+                 or garbage["scripts"] or garbage["pooled_bytes_used"])
+    if growth > tolerance:
+        logger.error(f"frida heap grew {growth} bytes ({growth / cycles:.0f} per cycle), over the {tolerance} "
+                     f"byte tolerance")
+    if trend * cycles > tolerance:
+        logger.error(f"frida heap trends upwards by {trend:.0f} bytes per cycle ({trend * cycles:.0f} over "
+                     f"{cycles} cycles), over the {tolerance} byte tolerance")
+    if not clean:
+        logger.error("Unloaded patches left garbage in the session")
+    passed = growth <= tolerance and trend * cycles <= tolerance and clean
+    if passed:
+        logger.success(f"frida heap is back to baseline ({growth:+} bytes, trend {trend:+.0f} bytes per cycle) "
+                       f"and the session is clean")
+    return passed
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    logger.remove()
+    logger.add(sys.stderr, level="INFO")
+    try:
+        passed = trio.run(check, int(arguments["-n"]), int(arguments["-w"]), int(arguments["-t"]))
+    except FridAsyncException as e:
+        logger.error(f"Can't run the check: {e}")
+        passed = False
+    sys.exit(0 if passed else 1)
@@ -17,12 +17,21 @@ fa = FridAsync()
 # create FRIDARE QuartTrio app
 import quart_trio  # noqa
 app = quart_trio.QuartTrio(__name__)
-# set up some development app config
-app.config.update({"DEBUG": True})
+# load the development or production app config, selected by the FRIDARE_ENV environment variable
+from .config import get_config  # noqa
+app.config.from_object(get_config())
+# cache compiled templates as bytecode, this must be set up before anything touches app.jinja_env
+import jinja2  # noqa
+if _bcc_dir := app.config["JINJA_BYTECODE_CACHE_DIR"]:
+    _bcc_dir.mkdir(exist_ok=True)
+    app.jinja_options = {**app.jinja_options, "bytecode_cache": jinja2.FileSystemBytecodeCache(str(_bcc_dir))}
 
 # import db related stuff :?
-from .db import db_connect  # noqa
+from .db import db_connect, LogStore, CaptureStore  # noqa
 
 # import other things to make them available at the module-level
-from .tracer import TracerInstrument  # noqa
-from . import routes, filters  # noqa
+from .tracer import TracerInstrument, TraceRecorder  # noqa
+trace_recorder = TraceRecorder(app.config["TRACE_DIR"], app.config["TRACE_BUFFER_EVENTS"])
+from .metrics import RequestMetrics  # noqa
+request_metrics = RequestMetrics(app.config["METRICS_WINDOW_SECONDS"])
+from . import routes, filters, assets, compression  # noqa
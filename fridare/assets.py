@@ -0,0 +1,151 @@
+"""Bundles FRIDARE static assets into content-hashed, precompressed files and serves them with long cache lifetimes."""
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
+import pathlib
+import shutil
+import urllib.request
+from typing import Optional
+
+import aiopath
+from loguru import logger
+
+from quart import request, abort, url_for, Response
+
+from . import app
+
+
+SCRIPT_DIR = pathlib.Path(__file__).parent
+STATIC_DIR = SCRIPT_DIR / "static"
+DIST_DIR = STATIC_DIR / "dist"
+MANIFEST_PATH = DIST_DIR / "manifest.json"
+
+# Third party assets that are fetched once by `build_assets` into static/vendor: name -> (cdn url, sri integrity)
+VENDOR_ASSETS = {
+    "vendor/bootstrap.min.css": ("https://cdn.jsdelivr.net/npm/bootstrap@5.0.2/dist/css/bootstrap.min.css",
+                                 "sha384-EVSTQN3/azprG1Anm3QDgpJLIm9Nao0Yz1ztcQTwFspd3yD65VohhpuuCOmLASjC"),
+    "vendor/bootstrap.bundle.min.js": ("https://cdn.jsdelivr.net/npm/bootstrap@5.0.2/dist/js/bootstrap.bundle.min.js",
+                                       "sha384-MrcW6ZMFYlzcLA8Nl+NtUVF0sA7MsXsP1UyJoMp4YLEuNSfAP+JcXn/tWtIaxVXM"),
+}
+# Every asset (relative to static/) that is bundled into static/dist
+BUNDLED_ASSETS = [*VENDOR_ASSETS, "css/example.css", "img/cmdr.png"]
+# Only text assets are worth precompressing, images are already compressed
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".json", ".svg", ".txt", ".html"}
+
+# Bundled asset name -> hashed dist file name, loaded from MANIFEST_PATH
+_manifest: dict[str, str] = {}
+# Hashed dist file name -> (bytes, gzipped bytes or None), filled as the assets are first requested
+_dist_files: dict[str, tuple[bytes, Optional[bytes]]] = {}
+
+
+class AssetIntegrityError(Exception):
+    """A fetched vendor asset doesn't match its subresource integrity hash."""
+
+
+def _sri_integrity(data: bytes) -> str:
+    """Return the sha384 subresource integrity string for data."""
+    return f"sha384-{base64.b64encode(hashlib.sha384(data).digest()).decode('ascii')}"
+
+
+def _hashed_name(name: str, data: bytes) -> str:
+    """Return name with a content hash inserted before the suffix, e.g. css/example.0a1b2c3d4e5f.css."""
+    p = pathlib.PurePosixPath(name)
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    return str(p.with_name(f"{p.stem}.{digest}{p.suffix}"))
+
+
+def fetch_vendor_assets():
+    """Download any missing vendor assets into static/vendor, verifying their integrity."""
+    for name, (url, integrity) in VENDOR_ASSETS.items():
+        path = STATIC_DIR / name
+        if path.exists():
+            continue
+        logger.info(f"Fetching '{url}'...")
+        with urllib.request.urlopen(url) as r:
+            data = r.read()
+        if _sri_integrity(data) != integrity:
+            raise AssetIntegrityError(f"Integrity check failed for '{url}'")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+
+def build_dist():
+    """Write content-hashed (and gzip precompressed) copies of BUNDLED_ASSETS and a manifest into static/dist."""
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    manifest = {}
+    for name in BUNDLED_ASSETS:
+        data = (STATIC_DIR / name).read_bytes()
+        hashed_name = _hashed_name(name, data)
+        out_path = DIST_DIR / hashed_name
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out_path.write_bytes(data)
+        if out_path.suffix in COMPRESSIBLE_SUFFIXES:
+            # mtime=0 keeps the gzip output reproducible between builds
+            gz_data = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gz_data) < len(data):
+                out_path.with_name(f"{out_path.name}.gz").write_bytes(gz_data)
+        manifest[name] = hashed_name
+        logger.info(f"{name} -> dist/{hashed_name}")
+    MANIFEST_PATH.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf8")
+    return manifest
+
+
+def load_manifest():
+    """(Re)load the dist manifest, clearing the in-memory asset cache."""
+    _manifest.clear()
+    _dist_files.clear()
+    if MANIFEST_PATH.exists():
+        _manifest.update(json.loads(MANIFEST_PATH.read_text(encoding="utf8")))
+        logger.debug(f"Loaded {len(_manifest)} bundled assets from '{MANIFEST_PATH}'")
+
+
+@app.cli.command("build_assets")
+def build_assets():
+    """Fetch vendor assets and build the content-hashed dist bundle."""
+    # library logging is disabled unless an entry point enables it, this command is one
+    logger.enable("fridare")
+    fetch_vendor_assets()
+    build_dist()
+
+
+@app.template_global()
+def asset_url(name: str) -> str:
+    """Return the url for a static asset, preferring the bundled dist copy if it has been built."""
+    if hashed_name := _manifest.get(name):
+        return url_for("dist_asset_view", filename=hashed_name)
+    # not built (yet), fall back to the cdn for vendor assets and plain static for our own
+    if name in VENDOR_ASSETS:
+        return VENDOR_ASSETS[name][0]
+    return url_for("static", filename=name)
+
+
+async def _read_dist_file(filename: str) -> tuple[bytes, Optional[bytes]]:
+    """Read a dist file and its precompressed variant into the in-memory cache."""
+    if (cached := _dist_files.get(filename)) is None:
+        path = aiopath.AsyncPath(DIST_DIR / filename)
+        gz_path = aiopath.AsyncPath(DIST_DIR / f"{filename}.gz")
+        gz_data = await gz_path.read_bytes() if await gz_path.exists() else None
+        cached = _dist_files[filename] = (await path.read_bytes(), gz_data)
+    return cached
+
+
+@app.route("/assets/<path:filename>")
+async def dist_asset_view(filename: str):
+    """Serve a content-hashed dist asset, gzipped if the client accepts it."""
+    # only serve what is in the manifest, which also stops any path traversal
+    if filename not in _manifest.values():
+        abort(404)
+    data, gz_data = await _read_dist_file(filename)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    max_age = app.config["ASSET_MAX_AGE"]
+    headers = {"Cache-Control": f"public, max-age={max_age}, immutable" if max_age else "no-cache",
+               "Vary": "Accept-Encoding"}
+    if gz_data is not None and "gzip" in request.accept_encodings:
+        headers["Content-Encoding"] = "gzip"
+        data = gz_data
+    return Response(data, headers=headers, mimetype=mimetype)
+
+
+load_manifest()
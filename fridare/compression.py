@@ -0,0 +1,29 @@
+"""Compresses dynamic FRIDARE responses with gzip when enabled by app.config["COMPRESS_RESPONSES"]."""
+import gzip
+
+from quart import request
+from quart.wrappers.response import DataBody
+
+from . import app
+
+
+COMPRESSIBLE_MIMETYPES = {"text/html", "text/css", "text/plain", "text/javascript",
+                          "application/javascript", "application/json", "image/svg+xml"}
+
+
+@app.after_request
+async def compress_response(response):
+    """Gzip compressible in-memory responses for clients that accept it."""
+    if not app.config["COMPRESS_RESPONSES"]:
+        return response
+    # leave streamed/file bodies, already encoded bodies and uncompressible types alone
+    if (not isinstance(response.response, DataBody) or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES or "gzip" not in request.accept_encodings):
+        return response
+    data = await response.get_data()
+    if len(data) < app.config["COMPRESS_MIN_SIZE"]:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=app.config["COMPRESS_LEVEL"]))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
@@ -0,0 +1,84 @@
+"""Defines FRIDARE app and hypercorn server configurations for development and production serving."""
+import os
+import pathlib
+
+
+SCRIPT_DIR = pathlib.Path(__file__).parent
+
+
+class DevelopmentConfig:
+    """Configuration for local development - debug on, templates reloaded, nothing compressed."""
+
+    DEBUG = True
+    TEMPLATES_AUTO_RELOAD = True
+    # Cache templates as jinja2 bytecode in this directory, None to disable
+    JINJA_BYTECODE_CACHE_DIR = None
+    # Compress dynamic responses (html, json, ...) with gzip when the client accepts it
+    COMPRESS_RESPONSES = False
+    COMPRESS_MIN_SIZE = 512
+    COMPRESS_LEVEL = 6
+    # Max age for content-hashed (immutable) static assets served from static/dist
+    ASSET_MAX_AGE = 0
+    # Watch the fridajs templates and hot-reload changed patches into live sessions
+    FRIDAJS_HOT_RELOAD = True
+    # The sqlite log store that fridrwr.py logs into and the /logs view queries
+    LOG_STORE_PATH = SCRIPT_DIR / "db" / "fridrwr_logs.db"
+    LOG_STORE_MAX_RECORDS = 2_000_000
+    LOG_STORE_MAX_BYTES = 512 * 1024 ** 2
+    # Where trio traces recorded from the web UI are written, and how much a single recording may hold
+    TRACE_DIR = SCRIPT_DIR.parent / "traces"
+    TRACE_BUFFER_EVENTS = 500_000
+    TRACE_MAX_SECONDS = 60
+    # Where suffix array indexes of module code are cached for `fridrwr.py sig`, keyed by the code's sha256
+    SIG_INDEX_DIR = SCRIPT_DIR.parent / "sigindex"
+    # How often function captures are drained from the game, and whether drained records are kept in the db
+    CAPTURE_DRAIN_INTERVAL = 0.5
+    CAPTURE_PERSIST = True
+    # The fraction of requests written to the access log, failed and slow (ms) requests are always logged
+    ACCESS_LOG_SAMPLE_RATE = 1.0
+    ACCESS_LOG_SLOW_MS = 500
+    # The window (seconds) that /api/metrics measures request throughput over
+    METRICS_WINDOW_SECONDS = 60
+    # Settings passed to hypercorn.Config.from_mapping by fridrwr.py
+    HYPERCORN = {
+        "bind": ["127.0.0.1:5000"],
+    }
+
+
+class ProductionConfig(DevelopmentConfig):
+    """Configuration for serving FRIDARE to browsers on the LAN."""
+
+    DEBUG = False
+    TEMPLATES_AUTO_RELOAD = False
+    JINJA_BYTECODE_CACHE_DIR = SCRIPT_DIR / ".jinja_cache"
+    COMPRESS_RESPONSES = True
+    ASSET_MAX_AGE = 365 * 24 * 60 * 60
+    FRIDAJS_HOT_RELOAD = False
+    ACCESS_LOG_SAMPLE_RATE = 0.1
+    HYPERCORN = {
+        # the dashboard can patch the game, so it is only reachable locally unless FRIDARE_BIND opts in to more,
+        # e.g. FRIDARE_BIND=0.0.0.0:5000
+        "bind": os.environ.get("FRIDARE_BIND", "127.0.0.1:5000").split(","),
+        # keep connections open between dashboard refreshes so they don't pay the handshake again
+        "keep_alive_timeout": 75,
+        # multiplex every asset request over a single h2 connection (h2c, or h2 when certfile/keyfile are set)
+        "alpn_protocols": ["h2", "http/1.1"],
+        "h2_max_concurrent_streams": 32,
+        "h2_max_inbound_frame_size": 2 ** 16,
+        "backlog": 64,
+        "graceful_timeout": 5,
+        "certfile": os.environ.get("FRIDARE_CERTFILE"),
+        "keyfile": os.environ.get("FRIDARE_KEYFILE"),
+    }
+
+
+CONFIGS = {"development": DevelopmentConfig, "production": ProductionConfig}
+
+
+def get_config(env: str = None):
+    """Return the config class for env, defaulting to the FRIDARE_ENV environment variable."""
+    env = env if env else os.environ.get("FRIDARE_ENV", "development")
+    try:
+        return CONFIGS[env]
+    except KeyError:
+        raise ValueError(f"Unknown FRIDARE_ENV '{env}', expected one of {', '.join(CONFIGS)}")
@@ -16,4 +16,6 @@ def db_connect():
     return engine
 
 
+from .logstore import LogStore, query_logs  # noqa
+from .capturestore import CaptureStore  # noqa
 from . import cli  # noqa
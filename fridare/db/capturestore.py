@@ -0,0 +1,43 @@
+"""Persists drained capture records into the FRIDARE sqlite db, one table per capture."""
+import pathlib
+from sqlite3 import dbapi2 as sqlite3
+
+import trio
+
+from loguru import logger
+
+
+def _sql_type(kind: str) -> str:
+    """Return the sqlite column type for a numpy dtype kind."""
+    return "REAL" if kind == "f" else "INTEGER"
+
+
+class CaptureStore:
+    """Writes each drained batch of capture records to a capture_<name> table in a single transaction."""
+
+    def __init__(self, path: pathlib.Path):
+        """Initialise a CaptureStore writing to the sqlite db at path."""
+        self.path = path
+        self._created: set[str] = set()
+
+    def _write(self, target: str, name: str, records):
+        """Insert records (a numpy structured array) into the capture_<name> table, creating it if needed."""
+        table = f"capture_{name}"
+        columns = records.dtype.names
+        db = sqlite3.connect(self.path, timeout=5)
+        try:
+            if table not in self._created:
+                cols = ", ".join(f"{c} {_sql_type(records.dtype[c].kind)}" for c in columns)
+                db.executescript(f"PRAGMA journal_mode = WAL;"
+                                 f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, target TEXT, {cols});")
+                self._created.add(table)
+            sql = f"INSERT INTO {table} (target, {', '.join(columns)}) VALUES (?{', ?' * len(columns)})"
+            with db:
+                db.executemany(sql, ((target, *r) for r in records.tolist()))
+        finally:
+            db.close()
+
+    async def write(self, session, capture, records):
+        """Persist a drained batch in a bg thread, on_records callback for FridAsync.drain_captures."""
+        await trio.to_thread.run_sync(self._write, session.target, capture.spec.name, records)
+        logger.debug(f"Persisted {len(records)} '{capture.spec.name}' capture records")
@@ -0,0 +1,241 @@
+"""Provides an indexed sqlite store for FRIDARE logs, fed by a non-blocking loguru sink."""
+import pathlib
+import queue
+import re
+import sys
+import threading
+import time
+from sqlite3 import dbapi2 as sqlite3
+from typing import Optional
+
+
+_SCHEMA = """
+PRAGMA auto_vacuum = INCREMENTAL;
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS logs (
+  id INTEGER PRIMARY KEY,
+  time REAL NOT NULL,
+  level TEXT NOT NULL,
+  level_no INTEGER NOT NULL,
+  target TEXT,
+  script TEXT,
+  name TEXT,
+  function TEXT,
+  line INTEGER,
+  message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS logs_level_no_id ON logs (level_no, id);
+CREATE INDEX IF NOT EXISTS logs_target_id ON logs (target, id);
+CREATE INDEX IF NOT EXISTS logs_script_id ON logs (script, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5(message, content='logs', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS logs_ai AFTER INSERT ON logs BEGIN
+  INSERT INTO logs_fts(rowid, message) VALUES (new.id, new.message);
+END;
+CREATE TRIGGER IF NOT EXISTS logs_ad AFTER DELETE ON logs BEGIN
+  INSERT INTO logs_fts(logs_fts, rowid, message) VALUES ('delete', old.id, old.message);
+END;
+"""
+_INSERT = "INSERT INTO logs (time, level, level_no, target, script, name, function, line, message) " \
+          "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+# the distinct level_no values >= ?, each found by a seek of the logs_level_no_id index rather than a scan
+_LEVELS_FROM = """
+WITH RECURSIVE levels(n) AS (
+  SELECT min(level_no) FROM logs WHERE level_no >= ?
+  UNION ALL
+  SELECT (SELECT min(level_no) FROM logs WHERE level_no > n) FROM levels WHERE n IS NOT NULL
+)
+SELECT n FROM levels
+"""
+# fallback for records that weren't bound with target/script, e.g. "[rwr_game.exe:anti_fog_jmp_patch.js] ..."
+_SCTX_RE = re.compile(r"^\[([^:\]\s]+):([^\]\s]+)\]")
+
+
+def _connect(path) -> sqlite3.Connection:
+    """Connect to the log store at path."""
+    engine = sqlite3.connect(path, timeout=5)
+    engine.row_factory = sqlite3.Row
+    return engine
+
+
+class LogStore:
+    """Batches loguru records into a sqlite log store from a writer thread, so logging never waits on disk."""
+
+    def __init__(self, path: pathlib.Path, max_records: int = 2_000_000, max_bytes: int = 512 * 1024 ** 2,
+                 batch_size: int = 5000, flush_interval: float = 0.25, write_retries: int = 3):
+        """Initialise a LogStore writing to path, keeping at most max_records records in at most max_bytes."""
+        self.path = path
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_retries = write_retries
+        # records given up on after write_retries failed writes
+        self.dropped = 0
+        self._queue = queue.SimpleQueue()
+        self._writer = None
+
+    def sink(self, message):
+        """Loguru sink: queue the record for the writer thread (never blocks)."""
+        r = message.record
+        target, script = r["extra"].get("target", None), r["extra"].get("script", None)
+        if target is None and (m := _SCTX_RE.match(r["message"])):
+            target, script = m.groups()
+        self._queue.put((r["time"].timestamp(), r["level"].name, r["level"].no, target, script,
+                         r["name"], r["function"], r["line"], r["message"]))
+
+    def start(self):
+        """Create the schema and start the writer thread."""
+        db = _connect(self.path)
+        db.executescript(_SCHEMA)
+        if db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # a store created before auto_vacuum was set only takes the new mode once rebuilt
+            db.execute("VACUUM")
+        db.close()
+        self._writer = threading.Thread(target=self._write_loop, name="fridare-logstore", daemon=True)
+        self._writer.start()
+        return self
+
+    def close(self):
+        """Flush queued records and stop the writer thread."""
+        if self._writer:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _write_loop(self):
+        db = _connect(self.path)
+        db.execute("PRAGMA synchronous = NORMAL")
+        running = True
+        while running:
+            batch = []
+            try:
+                # wait for the first record, then take whatever else is queued up to batch_size
+                record = self._queue.get(timeout=self.flush_interval)
+                while record is not None:
+                    batch.append(record)
+                    if len(batch) >= self.batch_size:
+                        break
+                    record = self._queue.get_nowait()
+                running = record is not None
+            except queue.Empty:
+                pass
+            if batch and self._write(db, batch):
+                try:
+                    self._prune(db)
+                except Exception as e:
+                    _stderr(f"failed to prune '{self.path}': {e!r}")
+        db.close()
+
+    def _write(self, db: sqlite3.Connection, batch: list[tuple]) -> bool:
+        """Insert batch, retrying write_retries times, then record by record, dropping those that still fail.
+
+        Returns whether anything was written. A failed write never stops the writer thread.
+        """
+        for attempt in range(1, self.write_retries + 2):
+            try:
+                with db:
+                    db.executemany(_INSERT, batch)
+                return True
+            except Exception as e:
+                # not logged with loguru, the record would come straight back into this store
+                _stderr(f"failed to write {len(batch)} record(s) to '{self.path}' (attempt {attempt}): {e!r}")
+                time.sleep(self.flush_interval)
+        # a single bad record shouldn't take the rest of its batch with it
+        written = 0
+        for record in batch:
+            try:
+                with db:
+                    db.execute(_INSERT, record)
+                written += 1
+            except Exception as e:
+                self.dropped += 1
+                _stderr(f"dropped a record ({self.dropped} dropped in total): {e!r}")
+        return written > 0
+
+    def _prune(self, db: sqlite3.Connection):
+        """Delete the oldest records, 10% at a time, while there are over max_records or they take over max_bytes."""
+        lo, hi = db.execute("SELECT min(id), max(id) FROM logs").fetchone()
+        if lo is not None and hi - lo + 1 > self.max_records:
+            with db:
+                db.execute("DELETE FROM logs WHERE id < ?", (hi - int(self.max_records * 0.9),))
+        pruned = False
+        while self._used_bytes(db) > self.max_bytes:
+            lo, hi = db.execute("SELECT min(id), max(id) FROM logs").fetchone()
+            if lo is None or lo == hi:
+                break
+            with db:
+                db.execute("DELETE FROM logs WHERE id < ?", (lo + max((hi - lo) // 10, 1),))
+            pruned = True
+        if pruned:
+            # hand the freed pages back to the filesystem, deletes alone only add them to the freelist (the pragma
+            # frees a page per step, so all of its rows must be fetched)
+            db.execute("PRAGMA incremental_vacuum").fetchall()
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    @staticmethod
+    def _used_bytes(db: sqlite3.Connection) -> int:
+        """Return the bytes used by the store's pages, not counting free pages."""
+        page_size = db.execute("PRAGMA page_size").fetchone()[0]
+        pages = db.execute("PRAGMA page_count").fetchone()[0] - db.execute("PRAGMA freelist_count").fetchone()[0]
+        return pages * page_size
+
+
+def _stderr(message: str):
+    """Report a log store error straight to stderr."""
+    print(f"fridare-logstore: {message}", file=sys.stderr, flush=True)
+
+
+def query_logs(path: pathlib.Path, min_level: Optional[int] = None, target: Optional[str] = None,
+               script: Optional[str] = None, search: Optional[str] = None,
+               before_id: Optional[int] = None, limit: int = 100) -> list[dict]:
+    """Return up to limit records, newest first, matching the filters (keyset paginated by before_id).
+
+    search is an fts5 query over the message text, e.g. 'PROCEXC' or '"access violation"'. Every page is read in id
+    order from an index, stopping at limit, rather than sorting all of the matching records.
+    """
+    where, params = [], []
+    if target:
+        where.append("logs.target = ?")
+        params.append(target)
+    if script:
+        where.append("logs.script = ?")
+        params.append(script)
+    db = _connect(path)
+    try:
+        if search:
+            # fts5 yields its matches in rowid order, so the newest page is read without sorting every match
+            if min_level is not None:
+                where.append("logs.level_no >= ?")
+                params.append(min_level)
+            if before_id is not None:
+                where.append("logs_fts.rowid < ?")
+                params.append(before_id)
+            sql = "SELECT logs.* FROM logs_fts JOIN logs ON logs.id = logs_fts.rowid WHERE logs_fts MATCH ?" + \
+                  "".join(f" AND {w}" for w in where) + " ORDER BY logs_fts.rowid DESC LIMIT ?"
+            rows = db.execute(sql, [search, *params, limit])
+        elif min_level is not None:
+            # the (level_no, id) index only yields id order for a single level, so read each of the few levels at
+            # or above min_level newest first (found by seeking the index) and merge their pages
+            if before_id is not None:
+                where.append("logs.id < ?")
+                params.append(before_id)
+            levels = [n for (n,) in db.execute(_LEVELS_FROM, (min_level,)) if n is not None]
+            if not levels:
+                return []
+            page = "SELECT * FROM (SELECT logs.* FROM logs WHERE logs.level_no = ?" + \
+                   "".join(f" AND {w}" for w in where) + " ORDER BY logs.id DESC LIMIT ?)"
+            sql = " UNION ALL ".join([page] * len(levels)) + " ORDER BY id DESC LIMIT ?"
+            rows = db.execute(sql, [p for n in levels for p in (n, *params, limit)] + [limit])
+        else:
+            if before_id is not None:
+                where.append("logs.id < ?")
+                params.append(before_id)
+            sql = "SELECT logs.* FROM logs" + (f" WHERE {' AND '.join(where)}" if where else "") + \
+                  " ORDER BY logs.id DESC LIMIT ?"
+            rows = db.execute(sql, [*params, limit])
+        return [dict(row) for row in rows]
+    except sqlite3.OperationalError:
+        # a malformed fts query or a store that doesn't exist yet
+        return []
+    finally:
+        db.close()
@@ -1,4 +1,6 @@
 """Define filters for web templates."""
+import datetime
+
 from . import app
 
 
@@ -6,3 +8,9 @@ from . import app
 def jinja_dir(o):
     """Return dir(o) for templates."""
     return dir(o)
+
+
+@app.template_filter()
+def log_time(t: float):
+    """Return a log store timestamp formatted like the log file times."""
+    return datetime.datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
@@ -4,12 +4,23 @@ from .logging import FRIDAJS_DEBUG_LVL, FRIDAJS_INFO_LVL, FRIDAJS_WARN_LVL, FRID
 import aiopath  # noqa
 PKG_DIR = aiopath.AsyncPath(__file__).parent
 
+from .exceptions import FridAsyncException  # noqa
+
+# fridajs scripts and templates are read once and kept in memory, see hotreload for picking up edits
+from .sources import FridaJSSourceCache, FridaJSTemplateLoader  # noqa
+fridajs_sources = FridaJSSourceCache()
+
 import jinja2  # noqa
 _FRIDAJS_TEMPLATES_DIR = PKG_DIR / "fridajs_templates"
-jinja_fridajs_env = jinja2.Environment(loader=jinja2.FileSystemLoader(_FRIDAJS_TEMPLATES_DIR))
+jinja_fridajs_env = jinja2.Environment(loader=FridaJSTemplateLoader(_FRIDAJS_TEMPLATES_DIR, fridajs_sources))
 
-from .exceptions import FridAsyncException  # noqa
 from .fridasync import FridAsync  # noqa
 
 from .session import FAsyncSession  # noqa
 from .patcher import PatchBuilder, PatchVarSpec  # noqa
+from .capture import CaptureField, CaptureSpec  # noqa
+from .watch import WatchEvent  # noqa
+from .layout import Struct, Field, Pointer, Array, Chain, to_python  # noqa
+from .scheduler import Scheduler  # noqa
+from .signatures import PatchPlan, resolve_patch_plan  # noqa
+from .sigindex import SignatureIndex  # noqa
@@ -65,6 +65,23 @@ rpc.exports.enumerateModules = function () {
   return Process.enumerateModules();
 };
 
+rpc.exports.enumerateModuleRanges = function (name, protection) {
+  // the ranges of module name with at least protection, as module-relative offsets
+  const m = Process.getModuleByName(name);
+  return m.enumerateRanges(protection).map(r => ({ offset: r.base.sub(m.base).toUInt32(), size: r.size }));
+}
+
+rpc.exports.readModuleRange = function (name, offset, size) {
+  // returned as binary data, not json
+  const m = Process.getModuleByName(name);
+  return m.base.add(offset).readByteArray(size);
+}
+
+rpc.exports.readValue = function (address, type) {
+  // a single typed read, e.g. readValue("0x1234", "Float"), see layout.py for reading whole structs at once
+  return ptr(address)["read" + type]();
+}
+
 // TODO: Process.findRangeByAddress
 // TODO: Process.getRangeByAddress
 // TODO: Process.enumerateRanges
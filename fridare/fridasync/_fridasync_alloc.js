@@ -0,0 +1,114 @@
+// Slab allocator for patch code caves and patch variables, shared by every patch script in the session.
+// Code is packed into a few rwx slabs and variables into separate rw slabs, each slab allocated near the module
+// being patched so that rel32 jmps to and from the patch code stay in range.
+// This script is never hot-reloaded: unloading it would free every slab and the patch memory inside them.
+
+const ALIGN = { code: 16, data: 8 };
+// stay well inside +/-2GiB of the module so any address in a slab is rel32 reachable from anywhere in the module
+const MAX_DISTANCE = 0x70000000;
+
+// kind -> list of slabs { base, size, module_name, free: [{ offset, size }] } (free list kept sorted by offset)
+const slabs = { code: [], data: [] };
+// address string -> { slab, offset, size }
+const allocations = new Map();
+
+function _alignUp(n, a) {
+  return Math.ceil(n / a) * a;
+}
+
+function _newSlab(kind, size, module_name) {
+  const slab_size = _alignUp(size, Process.pageSize);
+  const options = {};
+  if (module_name !== null) {
+    const m = Process.getModuleByName(module_name);
+    options.near = m.base;
+    options.maxDistance = MAX_DISTANCE - m.size;
+  }
+  const base = Memory.alloc(slab_size, options);
+  if (kind === "code") {
+    Memory.protect(base, slab_size, "rwx");
+  }
+  const slab = { base: base, size: slab_size, module_name: module_name, free: [{ offset: 0, size: slab_size }] };
+  slabs[kind].push(slab);
+  return slab;
+}
+
+function _takeFirstFit(slab, size) {
+  for (let i = 0; i < slab.free.length; i++) {
+    const block = slab.free[i];
+    if (block.size >= size) {
+      const offset = block.offset;
+      block.offset += size;
+      block.size -= size;
+      if (block.size === 0) {
+        slab.free.splice(i, 1);
+      }
+      return offset;
+    }
+  }
+  return null;
+}
+
+rpc.exports.alloc = function (kind, size, module_name) {
+  const aligned_size = _alignUp(size, ALIGN[kind]);
+  for (let slab of slabs[kind]) {
+    if (slab.module_name !== module_name) continue;
+    const offset = _takeFirstFit(slab, aligned_size);
+    if (offset !== null) {
+      const address = slab.base.add(offset);
+      allocations.set(address.toString(), { slab: slab, offset: offset, size: aligned_size });
+      return address.toString();
+    }
+  }
+  const slab = _newSlab(kind, aligned_size, module_name);
+  const offset = _takeFirstFit(slab, aligned_size);
+  const address = slab.base.add(offset);
+  allocations.set(address.toString(), { slab: slab, offset: offset, size: aligned_size });
+  return address.toString();
+}
+
+rpc.exports.free = function (address) {
+  const key = ptr(address).toString();
+  const a = allocations.get(key);
+  if (a === undefined) return false;
+  allocations.delete(key);
+  // insert the block back in offset order and coalesce it with its neighbours
+  const free = a.slab.free;
+  let i = 0;
+  while (i < free.length && free[i].offset < a.offset) i++;
+  free.splice(i, 0, { offset: a.offset, size: a.size });
+  if (i + 1 < free.length && free[i].offset + free[i].size === free[i + 1].offset) {
+    free[i].size += free[i + 1].size;
+    free.splice(i + 1, 1);
+  }
+  if (i > 0 && free[i - 1].offset + free[i - 1].size === free[i].offset) {
+    free[i - 1].size += free[i].size;
+    free.splice(i, 1);
+  }
+  return true;
+}
+
+rpc.exports.stats = function () {
+  const stats = {};
+  for (let kind of Object.keys(slabs)) {
+    let size = 0, free = 0, largest_free = 0;
+    for (let slab of slabs[kind]) {
+      size += slab.size;
+      for (let block of slab.free) {
+        free += block.size;
+        largest_free = Math.max(largest_free, block.size);
+      }
+    }
+    stats[kind] = {
+      slabs: slabs[kind].length,
+      pages: size / Process.pageSize,
+      used: size - free,
+      free: free,
+      largest_free: largest_free,
+      // 0 when all free space is one block, approaching 1 as it is split into many small blocks
+      fragmentation: free > 0 ? 1 - largest_free / free : 0
+    };
+  }
+  stats.allocations = allocations.size;
+  return stats;
+}
@@ -0,0 +1,107 @@
+// Reads whole object graphs (structs, nested pointers, arrays) into packed binary blobs in a single rpc.
+// Readers are compiled from struct layouts declared in python (see fridasync/layout.py) and defined here at runtime.
+// Pointer chains from a module static (like a Cheat Engine pointer) are resolved through a cache of chain prefixes.
+
+// name -> { size, valid_offset, read(a, u8, o, copy) }
+const readers = new Map();
+// chain prefix key -> { address, time }
+const prefixes = new Map();
+let prefix_ttl = 1000;
+const counters = { reads: 0, prefix_hits: 0, prefix_misses: 0, invalidations: 0 };
+
+function _copy(u8, a, o, n) {
+  u8.set(new Uint8Array(a.readByteArray(n)), o);
+}
+
+function _prefixKeys(module_name, offset, hops) {
+  const keys = [module_name + "+" + offset];
+  for (let h of hops) keys.push(keys[keys.length - 1] + "|" + h);
+  return keys;
+}
+
+function _resolveChain(module_name, offset, hops) {
+  // the address at the end of the chain, walking on from the longest fresh cached prefix
+  const keys = _prefixKeys(module_name, offset, hops);
+  const now = Date.now();
+  let k = keys.length - 1, a = null;
+  for (; k >= 0; k--) {
+    const e = prefixes.get(keys[k]);
+    if (e !== undefined && now - e.time < prefix_ttl) {
+      a = e.address;
+      counters.prefix_hits++;
+      break;
+    }
+  }
+  if (a === null) {
+    counters.prefix_misses++;
+    a = Process.getModuleByName(module_name).base.add(offset);
+    k = 0;
+    prefixes.set(keys[0], { address: a, time: now });
+  }
+  for (let i = k; i < hops.length; i++) {
+    const p = a.readPointer();
+    if (p.isNull()) return null;
+    a = p.add(hops[i]);
+    prefixes.set(keys[i + 1], { address: a, time: now });
+  }
+  return a;
+}
+
+function _invalidateChain(module_name, offset, hops) {
+  counters.invalidations++;
+  for (let key of _prefixKeys(module_name, offset, hops)) prefixes.delete(key);
+}
+
+function _readChainInto(r, u8, module_name, offset, hops) {
+  let a = null;
+  try {
+    a = _resolveChain(module_name, offset, hops);
+  } catch (e) {
+    // a cached prefix pointed at freed memory
+  }
+  if (a !== null) r.read(a, u8, 0, _copy);
+  return a !== null && u8[r.valid_offset] === 1;
+}
+
+rpc.exports.define = function (name, size, valid_offset, source) {
+  // source is the body of a function (a, u8, o, copy) that reads the struct at a into u8 at o
+  readers.set(name, { size: size, valid_offset: valid_offset, read: new Function("a", "u8", "o", "copy", source) });
+}
+
+rpc.exports.read = function (name, addresses) {
+  const r = readers.get(name);
+  const out = new ArrayBuffer(r.size * addresses.length);
+  const u8 = new Uint8Array(out);
+  for (let i = 0; i < addresses.length; i++) {
+    const a = ptr(addresses[i]);
+    if (!a.isNull()) r.read(a, u8, i * r.size, _copy);
+  }
+  counters.reads += addresses.length;
+  return out;
+}
+
+rpc.exports.readChain = function (name, module_name, offset, hops) {
+  const r = readers.get(name);
+  let out = new ArrayBuffer(r.size);
+  counters.reads++;
+  if (!_readChainInto(r, new Uint8Array(out), module_name, offset, hops)) {
+    // the object moved (or was freed) since the chain was cached, walk the whole chain again
+    _invalidateChain(module_name, offset, hops);
+    out = new ArrayBuffer(r.size);
+    _readChainInto(r, new Uint8Array(out), module_name, offset, hops);
+  }
+  return out;
+}
+
+rpc.exports.invalidate = function () {
+  counters.invalidations++;
+  prefixes.clear();
+}
+
+rpc.exports.setPrefixTtl = function (ms) {
+  prefix_ttl = ms;
+}
+
+rpc.exports.stats = function () {
+  return Object.assign({ readers: readers.size, prefixes: prefixes.size, prefix_ttl: prefix_ttl }, counters);
+}
@@ -0,0 +1,133 @@
+// Watches typed values in memory for changes using MemoryAccessMonitor, instead of the host polling them.
+// Each page holding a watched value is armed with a one-shot guard: the first access to it notifies us and disarms
+// the page, so further accesses cost nothing until the page is re-armed. Any access marks the page dirty, as a read
+// that disarms the page hides later writes to it. After min_interval ms the values on dirty pages are re-read (with
+// the monitor disabled, the agent must not trip its own guards) and any changes are sent to the host as a single
+// "watch" message.
+
+const READERS = {
+  u8: a => a.readU8(), s8: a => a.readS8(), u16: a => a.readU16(), s16: a => a.readS16(),
+  u32: a => a.readU32(), s32: a => a.readS32(), u64: a => a.readU64().toString(), s64: a => a.readS64().toString(),
+  float: a => a.readFloat(), double: a => a.readDouble(), pointer: a => a.readPointer().toString()
+};
+const SIZES = { u8: 1, s8: 1, u16: 2, s16: 2, u32: 4, s32: 4, u64: 8, s64: 8, float: 4, double: 8 };
+
+// name -> { address, type, pages, value }
+const watches = new Map();
+// the page bases armed in the monitor, in the order of the ranges it was enabled with
+let armed_pages = [];
+const dirty_pages = new Set();
+let flush_pending = false;
+let min_interval = 50;
+const counters = { accesses: 0, writes: 0, flushes: 0, changes: 0 };
+
+function _pageOf(address) {
+  return address.and(ptr(Process.pageSize - 1).not());
+}
+
+function _pagesOf(address, type) {
+  const size = (type === "pointer") ? Process.pointerSize : SIZES[type];
+  const first = _pageOf(address), last = _pageOf(address.add(size - 1));
+  return first.equals(last) ? [first.toString()] : [first.toString(), last.toString()];
+}
+
+function _arm() {
+  MemoryAccessMonitor.disable();
+  const pages = new Set();
+  for (let w of watches.values()) {
+    for (let p of w.pages) pages.add(p);
+  }
+  armed_pages = Array.from(pages);
+  if (armed_pages.length > 0) {
+    MemoryAccessMonitor.enable(armed_pages.map(p => ({ base: ptr(p), size: Process.pageSize })), { onAccess: _onAccess });
+  }
+}
+
+function _unarmed(fn) {
+  // read watched memory without tripping the guards, re-arming every page afterwards
+  MemoryAccessMonitor.disable();
+  try {
+    return fn();
+  } finally {
+    _arm();
+  }
+}
+
+function _onAccess(details) {
+  counters.accesses++;
+  if (details.operation === "write") counters.writes++;
+  // any access disarms the page, so a write after a read would go unnoticed unless the page is re-checked too
+  dirty_pages.add(armed_pages[details.rangeIndex]);
+  if (!flush_pending) {
+    flush_pending = true;
+    setTimeout(_flush, min_interval);
+  }
+}
+
+function _flush() {
+  flush_pending = false;
+  counters.flushes++;
+  if (dirty_pages.size === 0) {
+    _arm();
+    return;
+  }
+  // a write landing between the compare and the re-arm is still caught: the value is compared against the last one
+  // sent, on the next access of any kind to the page
+  const changes = _unarmed(() => {
+    const changes = [];
+    for (let [name, w] of watches) {
+      if (!w.pages.some(p => dirty_pages.has(p))) continue;
+      const value = READERS[w.type](w.address);
+      if (value !== w.value) {
+        changes.push({ name: name, old: w.value, value: value });
+        w.value = value;
+      }
+    }
+    dirty_pages.clear();
+    return changes;
+  });
+  if (changes.length > 0) {
+    counters.changes += changes.length;
+    send({ type: "watch", time: Date.now(), changes: changes });
+  }
+}
+
+rpc.exports.add = function (name, address, type) {
+  if (!(type in READERS)) throw new Error("Unknown watch type '" + type + "'");
+  const a = ptr(address);
+  // the page may already be armed for another watch
+  const w = _unarmed(() => {
+    const w = { address: a, type: type, pages: _pagesOf(a, type), value: READERS[type](a) };
+    watches.set(name, w);
+    return w;
+  });
+  return w.value;
+}
+
+rpc.exports.remove = function (name) {
+  const removed = watches.delete(name);
+  _arm();
+  return removed;
+}
+
+rpc.exports.read = function () {
+  return _unarmed(() => {
+    const values = {};
+    for (let [name, w] of watches) values[name] = READERS[w.type](w.address);
+    return values;
+  });
+}
+
+rpc.exports.setMinInterval = function (ms) {
+  min_interval = ms;
+}
+
+rpc.exports.stats = function () {
+  return Object.assign({ watches: watches.size, pages: armed_pages.length, min_interval: min_interval }, counters);
+}
+
+rpc.exports.dispose = function () {
+  watches.clear();
+  armed_pages = [];
+  MemoryAccessMonitor.disable();
+}
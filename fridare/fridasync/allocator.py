@@ -0,0 +1,33 @@
+"""Wraps the agent side slab allocator that pools patch code caves and patch variables per session."""
+import frida
+import trio
+
+from loguru import logger
+
+
+CODE, DATA = "code", "data"
+
+
+class AgentAllocator:
+    """Provides an asyncy wrapper around the _fridasync_alloc.js script of a session."""
+
+    def __init__(self, script: frida.core.Script):
+        """Wrap the loaded _fridasync_alloc.js frida.core.Script."""
+        self._script = script
+
+    async def alloc(self, kind: str, size: int, module_name: str = None) -> str:
+        """Allocate size bytes of kind (CODE or DATA) near module_name, returning the address as a hex string."""
+        address = await trio.to_thread.run_sync(self._script.exports.alloc, kind, size, module_name)
+        logger.debug(f"Allocated {size} bytes of pooled {kind} memory near '{module_name}' @ {address}")
+        return address
+
+    async def free(self, address: str) -> bool:
+        """Return the allocation at address to its slab for reuse."""
+        freed = await trio.to_thread.run_sync(self._script.exports.free, address)
+        if not freed:
+            logger.warning(f"Can't free pooled memory @ {address}, it isn't allocated")
+        return freed
+
+    def stats(self) -> dict:
+        """Return the slab, page and fragmentation stats for the code and data pools."""
+        return self._script.exports.stats()
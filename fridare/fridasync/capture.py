@@ -0,0 +1,186 @@
+"""Captures function arguments and return values into an agent side ring buffer, drained in bulk into NumPy."""
+import dataclasses
+import re
+import time
+from typing import Optional, Union
+
+import frida
+import jinja2
+import numpy as np
+import trio
+
+from loguru import logger
+
+from . import jinja_fridajs_env
+from .exceptions import FridAsyncException
+from .patcher import _js_offset
+from .script import FAsyncScript
+
+
+# capture field type -> (numpy dtype, size), "pointer" is sized to the target process
+CAPTURE_TYPES = {
+    "u8": ("<u1", 1), "s8": ("<i1", 1), "u16": ("<u2", 2), "s16": ("<i2", 2),
+    "u32": ("<u4", 4), "s32": ("<i4", 4), "float": ("<f4", 4),
+    "u64": ("<u8", 8), "s64": ("<i8", 8), "double": ("<f8", 8),
+}
+# the record header written by capture.js before the fields
+CAPTURE_HEADER = [("time", "<f8"), ("seq", "<u4"), ("tid", "<u4"), ("returned", "<u4")]
+CAPTURE_HEADER_SIZE = 20
+# the drained blob header: u32 record count, u32 records dropped since the last drain
+DRAIN_HEADER = np.dtype([("records", "<u4"), ("dropped", "<u4")])
+_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_REGISTER_RE = re.compile(r"^[a-z][a-z0-9]*$")
+
+
+@dataclasses.dataclass
+class CaptureField:
+    """A value to capture on each call: argument source (int index) or register source (str name, e.g. 'ecx')."""
+
+    name: str
+    type: str
+    source: Union[int, str]
+
+
+@dataclasses.dataclass
+class CaptureSpec:
+    """Declares a function to hook and the fields recorded for every call to it.
+
+    Fields are read raw from the argument slot or register, so a float argument must be passed in an integer
+    slot (e.g. on the x86 stack) and a capture retval must be an integer or pointer type (not ST0/xmm0).
+    """
+
+    name: str
+    module_name: str
+    target_pattern: str
+    fields: list[CaptureField]
+    retval: Optional[str] = None
+    pattern_offset: int = 0
+    capacity: int = 65536
+
+
+class FAsyncCaptureScript(FAsyncScript):
+    """Extends FAsyncScript to wrap a capture script, decoding drained records into a NumPy structured array."""
+
+    def __init__(self, name: str, source_js: str, script: frida.core.Script):
+        """Initialise a FAsyncCaptureScript."""
+        super().__init__(name, source_js, script)
+        # set by the session when the capture is created
+        self.spec: CaptureSpec = None
+        self.dtype: np.dtype = None
+        self.records = 0
+        self.dropped = 0
+        self.last_drain: float = None
+
+    def __str__(self):
+        """Return str(self: FAsyncCaptureScript)."""
+        return f"FAsyncCaptureScript({self.name=} [loaded:{self.loaded}, records:{self.records}, " \
+               f"dropped:{self.dropped}]"
+
+    def decode(self, blob: bytes) -> np.ndarray:
+        """Decode a drained blob into a structured array of records (a view on blob, not a copy)."""
+        header = np.frombuffer(blob, DRAIN_HEADER, count=1)[0]
+        count, dropped = int(header["records"]), int(header["dropped"])
+        if dropped:
+            logger.warning(f"Capture '{self.spec.name}' overflowed, {dropped} records were dropped "
+                           f"(drain more often or raise capacity above {self.spec.capacity})")
+        self.records += count
+        self.dropped += dropped
+        return np.frombuffer(blob, self.dtype, count=count, offset=DRAIN_HEADER.itemsize)
+
+    async def drain(self) -> np.ndarray:
+        """Drain every unread record from the agent ring buffer in a single binary rpc."""
+        blob = await trio.to_thread.run_sync(self._script.exports.drain)
+        self.last_drain = time.time()
+        return self.decode(blob)
+
+    def stats(self) -> dict:
+        """Return the agent side written/read/dropped record counts."""
+        return self._script.exports.stats()
+
+    async def unload(self):
+        """Detach the capture's hook, then unload the script."""
+        if self.loaded:
+            try:
+                await trio.to_thread.run_sync(self._script.exports.detach)
+            except frida.InvalidOperationError as e:
+                logger.warning(f"Can't detach capture '{self.name}': {e}")
+        await super().unload()
+
+
+def _js_writer(source: str, offset: int, size: int) -> str:
+    """Return the js statement that writes the low size bytes of NativePointer source at record offset."""
+    if size == 1:
+        return f"view.setUint8(o + {offset}, {source}.toUInt32() & 0xff);"
+    elif size == 2:
+        return f"view.setUint16(o + {offset}, {source}.toUInt32() & 0xffff, true);"
+    elif size == 4:
+        return f"view.setUint32(o + {offset}, {source}.toUInt32(), true);"
+    return f"{{ const v = {source}; view.setUint32(o + {offset}, v.and(0xffffffff).toUInt32(), true); " \
+           f"view.setUint32(o + {offset + 4}, v.shr(32).toUInt32(), true); }}"
+
+
+class CaptureBuilder:
+    """Generates capture scripts and their record dtypes from CaptureSpecs using jinja2."""
+
+    CAPTURE_TEMPLATE = "capture.js"
+
+    def __init__(self, pointer_size: int):
+        """Initialise a CaptureBuilder for a target process with pointer_size."""
+        self.pointer_size = pointer_size
+
+    @property
+    def _capture_template(self) -> jinja2.Template:
+        return jinja_fridajs_env.get_template(self.CAPTURE_TEMPLATE)
+
+    def _type(self, type_name: str) -> tuple[str, int]:
+        """Return (numpy dtype, size) of capture type_name, validated against the target pointer size."""
+        if type_name == "pointer":
+            return f"<u{self.pointer_size}", self.pointer_size
+        if type_name not in CAPTURE_TYPES:
+            raise FridAsyncException(f"Unknown capture type '{type_name}', expected one of "
+                                     f"{', '.join([*CAPTURE_TYPES, 'pointer'])}")
+        dtype, size = CAPTURE_TYPES[type_name]
+        if size > self.pointer_size:
+            raise FridAsyncException(f"Capture type '{type_name}' doesn't fit in a {self.pointer_size} byte slot")
+        return dtype, size
+
+    def dtype(self, spec: CaptureSpec) -> np.dtype:
+        """Return the packed record dtype for spec."""
+        fields = [*CAPTURE_HEADER, *((f.name, self._type(f.type)[0]) for f in spec.fields)]
+        if spec.retval:
+            fields.append(("retval", self._type(spec.retval)[0]))
+        return np.dtype(fields)
+
+    def gen_capture_js(self, spec: CaptureSpec, target_offset: int = None):
+        """Build a capture script for spec, with the target pre-resolved to target_offset if given."""
+        _script_name = f"{spec.name}_capture.js"
+        for name in [spec.name, *(f.name for f in spec.fields)]:
+            if not _NAME_RE.match(name) or name in {"time", "seq", "tid", "returned", "retval"}:
+                raise FridAsyncException(f"Capture '{spec.name}' has an invalid name '{name}'")
+        if spec.retval in {"float", "double"}:
+            raise FridAsyncException(f"Capture '{spec.name}' retval must be an integer or pointer type, "
+                                     f"float returns are not in the return register")
+        logger.debug(f"Creating capture: {spec=}")
+        fields, offset = [], CAPTURE_HEADER_SIZE
+        for f in spec.fields:
+            if isinstance(f.source, int):
+                source = f"args[{f.source}]"
+            elif _REGISTER_RE.match(f.source):
+                source = f"this.context.{f.source}"
+            else:
+                raise FridAsyncException(f"Capture '{spec.name}' field '{f.name}' has invalid source '{f.source}'")
+            size = self._type(f.type)[1]
+            fields.append({"name": f.name, "writer": _js_writer(source, offset, size)})
+            offset += size
+        retval = None
+        if spec.retval:
+            size = self._type(spec.retval)[1]
+            retval = {"writer": _js_writer("retval", offset, size), "zero": _js_writer("NULL", offset, size)}
+            offset += size
+        capture_js = self._capture_template.render(name=spec.name, module_name=spec.module_name,
+                                                   target_pattern=spec.target_pattern,
+                                                   target_offset=_js_offset(target_offset),
+                                                   pattern_offset=spec.pattern_offset,
+                                                   fields=fields, retval=retval,
+                                                   capacity=spec.capacity, record_size=offset)
+        return _script_name, capture_js
@@ -0,0 +1,113 @@
+// Captures the arguments (and return value) of every call to a function into a preallocated ring buffer of
+// fixed-size little endian records, which the host drains in bulk with rpc.exports.drain.
+// Record layout: f64 time (ms since the capture started), u32 seq, u32 thread id, u32 returned, then the fields.
+
+function _log_info(message) {
+  console.log(message);
+}
+
+function _log_error(message) {
+  console.error(message);
+}
+
+const _now = (typeof performance !== "undefined") ? () => performance.now() : () => Date.now();
+
+const NAME = "{{ name }}";
+const CAPACITY = {{ capacity }};
+const RECORD_SIZE = {{ record_size }};
+const ring = new ArrayBuffer(CAPACITY * RECORD_SIZE);
+const view = new DataView(ring);
+// total records written by the hook and read by the host, written - read > CAPACITY means unread records were lost
+let written = 0;
+let read = 0;
+let dropped = 0;
+const t0 = _now();
+
+function _findTarget(module_name, target_pattern, target_offset, pattern_offset) {
+  const m = Process.getModuleByName(module_name);
+  if (target_offset !== null) {
+    // a patch plan resolved the pattern offline, verify it in place instead of scanning the whole module
+    const pattern_length = target_pattern.trim().split(/\s+/).length;
+    if (Memory.scanSync(m.base.add(target_offset), pattern_length, target_pattern).length == 1) {
+      return m.base.add(target_offset).add(pattern_offset);
+    }
+  }
+  const hits = Memory.scanSync(m.base, m.size, target_pattern);
+  if (hits.length != 1) {
+    _log_error("Capture '" + NAME + "', searching for '" + target_pattern + "', matched " + hits.length +
+               " times, pattern must be unique in search space");
+    return null;
+  }
+  return hits[0].address.add(pattern_offset);
+}
+
+const target = _findTarget("{{ module_name }}", "{{ target_pattern }}", {{ target_offset }}, {{ pattern_offset }});
+let listener = null;
+if (target !== null) {
+  listener = Interceptor.attach(target, {
+    onEnter(args) {
+      const seq = written++;
+      const o = (seq % CAPACITY) * RECORD_SIZE;
+      view.setFloat64(o, _now() - t0, true);
+      view.setUint32(o + 8, seq >>> 0, true);
+      view.setUint32(o + 12, this.threadId, true);
+      view.setUint32(o + 16, 0, true);
+      {% for f in fields %}
+      {{ f.writer }}
+      {% endfor %}
+      {% if retval %}
+      // zero the retval left in the slot by an earlier record, it is written if and when the call returns
+      {{ retval.zero }}
+      this.seq = seq;
+      {% endif %}
+    },
+    {% if retval %}
+    onLeave(retval) {
+      const seq = this.seq;
+      // the ring wrapped while the call was running and the record has been overwritten
+      if (written - seq > CAPACITY) return;
+      const o = (seq % CAPACITY) * RECORD_SIZE;
+      view.setUint32(o + 16, 1, true);
+      {{ retval.writer }}
+    }
+    {% endif %}
+  });
+  _log_info("Capture '" + NAME + "' hooked @ " + target + " [" + CAPACITY + " x " + RECORD_SIZE + " byte records]");
+}
+
+rpc.exports.drain = function () {
+  // return the unread records, oldest first, behind a header of u32 record count, u32 records dropped
+  let n = written - read;
+  let lost = 0;
+  if (n > CAPACITY) {
+    lost = n - CAPACITY;
+    read = written - CAPACITY;
+    n = CAPACITY;
+  }
+  dropped += lost;
+  const out = new ArrayBuffer(8 + n * RECORD_SIZE);
+  const header = new DataView(out);
+  header.setUint32(0, n, true);
+  header.setUint32(4, lost, true);
+  const records = new Uint8Array(out, 8);
+  const start = (read % CAPACITY) * RECORD_SIZE;
+  const first = Math.min(n, CAPACITY - read % CAPACITY) * RECORD_SIZE;
+  records.set(new Uint8Array(ring, start, first), 0);
+  if (first < n * RECORD_SIZE) {
+    records.set(new Uint8Array(ring, 0, n * RECORD_SIZE - first), first);
+  }
+  read = written;
+  return out;
+}
+
+rpc.exports.stats = function () {
+  return { hooked: listener !== null, written: written, read: read, dropped: dropped,
+           capacity: CAPACITY, record_size: RECORD_SIZE };
+}
+
+rpc.exports.detach = function () {
+  if (listener !== null) {
+    listener.detach();
+    listener = null;
+  }
+}
@@ -3,7 +3,7 @@
 {% block patch_extension %}
 class JmpPatch extends Patch {
   constructor(name, module_name, target_pattern, vars_spec,
-              relocate_target, patch_mem_size, return_offset, cw_patch_func) {
+              relocate_target, patch_mem_size, return_offset, cw_patch_func, patch_memory) {
     super(name, module_name, target_pattern, vars_spec)
     this.relocate_target = relocate_target;
     // size of the memory, to allocate, for code to be written into
@@ -12,43 +12,45 @@ class JmpPatch extends Patch {
     this.return_offset = return_offset;
     // the constructor provided function that does the patch-specific code writing
     this.cw_patch_func = cw_patch_func;
-    // set up patch memory
+    // set up patch memory, pooled by the session allocator if it provided a code cave (already rwx)
     this.patch_memory = null;
-    // allocate some memory that we can write the patch code into later
-    this.patch_memory = Memory.alloc(this.patch_mem_size);
-    _log_debug("JmpPatch '" + this.name + "' allocated patch memory @ " + this.patch_memory);
-    // set the protection on the allocated memory to make sure it can be executed later
-    Memory.protect(this.patch_memory, this.patch_mem_size, "rwx");
+    this.code_written = false;
+    this._timed("alloc_code", () => {
+      if (patch_memory !== null) {
+        this.patch_memory = ptr(patch_memory);
+        _log_debug("JmpPatch '" + this.name + "' using pooled patch memory @ " + this.patch_memory);
+        return;
+      }
+      // allocate some memory that we can write the patch code into later
+      this.patch_memory = Memory.alloc(this.patch_mem_size);
+      _log_debug("JmpPatch '" + this.name + "' allocated patch memory @ " + this.patch_memory);
+      // set the protection on the allocated memory to make sure it can be executed later
+      Memory.protect(this.patch_memory, this.patch_mem_size, "rwx");
+    }, this.load_timings);
   }
 
-  setup() {
-    // call the superclass setup to get this.target and this.target_bytes setup
-    var r = super.setup();
-    // if this returned value is false, super.setup() has failed and we can't go on, ret false;
-    if (r === false) {
-      _log_error("JmpPatch '" + this.name + "' super.setup() failed :/");
-      return false;
-    }
-    // create a codewriter pointed at this.patch_memory start
-    const cw = new X86Writer(this.patch_memory, { pc: this.patch_memory });
-    // if this.relocate_target, patch specifies that the matched target bytes should be written at start of patch mem
-    if (this.relocate_target === true) {
-      for (let b of this.target_bytes) {
-        cw.putU8(b);
+  _writeCode() {
+    this._timed("codegen", () => {
+      // create a codewriter pointed at this.patch_memory start
+      const cw = new X86Writer(this.patch_memory, { pc: this.patch_memory });
+      // if this.relocate_target, patch specifies that the matched target bytes should be written at start of patch mem
+      if (this.relocate_target === true) {
+        for (let b of this.target_bytes) {
+          cw.putU8(b);
+        }
+        cw.flush();
       }
-      cw.flush();
-    }
 
-    // run the user supplied function to write the custom patch code
-    this.cw_patch_func(cw, this.vars);
-    // write the jmp to return back to the normal program flow
-    cw.putJmpAddress(this.target.address.add(this.return_offset));
-    cw.flush();
+      // run the user supplied function to write the custom patch code
+      this.cw_patch_func(cw, this.vars);
+      // write the jmp to return back to the normal program flow
+      cw.putJmpAddress(this.target.address.add(this.return_offset));
+      cw.flush();
+    });
+    this.code_written = true;
     // DEBUG: check
-    _log_debug("JmpPatch '" + this.name + "' hexdump of patch memory at end of setup:\n" +
+    _log_debug("JmpPatch '" + this.name + "' hexdump of patch memory after writing code:\n" +
                 hexdump(this.patch_memory, { offset: 0, length: this.patch_mem_size, header: true, ansi: false}));
-
-    return true;
   }
 
   apply () {
@@ -59,6 +61,13 @@ class JmpPatch extends Patch {
       _log_error("JmpPatch '" + this.name + "' super.apply() failed :/");
       return false;
     }
+    if (this.patch_memory === null) {
+      _log_error("JmpPatch '" + this.name + "' has no patch memory to write code into :/");
+      return false;
+    }
+    if (this.code_written === false) {
+      this._writeCode();
+    }
     // TODO: really need to add better guards here in future, we need target_pattern to return targets of size
     // >= 5 bytes in order to have enough space to write a 1 byte JMP + 4 byte address at the patch target site
     // for now, let's just try it...
@@ -71,11 +80,13 @@ class JmpPatch extends Patch {
       return false;
     }
     // hmm ok, now write the jmp at the patch target site
-    Memory.patchCode(this.target.address, this.target.size, code => {
-      const cw = new X86Writer(code, { pc: this.target.address});
-      cw.putJmpAddress(this.patch_memory);
-      cw.putNopPadding(nop_sled_length);
-      cw.flush();
+    this._timed("patch_code", () => {
+      Memory.patchCode(this.target.address, this.target.size, code => {
+        const cw = new X86Writer(code, { pc: this.target.address});
+        cw.putJmpAddress(this.patch_memory);
+        cw.putNopPadding(nop_sled_length);
+        cw.flush();
+      });
     });
     return true;
   }
@@ -83,12 +94,14 @@ class JmpPatch extends Patch {
   clear() {
     // super.clear() // not cleared at Patch level as there is just a blank filler func there atm
     _log_debug("JmpPatch '" + this.name + "' is clearing patch by restoring original bytes at target site...")
-    Memory.patchCode(this.target.address, this.target.size, code => {
-      const cw = new X86Writer(code, { pc: this.target.address });
-      for (let b of this.target_bytes) {
-        cw.putU8(b);
-      }
-      cw.flush();
+    this._timed("patch_code", () => {
+      Memory.patchCode(this.target.address, this.target.size, code => {
+        const cw = new X86Writer(code, { pc: this.target.address });
+        for (let b of this.target_bytes) {
+          cw.putU8(b);
+        }
+        cw.flush();
+      });
     });
     return true;
   }
@@ -139,5 +152,5 @@ const X86_32_OP = {FMUL_DWORDPTR_EAX: [0xD8, 0x08],               // > -
 var {{ name }}_patch = new JmpPatch("{{ name }}", "{{ module_name }}",
                                     "{{ target_pattern }}", {{ vars_spec }}, {{ relocate_target }},
                                     {{ patch_mem_size }}, {{ return_offset }},
-                                    (cw, vars) => { {{ cw_patch_func }}});
+                                    (cw, vars) => { {{ cw_patch_func }}}, {{ patch_memory }});
 {% endblock patch_constructor %}
@@ -30,10 +30,12 @@ class NopPatch extends Patch {
     }
 
     // TODO: make a codewriter from nop_offset and write nop_length nops to it
-    Memory.patchCode(this.target.address.add(this.nop_offset), this.target.size - this.nop_offset, code => {
-      const cw = new X86Writer(code, { pc: this.target.address.add(this.nop_offset)});
-      cw.putNopPadding(this.nop_length);
-      cw.flush();
+    this._timed("patch_code", () => {
+      Memory.patchCode(this.target.address.add(this.nop_offset), this.target.size - this.nop_offset, code => {
+        const cw = new X86Writer(code, { pc: this.target.address.add(this.nop_offset)});
+        cw.putNopPadding(this.nop_length);
+        cw.flush();
+      });
     });
     return true;
   }
@@ -41,12 +43,14 @@ class NopPatch extends Patch {
   clear() {
     // super.clear() // not cleared at Patch level as there is just a blank filler func there atm
     _log_debug("NopPatch '" + this.name + "' is clearing patch by restoring original bytes at target site...")
-    Memory.patchCode(this.target.address, this.target.size, code => {
-      const cw = new X86Writer(code, { pc: this.target.address });
-      for (let b of this.target_bytes) {
-        cw.putU8(b);
-      }
-      cw.flush();
+    this._timed("patch_code", () => {
+      Memory.patchCode(this.target.address, this.target.size, code => {
+        const cw = new X86Writer(code, { pc: this.target.address });
+        for (let b of this.target_bytes) {
+          cw.putU8(b);
+        }
+        cw.flush();
+      });
     });
     return true;
   }
@@ -17,6 +17,9 @@ function _log_error(message) {
   console.error(message);
 }
 
+// high resolution clock for stage timings, if the runtime has one
+const _now = (typeof performance !== "undefined") ? () => performance.now() : () => Date.now();
+
 
 class Patch {
   constructor(name, module_name, target_pattern, vars_spec) {
@@ -26,10 +29,16 @@ class Patch {
     this.module_name = module_name;
     // the pattern for Memory.scanSync
     this.target_pattern = target_pattern;
+    // the module-relative offset of the target from a patch plan, if there is one (set after construction)
+    this.target_offset = null;
     // the spec for the vars that the patch should init/allocate memory for and then pass into the constructor defined
     // patch function writer xD
     this.vars_spec = vars_spec;
 
+    // stage timings (ms): load_timings from construction, timings from the current apply/clear call
+    this.load_timings = {};
+    this.timings = {};
+
     // init to starting values
     this.is_setup = false;
     this.target = null;
@@ -37,11 +46,24 @@ class Patch {
 
     // setup patch vars from vars_spec
     this.vars = new Map();
-    for (let v of this.vars_spec) {
-      var vmem = Memory.alloc(v.size);
-      _log_debug("Patch '" + this.name + "' init allocated " + v.size + " bytes for '" + v.name + "' @ " + vmem);
-      this.vars.set(v.name, { mem: vmem, type: v.type, size: v.size, default: v.default });
-      this.writePatchVar(v.name, v.default);
+    this._timed("alloc_vars", () => {
+      for (let v of this.vars_spec) {
+        // use the var memory pooled by the session allocator, if it provided some
+        var vmem = (v.mem !== undefined) ? ptr(v.mem) : Memory.alloc(v.size);
+        _log_debug("Patch '" + this.name + "' init using " + v.size + " bytes for '" + v.name + "' @ " + vmem);
+        this.vars.set(v.name, { mem: vmem, type: v.type, size: v.size, default: v.default });
+        this.writePatchVar(v.name, v.default);
+      }
+    }, this.load_timings);
+  }
+
+  _timed(stage, fn, timings = this.timings) {
+    // run fn, adding the time it took to timings[stage]
+    const t0 = _now();
+    try {
+      return fn();
+    } finally {
+      timings[stage] = (timings[stage] || 0) + (_now() - t0);
     }
   }
 
@@ -68,7 +90,21 @@ class Patch {
 
   _find() {
     var m = Process.getModuleByName(this.module_name);
-    var hits = Memory.scanSync(m.base, m.size, this.target_pattern);
+    if (this.target_offset !== null) {
+      // a patch plan resolved the target offline, verify the pattern in place instead of scanning the whole module
+      var planned_address = m.base.add(this.target_offset);
+      var pattern_length = this.target_pattern.trim().split(/\s+/).length;
+      var planned_hits = this._timed("scan", () => Memory.scanSync(planned_address, pattern_length,
+                                                                    this.target_pattern));
+      if (planned_hits.length == 1) {
+        _log_info("Patch '" + this.name + "', verified planned target for '" + this.target_pattern + "' @ " +
+                  planned_address);
+        return planned_hits[0];
+      }
+      _log_warn("Patch '" + this.name + "', planned target @ " + planned_address + " doesn't match '" +
+                this.target_pattern + "', falling back to scanning the module");
+    }
+    var hits = this._timed("scan", () => Memory.scanSync(m.base, m.size, this.target_pattern));
     if (hits.length == 0) {
       _log_error("Patch '" + this.name + "', searching for '" + this.target_pattern + "', matched nothing");
       return null;
@@ -85,7 +121,7 @@ class Patch {
 
   setup() {
     _log_info("Setting up patch '" + this.name + "'...");
-    var target = this._find();
+    var target = this._timed("find", () => this._find());
     if (target === null) {
       // failed to find target, setup failed, ret false;
       _log_error("Patch '" + this.name + "' failed to find target pattern '" + this.target_pattern + "' :/")
@@ -146,11 +182,25 @@ function _putPointer(cw, var_pointer) {
 }
 
 {% block patch_constructor %}{% endblock patch_constructor %}
+{{ name }}_patch.target_offset = {{ target_offset }};
+
+function _timedCall(patch, op) {
+  // run patch.apply/clear, returning the result along with the stage timings of the call
+  patch.timings = {};
+  const t0 = _now();
+  const result = patch[op]();
+  patch.timings.total = _now() - t0;
+  return { result: result, timings: patch.timings };
+}
 
 rpc.exports.apply = function () {
-    return {{ name }}_patch.apply();
+    return _timedCall({{ name }}_patch, "apply");
 }
 
 rpc.exports.clear = function () {
-    return {{ name }}_patch.clear();
+    return _timedCall({{ name }}_patch, "clear");
+}
+
+rpc.exports.loadTimings = function () {
+    return {{ name }}_patch.load_timings;
 }
@@ -12,6 +12,8 @@ from loguru import logger
 
 from .session import FAsyncSession
 from .exceptions import FridAsyncException
+from .hotreload import prime_fridajs_sources, reload_changed_sources
+from .scheduler import Scheduler
 
 
 class FridAsync:
@@ -21,10 +23,14 @@ class FridAsync:
         """Initialise a container for active FAsyncSession sessions."""
         # self._sessions_lock = trio.Lock()
         self.sessions: dict[str, FAsyncSession] = {}
+        # background jobs that aren't tied to one session, see serve
+        self.scheduler = Scheduler("fridasync")
+        self._nursery: trio.Nursery = None
 
     def _session_detached(self, target, *args):
         logger.debug(f"Session for '{target}' detached because: {args}")
         s = self.sessions.pop(target)
+        s.set_detached()
 
     async def create_session(self, target: str) -> Union[FAsyncSession, None]:
         """Create a FAsyncSession with frida.attach(target)."""
@@ -38,7 +44,48 @@ class FridAsync:
             fsession.on("detached", pf)
             self.sessions[target] = session
             await self.sessions[target].init()
+            if self._nursery is not None:
+                self._nursery.start_soon(session.scheduler.serve, name=f"{session.scheduler}")
             return self.sessions[target]
         except frida.ProcessNotFoundError as e:
             logger.error(f"frida: {e}")
             raise e
+
+    async def serve(self, task_status=trio.TASK_STATUS_IGNORED):
+        """Run the fridasync scheduler, and the scheduler of each session once it is created, until cancelled."""
+        try:
+            async with trio.open_nursery() as nursery:
+                self._nursery = nursery
+                await nursery.start(self.scheduler.serve, name=f"{self.scheduler}")
+                for session in self.sessions.values():
+                    nursery.start_soon(session.scheduler.serve, name=f"{session.scheduler}")
+                task_status.started()
+        finally:
+            self._nursery = None
+
+    async def hot_reload(self, poll_interval: float = 0.5):
+        """Watch the fridajs sources and hot-reload changed scripts into all active sessions."""
+        await prime_fridajs_sources()
+        # a broken edit fails the job rather than the watcher, fix the source and it is retried on the next poll
+        self.scheduler.every("hot_reload", lambda: reload_changed_sources(self.sessions.values()),
+                             poll_interval, delay=poll_interval, max_backoff=5)
+
+    async def _drain_all_captures(self, on_records):
+        for session in list(self.sessions.values()):
+            for capture in list(session.captures.values()):
+                try:
+                    records = await capture.drain()
+                except frida.InvalidOperationError as e:
+                    # the session detached (e.g. the game exited) between listing and draining
+                    logger.warning(f"Can't drain capture '{capture.name}': {e}")
+                    continue
+                if len(records) and on_records:
+                    await on_records(session, capture, records)
+
+    def drain_captures(self, interval: float = 0.5, on_records=None):
+        """Drain the captures of all active sessions every interval seconds, passing non-empty batches to on_records.
+
+        on_records is an async callable taking (session, capture, records).
+        """
+        self.scheduler.every("drain_captures", functools.partial(self._drain_all_captures, on_records),
+                             interval, delay=interval, timeout=max(10 * interval, 5))
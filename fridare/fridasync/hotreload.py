@@ -0,0 +1,61 @@
+"""Watches fridajs sources and hot-reloads changed scripts into live FAsyncSessions."""
+import pathlib
+
+import trio
+
+from loguru import logger
+
+from . import PKG_DIR, fridajs_sources, jinja_fridajs_env
+from .exceptions import FridAsyncException
+from .sources import find_dependent_templates
+
+
+UTILS_JS_PATH = pathlib.Path(PKG_DIR / "_fridasync.js")
+
+
+def _watched_paths() -> list[pathlib.Path]:
+    """Return the fridajs source files to watch: the utils script and every template."""
+    templates_dir = jinja_fridajs_env.loader.searchpath
+    return [UTILS_JS_PATH, *(templates_dir / name for name in jinja_fridajs_env.list_templates())]
+
+
+async def reload_changed_sources(sessions) -> list[pathlib.Path]:
+    """Revalidate cached fridajs sources and swap any changed scripts in sessions, returning the changed paths.
+
+    A change that fails to reload in any session is kept pending, so the next poll retries it, and raises
+    FridAsyncException once every session has been tried.
+    """
+    changed = await trio.to_thread.run_sync(fridajs_sources.refresh_all, _watched_paths())
+    if not changed:
+        return changed
+    logger.info(f"fridajs sources changed: {', '.join(p.name for p in changed)}")
+    t0 = trio.current_time()
+    templates = find_dependent_templates(jinja_fridajs_env, {p.name for p in changed if p != UTILS_JS_PATH})
+    failed: set[pathlib.Path] = set()
+    for session in list(sessions):
+        if UTILS_JS_PATH in changed:
+            try:
+                await session.reload_utils_script()
+            except Exception as e:
+                logger.opt(exception=e).error(f"Failed to hot-reload _fridasync.js in '{session}': {e}")
+                failed.add(UTILS_JS_PATH)
+        if templates:
+            expected = sum(p.template_name in templates for p in session.patches.values())
+            reloaded = await session.reload_patches(templates)
+            for patch in reloaded:
+                logger.success(f"Hot-reloaded '{patch.name}' in '{session}' [applied:{patch.applied}]")
+            if len(reloaded) < expected:
+                failed.update(p for p in changed if p != UTILS_JS_PATH)
+    logger.info(f"Hot reload finished in {(trio.current_time() - t0) * 1000:.0f} ms")
+    if failed:
+        for path in failed:
+            fridajs_sources.invalidate(path)
+        raise FridAsyncException(f"Failed to hot-reload {', '.join(sorted(p.name for p in failed))}, "
+                                 f"retrying on the next poll")
+    return changed
+
+
+async def prime_fridajs_sources():
+    """Cache the fridajs sources as they are now, so the first poll of reload_changed_sources finds no changes."""
+    logger.info(f"Watching fridajs sources in '{jinja_fridajs_env.loader.searchpath}' for changes...")
+    await trio.to_thread.run_sync(fridajs_sources.refresh_all, _watched_paths())
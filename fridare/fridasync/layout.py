@@ -0,0 +1,295 @@
+"""Compiles struct layouts declared in python into agent side readers that return whole object graphs in one rpc.
+
+A Struct is read with a single copy of its bytes, then each Pointer field is followed and its target struct read
+into its own region of the same blob. The blob layout is fixed at compile time, so it decodes straight into a
+nested NumPy structured dtype: inline fields keep their struct offsets, a pointer field's raw value is kept as
+'<name>_ptr' and the struct it points to is '<name>', whose '_valid' byte is 0 if the pointer was null or bad.
+"""
+import dataclasses
+import hashlib
+import weakref
+from typing import Optional, Union
+
+import frida
+import numpy as np
+import trio
+
+from loguru import logger
+
+from .capture import CAPTURE_TYPES
+from .exceptions import FridAsyncException
+
+
+@dataclasses.dataclass(eq=False)
+class Struct:
+    """A struct layout: fields at offsets, size defaults to the end of the last field."""
+
+    name: str
+    fields: list["Field"]
+    size: Optional[int] = None
+
+
+@dataclasses.dataclass(eq=False)
+class Pointer:
+    """A pointer to a Struct (or to a single primitive value, e.g. Pointer("float"))."""
+
+    target: Union[Struct, str]
+
+
+@dataclasses.dataclass(eq=False)
+class Array:
+    """A fixed length inline array of a primitive, Struct or Pointer, stride defaults to the element size."""
+
+    element: Union[str, Struct, Pointer]
+    count: int
+    stride: Optional[int] = None
+
+
+@dataclasses.dataclass(eq=False)
+class Field:
+    """A struct field: a primitive type name (see CAPTURE_TYPES, or 'pointer'), Struct (inline), Pointer or Array."""
+
+    name: str
+    type: Union[str, Struct, Pointer, Array]
+    offset: int
+
+
+@dataclasses.dataclass
+class Chain:
+    """A pointer chain from a module static: address = module + offset, then address = [address] + hop per hop."""
+
+    module_name: str
+    offset: int
+    hops: list[int] = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass
+class CompiledLayout:
+    """A struct compiled into an agent reader body and the dtype of the blob it produces."""
+
+    name: str
+    dtype: np.dtype
+    valid_offset: int
+    source: str
+
+    @property
+    def size(self) -> int:
+        """Return the size of one read of the struct in the blob."""
+        return self.dtype.itemsize
+
+    @property
+    def key(self) -> str:
+        """Return the name the reader is defined under in the agent, unique to the compiled reader and dtype."""
+        digest = hashlib.blake2b(f"{self.source}\n{self.dtype.descr}\n{self.valid_offset}".encode("utf8"),
+                                 digest_size=6).hexdigest()
+        return f"{self.name}@{digest}"
+
+
+class LayoutCompiler:
+    """Compiles Structs into CompiledLayouts for a target process with pointer_size."""
+
+    def __init__(self, pointer_size: int):
+        """Initialise a LayoutCompiler for a target process with pointer_size."""
+        self.pointer_size = pointer_size
+        # id(struct) -> (struct, region dtype, js function name) of the structs compiled so far
+        self._regions: dict[int, tuple[Struct, np.dtype, str]] = {}
+        self._sources: list[str] = []
+
+    def _primitive(self, type_name: str) -> tuple[str, int]:
+        """Return (numpy dtype, size) of primitive type_name."""
+        if type_name == "pointer":
+            return f"<u{self.pointer_size}", self.pointer_size
+        if type_name not in CAPTURE_TYPES:
+            raise FridAsyncException(f"Unknown layout type '{type_name}', expected a Struct, Pointer, Array or "
+                                     f"one of {', '.join([*CAPTURE_TYPES, 'pointer'])}")
+        return CAPTURE_TYPES[type_name]
+
+    def span(self, struct: Struct) -> int:
+        """Return the number of bytes of struct that are copied in one read."""
+        if struct.size is not None:
+            return struct.size
+        return max((f.offset + self.inline_size(f.type) for f in struct.fields), default=0)
+
+    def inline_size(self, t) -> int:
+        """Return the size of type t inside a struct."""
+        if isinstance(t, str):
+            return self._primitive(t)[1]
+        elif isinstance(t, Struct):
+            return self.span(t)
+        elif isinstance(t, Pointer):
+            return self.pointer_size
+        elif isinstance(t, Array):
+            return t.count * self._stride(t)
+        raise FridAsyncException(f"Unknown layout type {t!r}")
+
+    def _stride(self, array: Array) -> int:
+        size = self.inline_size(array.element)
+        if array.stride is None or array.stride == size:
+            return size
+        if not isinstance(array.element, Struct):
+            raise FridAsyncException(f"Array stride {array.stride} != element size {size}, only Struct arrays can "
+                                     f"have padding between elements")
+        return array.stride
+
+    def raw_dtype(self, struct: Struct, itemsize: int = None) -> np.dtype:
+        """Return the dtype of the bytes of struct as copied, with pointers as '<name>_ptr' integers."""
+        fields = []
+        for f in struct.fields:
+            t = f.type
+            if isinstance(t, str):
+                fields.append((f.name, self._primitive(t)[0], f.offset))
+            elif isinstance(t, Struct):
+                fields.append((f.name, self.raw_dtype(t), f.offset))
+            elif isinstance(t, Pointer):
+                fields.append((f"{f.name}_ptr", f"<u{self.pointer_size}", f.offset))
+            elif isinstance(t, Array) and isinstance(t.element, str):
+                fields.append((f.name, (self._primitive(t.element)[0], (t.count,)), f.offset))
+            elif isinstance(t, Array) and isinstance(t.element, Struct):
+                fields.append((f.name, (self.raw_dtype(t.element, self._stride(t)), (t.count,)), f.offset))
+            elif isinstance(t, Array):
+                fields.append((f"{f.name}_ptr", (f"<u{self.pointer_size}", (t.count,)), f.offset))
+        return self._dtype(fields, itemsize if itemsize else self.span(struct))
+
+    @staticmethod
+    def _dtype(fields: list[tuple], itemsize: int) -> np.dtype:
+        """Return a dtype of (name, format, offset) fields."""
+        return np.dtype({"names": [f[0] for f in fields], "formats": [f[1] for f in fields],
+                         "offsets": [f[2] for f in fields], "itemsize": itemsize})
+
+    def _pointers(self, struct: Struct, base: int = 0, prefix: str = ""):
+        """Yield (name, raw offset, target Struct, count, stride) of every pointer followed from struct's bytes."""
+        for f in struct.fields:
+            t, name, offset = f.type, f"{prefix}{f.name}", base + f.offset
+            if isinstance(t, Pointer):
+                yield name, offset, self._target(t), 1, self.pointer_size
+            elif isinstance(t, Struct):
+                yield from self._pointers(t, offset, f"{name}.")
+            elif isinstance(t, Array) and isinstance(t.element, Pointer):
+                yield name, offset, self._target(t.element), t.count, self.pointer_size
+            elif isinstance(t, Array) and isinstance(t.element, Struct) and any(self._pointers(t.element)):
+                raise FridAsyncException(f"Field '{name}' is an array of structs containing pointers, "
+                                         f"declare it as an array of pointers or flatten it")
+
+    @staticmethod
+    def _target(pointer: Pointer) -> Struct:
+        """Return the Struct a pointer points to, wrapping a primitive in a single 'value' field struct."""
+        if isinstance(pointer.target, str):
+            return Struct(pointer.target, [Field("value", pointer.target, 0)])
+        return pointer.target
+
+    def _region(self, struct: Struct, stack: tuple = ()) -> tuple[np.dtype, str]:
+        """Return (dtype, js function) of struct's region: its bytes, _valid, then the regions of its pointers."""
+        if id(struct) in self._regions:
+            return self._regions[id(struct)][1:]
+        if any(s is struct for s in stack):
+            raise FridAsyncException(f"Struct '{struct.name}' points to itself through "
+                                     f"{' -> '.join(s.name for s in (*stack, struct))}, layouts must be acyclic")
+        stack = (*stack, struct)
+        raw = self.raw_dtype(struct)
+        span = raw.itemsize
+        fields = [(name, *raw.fields[name][:2]) for name in raw.names]
+        fields.append(("_valid", "<u1", span))
+        cursor = span + 1
+        index = len(self._sources)
+        function = f"r{index}"
+        self._sources.append("")
+        body = [f"function {function}(a, o) {{",
+                f"  try {{ copy(u8, a, o, {span}); }} catch (e) {{ return; }}",
+                f"  u8[o + {span}] = 1;"]
+        for name, offset, target, count, stride in self._pointers(struct):
+            if len(body) == 3:
+                body.append("  let p;")
+            target_dtype, target_function = self._region(target, stack)
+            read_target = f"if (!p.isNull()) {target_function}(p, o + {cursor}"
+            if count == 1:
+                fields.append((name, target_dtype, cursor))
+                body.append(f"  p = a.add({offset}).readPointer(); {read_target});")
+            else:
+                fields.append((name, (target_dtype, (count,)), cursor))
+                body.append(f"  for (let i = 0; i < {count}; i++) {{ p = a.add({offset} + i * {stride}).readPointer(); "
+                            f"{read_target} + i * {target_dtype.itemsize}); }}")
+            cursor += count * target_dtype.itemsize
+        body.append("}")
+        self._sources[index] = "\n".join(body)
+        dtype = self._dtype(fields, cursor)
+        self._regions[id(struct)] = (struct, dtype, function)
+        return dtype, function
+
+    def compile(self, struct: Struct) -> CompiledLayout:
+        """Compile struct (and everything reachable from it) into a CompiledLayout."""
+        self._regions, self._sources = {}, []
+        dtype, function = self._region(struct)
+        source = "\n".join([*self._sources, f"return {function}(a, o);"])
+        return CompiledLayout(struct.name, dtype, self.raw_dtype(struct).itemsize, source)
+
+
+def to_python(value):
+    """Convert a decoded layout record into python: dicts for structs, lists for arrays, None for unread regions."""
+    if isinstance(value, np.void) and value.dtype.names:
+        if "_valid" in value.dtype.names and not value["_valid"]:
+            return None
+        return {name: to_python(value[name]) for name in value.dtype.names if name != "_valid"}
+    if isinstance(value, np.ndarray):
+        return [to_python(v) for v in value]
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class FAsyncLayoutReader:
+    """Wraps the _fridasync_layout.js script of a session, defining compiled layouts on first use."""
+
+    def __init__(self, script: frida.core.Script, pointer_size: int):
+        """Wrap the loaded _fridasync_layout.js frida.core.Script."""
+        self._script = script
+        self._compiler = LayoutCompiler(pointer_size)
+        # the layouts defined in the agent, by key
+        self.layouts: dict[str, CompiledLayout] = {}
+        # each Struct is compiled once, when first read (so don't change its fields after that)
+        self._compiled: weakref.WeakKeyDictionary[Struct, CompiledLayout] = weakref.WeakKeyDictionary()
+
+    async def define(self, struct: Struct) -> CompiledLayout:
+        """Compile struct and define its reader in the agent, if it isn't already.
+
+        Readers are defined by key rather than name, so Structs of the same name with different fields each get their
+        own reader and dtype.
+        """
+        layout = self._compiled.get(struct, None)
+        if layout is None:
+            layout = self._compiler.compile(struct)
+            if layout.key in self.layouts:
+                layout = self.layouts[layout.key]
+            else:
+                await trio.to_thread.run_sync(self._script.exports.define, layout.key, layout.size,
+                                              layout.valid_offset, layout.source)
+                self.layouts[layout.key] = layout
+                logger.debug(f"Defined layout '{layout.key}' [{layout.size} byte reads]")
+            self._compiled[struct] = layout
+        return layout
+
+    async def read(self, struct: Struct, address: str) -> np.void:
+        """Read the struct graph at address in one rpc."""
+        return (await self.read_many(struct, [address]))[0]
+
+    async def read_many(self, struct: Struct, addresses: list[str]) -> np.ndarray:
+        """Read the struct graph at each of addresses in one rpc."""
+        layout = await self.define(struct)
+        blob = await trio.to_thread.run_sync(self._script.exports.read, layout.key, addresses)
+        return np.frombuffer(blob, layout.dtype, count=len(addresses))
+
+    async def read_chain(self, struct: Struct, chain: Chain) -> np.void:
+        """Read the struct graph at the end of chain in one rpc, reusing cached chain prefixes."""
+        layout = await self.define(struct)
+        blob = await trio.to_thread.run_sync(self._script.exports.read_chain, layout.key, chain.module_name,
+                                             chain.offset, chain.hops)
+        return np.frombuffer(blob, layout.dtype, count=1)[0]
+
+    async def invalidate(self):
+        """Forget every cached chain prefix, e.g. after a level change frees the objects they point to."""
+        await trio.to_thread.run_sync(self._script.exports.invalidate)
+
+    async def set_prefix_ttl(self, ms: int):
+        """Set how long a resolved chain prefix is trusted before it is walked again."""
+        await trio.to_thread.run_sync(self._script.exports.set_prefix_ttl, ms)
+
+    def stats(self) -> dict:
+        """Return the agent side read and chain prefix cache counters."""
+        return self._script.exports.stats()
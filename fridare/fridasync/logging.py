@@ -1,4 +1,6 @@
 """Defines FRIDARE loguru logging levels, generic handlers, and logging proxy classes."""
+import random
+
 from loguru import logger
 # Configure additional logging levels for frida-raised logs
 FRIDAJS_DEBUG_LVL = logger.level("FDEBUG", no=11, color="<blue>", icon="👽‍")
@@ -11,25 +13,27 @@ FRIDAJS_ERROR_LVL = logger.level("FERROR", no=41, color="<red>", icon="💥")
 def generic_fridajs_log_handler(target, script_name, level, message):
     """Handle logs from fridajs logging via loguru emission."""
     _sctx = f"[{target}:{script_name}]"
+    # bind the context so that sinks (e.g. the log store) can index it without parsing the message
+    _logger = logger.bind(target=target, script=script_name)
     if level == "debug":
-        logger.log(FRIDAJS_DEBUG_LVL.name, f"{_sctx} {message}")
+        _logger.log(FRIDAJS_DEBUG_LVL.name, f"{_sctx} {message}")
     elif level == "info":
-        logger.log(FRIDAJS_INFO_LVL.name, f"{_sctx} {message}")
+        _logger.log(FRIDAJS_INFO_LVL.name, f"{_sctx} {message}")
     elif level == "warning":
-        logger.log(FRIDAJS_WARN_LVL.name, f"{_sctx} {message}")
+        _logger.log(FRIDAJS_WARN_LVL.name, f"{_sctx} {message}")
     elif level == "error":
-        logger.log(FRIDAJS_ERROR_LVL.name, f"{_sctx} {message}")
+        _logger.log(FRIDAJS_ERROR_LVL.name, f"{_sctx} {message}")
     elif level == "process_exception":
         # addr = message["address"]
-        logger.log(FRIDAJS_PROCEXC_LVL.name, f"{_sctx} {message}")
+        _logger.log(FRIDAJS_PROCEXC_LVL.name, f"{_sctx} {message}")
     else:
-        logger.error(f"_generic_log_handler didn't understand '{level}' level "
-                     f"with message: '{message}'")
+        _logger.error(f"_generic_log_handler didn't understand '{level}' level "
+                      f"with message: '{message}'")
 
 
 def generic_on_msg_log_handler(target, script_name, message, data):
     """Handle messages from fridajs via loguru info emission."""
-    logger.info(f"[{target}:{script_name}]: {message}, data: '{data}'")
+    logger.bind(target=target, script=script_name).info(f"[{target}:{script_name}]: {message}, data: '{data}'")
 
 
 # Configure additional logging levels for hypercorn logs
@@ -43,17 +47,55 @@ HYPERCORN_ERROR_LVL = logger.level("HERROR", no=42)
 HYPERCORN_CRIT_LVL = logger.level("HCRIT", no=51)
 
 
+# the scope key that the app puts the matched url rule in, so requests are aggregated by route rather than by path
+ROUTE_SCOPE_KEY = "fridare.route"
+
+
+def _content_length(response) -> int:
+    for name, value in response.get("headers", []):
+        if name.lower() == b"content-length":
+            return int(value)
+    return 0
+
+
 class LoguruHypercornProxy:
-    """Proxies hypercorn logging into FRIDARE loguru system."""
+    """Proxies hypercorn logging into FRIDARE loguru system.
+
+    Access logs are structured: the fields are bound to the record (for sinks like the log store) rather than only
+    formatted into the message. Only sample_rate of them are logged, but failed (status >= 400) and slow (slower
+    than slow_ms) requests always are. Every request is recorded in metrics (e.g. a fridare.metrics.RequestMetrics)
+    if one is given.
+    """
+
+    def __init__(self, s, metrics=None, sample_rate: float = 1.0, slow_ms: float = None):
+        """Initialise a LoguruHypercornProxy - set as hypercorn_cfg.logger_class and instantiated by hypercorn.
 
-    def __init__(self, s):
-        """Initialise a LoguruHypercornProxy - set as hypercorn_cfg.logger_class and instantiated by hypercorn."""
+        Use functools.partial to set the keyword arguments, hypercorn only passes its config.
+        """
         self._s = s
+        self._metrics = metrics
+        self._sample_rate = sample_rate
+        self._slow_ms = slow_ms
 
     async def access(self, request, response, request_time: float, *args, **kwargs):
         """Log on hypercorn access."""
-        msg = f"HYPERCORN ACCESS LOG:\n{request=}\n{response=}\n{request_time=}"
-        logger.log(HYPERCORN_ACCESS_LVL.name, msg, *args, *kwargs)
+        # a websocket that was closed before being accepted has no response
+        status = response.get("status", 0) if response else 101
+        ms = request_time * 1000
+        nbytes = _content_length(response) if response else 0
+        route = request.get(ROUTE_SCOPE_KEY, None) or "<unmatched>"
+        method = request.get("method", "WS")
+        if self._metrics is not None:
+            self._metrics.record(method, route, status, ms, nbytes)
+        if status < 400 and (self._slow_ms is None or ms < self._slow_ms) and random.random() >= self._sample_rate:
+            return
+        client = request.get("client", None)
+        fields = {"method": method, "path": request.get("path", ""), "route": route, "status": status,
+                  "duration_ms": round(ms, 2), "bytes": nbytes, "client": client[0] if client else None,
+                  "http_version": request.get("http_version", "")}
+        logger.bind(**fields).log(HYPERCORN_ACCESS_LVL.name,
+                                  f"{fields['client']} \"{method} {fields['path']} HTTP/{fields['http_version']}\" "
+                                  f"{status} {nbytes}B {ms:.1f}ms")
 
     async def critical(self, msg: str, *args, **kwargs):
         """Log on hypercorn critical."""
@@ -1,15 +1,25 @@
 """Defines stuff for the FRIDARE patching system."""
+import collections
 import dataclasses
+import time
 
 import frida
 import jinja2
+import trio
 
 from loguru import logger
 
 from . import jinja_fridajs_env
 # from . import jinja_fridajs_env, FAsyncSession
 # from .session import FAsyncSession
+from .allocator import AgentAllocator
+from .exceptions import FridAsyncException
 from .script import FAsyncScript
+from .utils import StageTimer
+
+
+# the number of apply/clear timings kept per patch
+PATCH_TIMING_HISTORY = 50
 
 
 @dataclasses.dataclass
@@ -22,6 +32,26 @@ class PatchVarSpec:
     default: str
 
 
+@dataclasses.dataclass
+class PatchTimings:
+    """Holds the host and agent side stage timings (ms) of a patch setup, apply or clear.
+
+    Host stages are wall clock time in fridasync (the rpc stage includes all of the agent's time), agent stages
+    are measured inside the patch script (nested stages like find/scan overlap).
+    """
+
+    op: str
+    result: bool
+    time: float
+    host_ms: dict[str, float]
+    agent_ms: dict[str, float]
+
+    @property
+    def total_ms(self) -> float:
+        """Return the total host side time of the op."""
+        return sum(self.host_ms.values())
+
+
 class FAsyncPatcherScript(FAsyncScript):
     """Extends FAsyncScript to wrap a script generated by a patch builder."""
 
@@ -29,6 +59,19 @@ class FAsyncPatcherScript(FAsyncScript):
         """Initialise a FAsyncPatcherScript."""
         super().__init__(name, source_js, script)
         self._applied = False
+        # set by the session so the patch can be regenerated when its template changes
+        self.template_name = None
+        self.gen_js = None
+        # set by the session when the patch memory is pooled by its allocator
+        self.allocator: AgentAllocator = None
+        self.module_name = None
+        self.code_size = 0
+        self.vars_spec: list[PatchVarSpec] = ()
+        self.code_address: str = None
+        self.var_addresses: dict[str, str] = {}
+        # set by the session once the script is loaded, then one entry per apply/clear
+        self.setup_timings: PatchTimings = None
+        self.timing_history: collections.deque[PatchTimings] = collections.deque(maxlen=PATCH_TIMING_HISTORY)
 
     @property
     def applied(self) -> bool:
@@ -39,47 +82,105 @@ class FAsyncPatcherScript(FAsyncScript):
         """Return str(self: FAsyncPatcherScript)."""
         return f"FAsyncPatcherScript({self.name=} [loaded:{self.loaded}, applied:{self.applied}]"
 
-    # TODO: should wrap the _script.export.{apply,clear} as partial function and then trio.run_in_thread
-    async def apply(self):
+    async def _timed_export(self, op: str) -> PatchTimings:
+        """Call the apply/clear rpc export in a bg thread, recording host and agent stage timings."""
+        timer = StageTimer()
+        with timer.stage("rpc"):
+            r = await trio.to_thread.run_sync(getattr(self._script.exports, op))
+        timings = PatchTimings(op, bool(r["result"]), time.time(), timer.stages, r["timings"])
+        self.timing_history.append(timings)
+        logger.debug(f"Patch '{self.name}' {op} took {timings.total_ms:.2f} ms [agent: {timings.agent_ms}]")
+        return timings
+
+    async def apply(self) -> PatchTimings:
         """Apply the patch, if not already applied."""
         if not self._applied:
             logger.debug(f"Applying '{self.name}' patch...")
-            self._script.exports.apply()
-            self._applied = True
+            timings = await self._timed_export("apply")
+            self._applied = timings.result
+            if not timings.result:
+                logger.error(f"Patch '{self.name}' failed to apply!")
+            return timings
         else:
             logger.error(f"Patch '{self.name}' is already applied!")
 
-    async def clear(self):
+    async def clear(self) -> PatchTimings:
         """Clear the patch, if applied."""
         if self._applied:
-            self._script.exports.clear()
-            self._applied = False
+            timings = await self._timed_export("clear")
+            self._applied = not timings.result
+            return timings
         else:
             logger.error(f"Can't clear patch '{self.name}' when it is not applied!")
 
+    async def unload(self):
+        """Clear the patch if applied, unload the script, then return all of its pooled memory to the allocator."""
+        if self._applied:
+            # clear first, the original bytes are only known to the script and the target must not jump into
+            # a code cave that is about to be freed
+            await self.clear()
+            if self._applied:
+                raise FridAsyncException(f"Can't unload patch '{self.name}', it failed to clear")
+        await super().unload()
+        await self.release_memory()
+
+    async def release_memory(self):
+        """Return all of the patch's pooled memory to the allocator, once the script is unloaded.
+
+        The code cave is kept for as long as the script lives, even while the patch is cleared: a game thread may
+        still be executing in it right after the jmp to it was removed.
+        """
+        if self.allocator:
+            if self.code_address is not None:
+                await self.allocator.free(self.code_address)
+                self.code_address = None
+            for address in self.var_addresses.values():
+                await self.allocator.free(address)
+            self.var_addresses = {}
+
+
+def _js_offset(offset) -> str:
+    """Return offset as a js literal for the patch templates."""
+    return "null" if offset is None else hex(offset)
+
 
 class PatchBuilder:
     """Generates patches from templates using jinja2."""
 
-    def __init__(self):
-        """Discover patch templates om fridajs jinja env."""
-        self._jmp_patch_template: jinja2.Template = jinja_fridajs_env.get_template("jmp_patch.js")
-        self._nop_patch_template: jinja2.Template = jinja_fridajs_env.get_template("nop_patch.js")
+    JMP_PATCH_TEMPLATE = "jmp_patch.js"
+    NOP_PATCH_TEMPLATE = "nop_patch.js"
+
+    # templates are looked up per build (jinja caches them) so that edited templates are picked up on reload
+    @property
+    def _jmp_patch_template(self) -> jinja2.Template:
+        return jinja_fridajs_env.get_template(self.JMP_PATCH_TEMPLATE)
+
+    @property
+    def _nop_patch_template(self) -> jinja2.Template:
+        return jinja_fridajs_env.get_template(self.NOP_PATCH_TEMPLATE)
 
     # TODO: no point async unless rendering can be pushed to another thread
     # async def create_jmp_patch_js(self, name: str, module_name: str, target_pattern: str,
     def gen_jmp_patch_js(self, name: str, module_name: str, target_pattern: str,
                          vars_spec: list[PatchVarSpec], relocate_target: bool,
                          patch_mem_size: int, return_offset: int,
-                         cw_patch_func: str):
-        """Build a jmp patch script."""
+                         cw_patch_func: str, target_offset: int = None,
+                         patch_memory: str = None, var_addresses: dict[str, str] = None):
+        """Build a jmp patch script, with the target pre-resolved to target_offset if given.
+
+        patch_memory and var_addresses place the patch code and vars in memory pooled by the session allocator,
+        otherwise the script allocates its own.
+        """
         _script_name = f"{name}_jmp_patch.js"
         logger.debug(f"Creating jmp patch: {name=} [{module_name=}] "
                      f"^ {target_pattern=}\n"
                      f"{vars_spec=}, {relocate_target=}, {patch_mem_size=}, {return_offset=}\n"
                      f"cw_patch_func={cw_patch_func}")
 
-        _vars = [f"{{name: '{v.name}', type: '{v.type}', size: {v.size }, default: {v.default} }}" for v in vars_spec]
+        var_addresses = var_addresses if var_addresses else {}
+        _vars = [f"{{name: '{v.name}', type: '{v.type}', size: {v.size }, default: {v.default}"
+                 + (f", mem: '{var_addresses[v.name]}'" if v.name in var_addresses else "") + " }"
+                 for v in vars_spec]
         vars_spec_list = f"[{', '.join(_vars)}]"
         rt = "true" if relocate_target else "false"
         jmp_patch_js = self._jmp_patch_template.render(name=name, module_name=module_name,
@@ -88,18 +189,21 @@ class PatchBuilder:
                                                        relocate_target=rt,
                                                        patch_mem_size=patch_mem_size,
                                                        return_offset=return_offset,
-                                                       cw_patch_func=cw_patch_func)
+                                                       cw_patch_func=cw_patch_func,
+                                                       target_offset=_js_offset(target_offset),
+                                                       patch_memory=f"'{patch_memory}'" if patch_memory else "null")
         return _script_name, jmp_patch_js
 
     def gen_nop_patch_js(self, name: str, module_name: str, target_pattern: str,
-                         nop_offset: int, nop_length: int):
-        """Build a nop patch script."""
+                         nop_offset: int, nop_length: int, target_offset: int = None):
+        """Build a nop patch script, with the target pre-resolved to target_offset if given."""
         _script_name = f"{name}_nop_patch.js"
         logger.debug(f"Creating nop patch: {name=} [{module_name}] "
                      f"^ {target_pattern=} [{nop_offset=}, {nop_length=}")
 
         nop_patch_js = self._nop_patch_template.render(name=name, module_name=module_name,
                                                        target_pattern=target_pattern,
-                                                       nop_offset=nop_offset, nop_length=nop_length)
+                                                       nop_offset=nop_offset, nop_length=nop_length,
+                                                       target_offset=_js_offset(target_offset))
 
         return _script_name, nop_patch_js
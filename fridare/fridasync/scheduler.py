@@ -0,0 +1,212 @@
+"""Runs periodic and one-shot background jobs in a supervised nursery, with jitter, timeouts, backoff and metrics."""
+import dataclasses
+import math
+import random
+from typing import Awaitable, Callable, Optional
+
+import trio
+
+from loguru import logger
+
+
+@dataclasses.dataclass
+class JobMetrics:
+    """Counters and timings of a job's runs, times in seconds."""
+
+    runs: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    # periodic ticks skipped because the previous run was still going when they came due
+    skipped: int = 0
+    consecutive_failures: int = 0
+    running: bool = False
+    last_run_time: float = 0.0
+    max_run_time: float = 0.0
+    total_run_time: float = 0.0
+    # how late a run started after the (jittered) time it was due
+    last_lag: float = 0.0
+    max_lag: float = 0.0
+    last_error: Optional[str] = None
+    next_due: Optional[float] = None
+
+    @property
+    def mean_run_time(self) -> float:
+        """Return the mean time of a run."""
+        return self.total_run_time / self.runs if self.runs else 0.0
+
+
+@dataclasses.dataclass
+class Job:
+    """A job run by a Scheduler: every interval seconds, or once after delay seconds if interval is None."""
+
+    name: str
+    func: Callable[[], Awaitable]
+    interval: Optional[float] = None
+    delay: float = 0.0
+    # a random extra delay of up to jitter seconds added to each run, so jobs started together don't stay in step
+    jitter: float = 0.0
+    # cancel a run that takes longer than timeout seconds, counting it as a failure
+    timeout: Optional[float] = None
+    # after n consecutive failures wait interval * 2 ** n (at most max_backoff) seconds before the next run
+    max_backoff: float = 60.0
+    # a failed one-shot job is retried (with the same backoff) up to retries times
+    retries: int = 0
+    metrics: JobMetrics = dataclasses.field(default_factory=JobMetrics)
+
+    @property
+    def periodic(self) -> bool:
+        """Return whether the job repeats."""
+        return self.interval is not None
+
+    def backoff(self) -> float:
+        """Return the wait before retrying after the current run of consecutive failures."""
+        base = self.interval if self.periodic else max(self.delay, 1.0)
+        return min(base * 2 ** self.metrics.consecutive_failures, self.max_backoff)
+
+
+class Scheduler:
+    """Supervises the background jobs of a FridAsync or FAsyncSession.
+
+    Jobs can be added at any time, they start when serve() is running (in its nursery) and are all cancelled when
+    close() is called or serve() is cancelled. A failing job is logged and backed off, it never takes down the
+    nursery. Periodic runs never overlap: a run that overruns its interval skips the ticks it missed.
+    """
+
+    def __init__(self, name: str):
+        """Initialise a Scheduler whose jobs are logged as belonging to name."""
+        self.name = name
+        self.jobs: dict[str, Job] = {}
+        self._cancel_scopes: dict[str, trio.CancelScope] = {}
+        self._nursery: Optional[trio.Nursery] = None
+        self._closed = False
+
+    def __str__(self) -> str:
+        """Return a string representation of the Scheduler."""
+        return f"Scheduler({self.name})"
+
+    @property
+    def serving(self) -> bool:
+        """Return whether serve() is running jobs."""
+        return self._nursery is not None
+
+    def every(self, name: str, func: Callable[[], Awaitable], interval: float, delay: float = 0.0,
+              jitter: float = 0.0, timeout: float = None, max_backoff: float = 60.0) -> Job:
+        """Run the async callable func every interval seconds (first after delay), replacing any job called name."""
+        return self.add(Job(name, func, interval, delay, jitter, timeout, max_backoff))
+
+    def once(self, name: str, func: Callable[[], Awaitable], delay: float = 0.0, timeout: float = None,
+             retries: int = 0) -> Job:
+        """Run the async callable func once after delay seconds, replacing any job called name."""
+        return self.add(Job(name, func, None, delay, timeout=timeout, retries=retries))
+
+    def add(self, job: Job) -> Job:
+        """Add job, cancelling any job with the same name, and start it if serve() is running."""
+        if self._closed:
+            raise trio.ClosedResourceError(f"{self} is closed, can't add job '{job.name}'")
+        self.cancel(job.name)
+        self.jobs[job.name] = job
+        if self._nursery is not None:
+            self._start(job)
+        return job
+
+    def cancel(self, name: str) -> bool:
+        """Cancel (and forget) the job called name."""
+        job = self.jobs.pop(name, None)
+        if (scope := self._cancel_scopes.pop(name, None)) is not None:
+            scope.cancel()
+        return job is not None
+
+    def close(self):
+        """Cancel every job and stop serve(), e.g. when the session the jobs belong to has detached."""
+        self._closed = True
+        for name in list(self.jobs):
+            self.cancel(name)
+        if self._nursery is not None:
+            self._nursery.cancel_scope.cancel()
+
+    def metrics(self) -> dict[str, dict]:
+        """Return {job name: metrics dict} of every job."""
+        return {name: {**dataclasses.asdict(job.metrics), "mean_run_time": job.metrics.mean_run_time,
+                       "interval": job.interval}
+                for name, job in self.jobs.items()}
+
+    async def serve(self, task_status=trio.TASK_STATUS_IGNORED):
+        """Run the jobs added so far and any added later, until close() is called or this task is cancelled."""
+        if self._closed:
+            task_status.started()
+            return
+        async with trio.open_nursery() as nursery:
+            self._nursery = nursery
+            for job in self.jobs.values():
+                self._start(job)
+            task_status.started()
+            try:
+                await trio.sleep_forever()
+            finally:
+                self._nursery = None
+        logger.debug(f"{self} stopped")
+
+    def _start(self, job: Job):
+        scope = trio.CancelScope()
+        self._cancel_scopes[job.name] = scope
+        self._nursery.start_soon(self._run_job, job, scope, name=f"{self}:{job.name}")
+
+    async def _run_job(self, job: Job, scope: trio.CancelScope):
+        """Run job's schedule, due times are kept on a fixed grid so runs don't drift by their own duration."""
+        with scope:
+            due = trio.current_time() + job.delay
+            while True:
+                job.metrics.next_due = due
+                start_at = due + random.uniform(0, job.jitter)
+                await trio.sleep_until(start_at)
+                ok = await self._run_once(job, start_at)
+                now = trio.current_time()
+                if not ok and (job.periodic or job.metrics.consecutive_failures <= job.retries):
+                    due = now + job.backoff()
+                    logger.warning(f"[{self.name}] Job '{job.name}' failed {job.metrics.consecutive_failures} "
+                                   f"time(s) in a row, next run in {due - now:.1f}s")
+                elif job.periodic:
+                    due += job.interval
+                    if due < now:
+                        missed = math.ceil((now - due) / job.interval)
+                        job.metrics.skipped += missed
+                        due += missed * job.interval
+                else:
+                    break
+        job.metrics.next_due = None
+        # a finished one-shot job is forgotten, unless it has already been replaced by a job of the same name
+        if self.jobs.get(job.name, None) is job and not scope.cancel_called:
+            self.jobs.pop(job.name)
+            self._cancel_scopes.pop(job.name, None)
+
+    async def _run_once(self, job: Job, start_at: float) -> bool:
+        """Run job once with its timeout, recording metrics, returning whether it succeeded."""
+        m = job.metrics
+        start = trio.current_time()
+        m.last_lag = start - start_at
+        m.max_lag = max(m.max_lag, m.last_lag)
+        m.running = True
+        ok = False
+        try:
+            with trio.move_on_after(job.timeout if job.timeout is not None else math.inf) as timeout_scope:
+                await job.func()
+                ok = True
+            if timeout_scope.cancelled_caught:
+                m.timeouts += 1
+                m.last_error = f"timed out after {job.timeout}s"
+                logger.error(f"[{self.name}] Job '{job.name}' timed out after {job.timeout}s")
+        except Exception as e:
+            m.last_error = f"{type(e).__name__}: {e}"
+            logger.opt(exception=e).error(f"[{self.name}] Job '{job.name}' failed: {m.last_error}")
+        finally:
+            m.running = False
+            m.runs += 1
+            m.last_run_time = trio.current_time() - start
+            m.max_run_time = max(m.max_run_time, m.last_run_time)
+            m.total_run_time += m.last_run_time
+        if ok:
+            m.consecutive_failures = 0
+        else:
+            m.failures += 1
+            m.consecutive_failures += 1
+        return ok
@@ -14,6 +14,9 @@ class FAsyncScript:
         self._source_js = source_js
         self._script = script
         self._loaded = False
+        self._unloaded = False
+        # (signal, callback) of every handler bound with on(), so unload can unbind them
+        self._handlers: list[tuple[str, object]] = []
 
     def __str__(self):
         """Return str(self: FAsyncScript)."""
@@ -34,6 +37,16 @@ class FAsyncScript:
         """Return whether the script is loaded inside the session it exists within."""
         return self._loaded
 
+    @property
+    def unloaded(self):
+        """Return whether the script has been unloaded from its session, after which it can't be loaded again."""
+        return self._unloaded
+
+    @property
+    def exports(self):
+        """Return the rpc exports of the wrapped frida.core.Script, whose calls are sync: run them in a bg thread."""
+        return self._script.exports
+
     def set_log_handler(self, handler_func):
         """Set the `sync` (atm?) handler func that will be used as the frida.core.Script log handler."""
         self._script.set_log_handler(handler_func)
@@ -41,6 +54,7 @@ class FAsyncScript:
     def on(self, signal: str, callback):
         """Bind the frida.core.Script signal to the `sync` (atm?) callback function."""
         self._script.on(signal, callback)
+        self._handlers.append((signal, callback))
 
     async def load(self):
         """Await loading of the wrapped frida.core.Script async in bg thread."""
@@ -48,3 +62,21 @@ class FAsyncScript:
         await trio.to_thread.run_sync(self._script.load)
         self._loaded = True
         logger.debug(f"Loaded script '{self.name=}'")
+
+    async def unload(self):
+        """Await unloading of the wrapped frida.core.Script async in bg thread, unbinding its handlers."""
+        if self._unloaded:
+            return
+        logger.debug(f"Unloading script '{self.name=}'...")
+        try:
+            await trio.to_thread.run_sync(self._script.unload)
+        except frida.InvalidOperationError as e:
+            # the script is already destroyed, e.g. the session detached
+            logger.warning(f"Script '{self.name}' could not be unloaded: {e}")
+        # the handlers (and whatever they close over) would otherwise live as long as the frida.core.Script
+        for signal, callback in self._handlers:
+            self._script.off(signal, callback)
+        self._handlers = []
+        self._script.set_log_handler(self._script.default_log_handler)
+        self._loaded, self._unloaded = False, True
+        logger.debug(f"Unloaded script '{self.name=}'")
@@ -1,16 +1,28 @@
 """Wraps frida.core.Session in some async sorcery."""
+import contextlib
 import functools
+import time
+from typing import Optional
 
+import numpy as np
 import trio
 import frida
 
 from loguru import logger
 
 from . import PKG_DIR
+from .exceptions import FridAsyncException
+from .allocator import AgentAllocator, CODE, DATA
+from .capture import FAsyncCaptureScript, CaptureBuilder, CaptureSpec
+from .layout import FAsyncLayoutReader, Struct, Chain
 from .logging import generic_fridajs_log_handler, generic_on_msg_log_handler
+from .scheduler import Scheduler
 from .script import FAsyncScript
-from .patcher import FAsyncPatcherScript, PatchBuilder, PatchVarSpec
-from .utils import load_js_from_file
+from .patcher import FAsyncPatcherScript, PatchBuilder, PatchVarSpec, PatchTimings
+from .signatures import PatchPlan
+from .sigindex import SignatureIndex
+from .watch import FAsyncWatcher
+from .utils import load_js_from_file, StageTimer
 
 
 class FAsyncSessionFoundation:
@@ -22,6 +34,11 @@ class FAsyncSessionFoundation:
         self._session = session
 
         self.scripts = {}
+        # frida callbacks run in frida's threads, they hand events back into trio with this token
+        self._trio_token = trio.lowlevel.current_trio_token()
+        self.detached = trio.Event()
+        # background jobs of the session, cancelled when it detaches
+        self.scheduler = Scheduler(target)
 
         self._utils_script, self._init_complete = None, False
         self._frida_version, self._frida_script_runtime = None, None
@@ -109,25 +126,58 @@ class FAsyncSessionFoundation:
             logger.error(f"[{_sctx}] frida: {e}")
             return False
 
+    async def _load_internal_js_script(self, filename: str, on_message=None) -> frida.core.Script:
+        """Create and load one of the fridasync package's own js scripts into the wrapped frida.core.Session."""
+        # Calculate the path for the script and async load it
+        js_path = PKG_DIR / filename
+        logger.debug(f"Loading {filename} script from file...")
+        js = await load_js_from_file(js_path)
+        logger.success(f"Loaded {filename}")
+        # Create a partial function that sets the kw args for frida.Session.create_script
+        pf = functools.partial(self._session.create_script, name=filename, source=js)
+        logger.debug(f"Creating {filename} script in '{self}'...")
+        script: frida.core.Script = await trio.to_thread.run_sync(pf)
+        logger.success(f"Created {filename} script in '{self}'")
+        log_pf = functools.partial(generic_fridajs_log_handler, self.target, filename)
+        script.set_log_handler(log_pf)
+        if on_message:
+            script.on("message", on_message)
+        logger.debug(f"Loading {filename} script in '{self}'...")
+        try:
+            await trio.to_thread.run_sync(script.load)
+        except Exception:
+            # e.g. an edited script that throws while it loads, it mustn't be left behind in the session
+            with contextlib.suppress(frida.InvalidOperationError):
+                await trio.to_thread.run_sync(script.unload)
+            raise
+        logger.success(f"Loaded {filename} script in '{self}'")
+        return script
+
     async def _load_utils_js_script(self):
         """Load the _fridasync.js utils script into the wrapped frida.core.Session."""
-        # Calculate the path for _fridasync.js and async load it
-        fa_utils_js_path = PKG_DIR / "_fridasync.js"
-        logger.debug(f"Loading _fridasync.js script from file...")
-        fridasync_utils_js = await load_js_from_file(fa_utils_js_path)
-        logger.success(f"Loaded _fridasync.js")
-        # Create a partial function that sets the kw args for frida.Session.create_script
-        pf = functools.partial(self._session.create_script, name="_fridasync.js", source=fridasync_utils_js)
-        logger.debug(f"Creating _fridasync.js script in '{self}'...")
-        self._utils_script: frida.core.Script = await trio.to_thread.run_sync(pf)
-        logger.success(f"Created _fridasync.js script in '{self}'")
-        # self._utils_script.set_log_handler(self._utils_log_handler)
-        log_pf = functools.partial(generic_fridajs_log_handler, self.target, "_fridasync.js")
-        self._utils_script.set_log_handler(log_pf)
-        # self._utils_script.on("message", self._utils_on_msg)
-        logger.debug(f"Loading _fridasync.js script in '{self}'...")
-        await trio.to_thread.run_sync(self._utils_script.load)
-        logger.success(f"Loaded _fridasync.js script in '{self}'")
+        self._utils_script = await self._load_internal_js_script("_fridasync.js")
+
+    async def reload_utils_script(self):
+        """Load the _fridasync.js utils script again from (possibly edited) source and swap it in.
+
+        The new script is loaded alongside the old one, which is only unloaded once the new one has loaded: if it
+        fails to, the old one is kept.
+        """
+        new_script = await self._load_internal_js_script("_fridasync.js")
+        old_script, self._utils_script = self._utils_script, new_script
+        logger.debug(f"Unloading the old _fridasync.js script in '{self}'...")
+        try:
+            await trio.to_thread.run_sync(old_script.unload)
+        except frida.InvalidOperationError as e:
+            logger.warning(f"Old _fridasync.js script in '{self}' was already unloaded: {e}")
+
+    def set_detached(self):
+        """Mark the session detached (from any thread), cancelling its jobs and waking everything waiting on it."""
+        self._trio_token.run_sync_soon(self._on_detached)
+
+    def _on_detached(self):
+        self.scheduler.close()
+        self.detached.set()
 
     def _set_frida_session_static_info_properties(self):
         """Set frida session static info properties by running _fridasync.js rpc exports once."""
@@ -154,12 +204,25 @@ class FAsyncSessionFoundation:
         self._init_complete = True
         logger.debug(f"Initialised FAsyncSession(target={self.target}) [{self._pretty_frida_session_info()}]")
 
-    async def create_script(self, name: str, source_js: str, script_class=FAsyncScript, *args, **kwargs):
-        """Create a FAsyncScript (or subclass script_class) within the wrapped frida.core.Session."""
+    async def create_script(self, name: str, source_js: str, script_class=FAsyncScript, *args, track: bool = True,
+                            **kwargs):
+        """Create a FAsyncScript (or subclass script_class) within the wrapped frida.core.Session.
+
+        A script already created with the same name is unloaded first, rather than left running untracked. If track is
+        False the script isn't added to scripts (and any script of the same name is left alone), the caller swaps it
+        in once it is ready.
+        """
+        if track and (old_script := self.scripts.get(name, None)) is not None:
+            logger.warning(f"Replacing script '{name}' in '{self}', unloading the old one...")
+            await old_script.unload()
+            # forgotten only once unloaded, a script that fails to unload must stay reachable to be unloaded again
+            del self.scripts[name]
         f = functools.partial(self._session.create_script, name=name, source=source_js)
         _script = await trio.to_thread.run_sync(f)
-        self.scripts[name] = script_class(name, source_js, _script)
-        return self.scripts[name]
+        script = script_class(name, source_js, _script)
+        if track:
+            self.scripts[name] = script
+        return script
 
 
 class FAsyncSession(FAsyncSessionFoundation):
@@ -170,6 +233,143 @@ class FAsyncSession(FAsyncSessionFoundation):
         super().__init__(target, session)
         self._patch_builder = PatchBuilder()
         self.patches = {}
+        self._patch_plans: dict[str, PatchPlan] = {}
+        self.allocator: AgentAllocator = None
+        self.captures: dict[str, FAsyncCaptureScript] = {}
+        self.watcher: FAsyncWatcher = None
+        self.layout_reader: FAsyncLayoutReader = None
+
+    async def init(self):
+        """Perform async initialisation, loading the patch memory allocator alongside the utils script."""
+        # the allocator script is never reloaded, unloading it would free the memory of every live patch
+        self.allocator = AgentAllocator(await self._load_internal_js_script("_fridasync_alloc.js"))
+        await super().init()
+
+    def _on_detached(self):
+        super()._on_detached()
+        # the watch script went with the session, end the subscriptions rather than leave them waiting forever
+        if self.watcher is not None:
+            self.watcher.close()
+
+    # TODO: should this be an AsyncProperty?
+    @property
+    def allocator_stats(self) -> dict:
+        """Return the page and fragmentation stats of the patch memory pools in the target process."""
+        _sctx = f"[{self.target}:_fridasync_alloc.js]"
+        try:
+            return self.allocator.stats()
+        except (frida.InvalidOperationError, AttributeError) as e:
+            logger.error(f"[{_sctx}] frida: {e}")
+            return {}
+
+    async def load_patch_plan(self, plan: PatchPlan) -> bool:
+        """Use plan's offline resolved targets for patches created later, if it matches the module in the target."""
+        module = await trio.to_thread.run_sync(self._utils_script.exports.get_module_by_name, plan.module_name)
+        if module["size"] != plan.size_of_image:
+            logger.warning(f"Patch plan for '{plan.module_name}' is for a different build "
+                           f"(size {plan.size_of_image:#x} != {module['size']:#x}), ignoring it")
+            return False
+        self._patch_plans[plan.module_name] = plan
+        logger.success(f"Loaded patch plan for '{plan.module_name}' with {len(plan.entries)} entries")
+        return True
+
+    async def build_signature_index(self, module_name: str, cache_dir=None) -> SignatureIndex:
+        """Build a SignatureIndex over the live image of module_name, wildcarding values that point into the module.
+
+        Every readable range is indexed, not just the code, as patch and capture patterns are scanned for over the
+        whole module. Build it before applying patches or hooks to the module, or their code will be indexed.
+        """
+        exports = self._utils_script.exports
+        module = await trio.to_thread.run_sync(exports.get_module_by_name, module_name)
+        ranges = await trio.to_thread.run_sync(exports.enumerate_module_ranges, module_name, "r--")
+        chunks, segments, start = [], [], 0
+        for r in ranges:
+            chunks.append(await trio.to_thread.run_sync(exports.read_module_range, module_name, r["offset"], r["size"]))
+            if segments and segments[-1][0] + segments[-1][2] - segments[-1][1] == r["offset"]:
+                # contiguous ranges differing only in protection are one segment, patterns may span them
+                segments[-1] = (segments[-1][0], segments[-1][1], start + r["size"])
+            else:
+                segments.append((r["offset"], start, start + r["size"]))
+            start += r["size"]
+        code = b"".join(chunks)
+        relocated = SignatureIndex.pointer_mask(code, int(module["base"], 16), module["size"])
+        return await trio.to_thread.run_sync(SignatureIndex.build, module_name, code, segments, relocated, cache_dir)
+
+    def _planned_offset(self, name: str, module_name: str, target_pattern: str):
+        """Return the planned target offset for a patch, provided it was planned with the same pattern."""
+        plan = self._patch_plans.get(module_name, None)
+        if plan is None or name not in plan.entries or plan.entries[name].target_pattern != target_pattern:
+            return None
+        return plan.offset(name)
+
+    async def _create_patch(self, name: str, template_name: str, gen_js, module_name: str,
+                            code_size: int = 0, vars_spec: list[PatchVarSpec] = (),
+                            replace: bool = True) -> FAsyncPatcherScript:
+        """Create and load a patch script from gen_js(), a callable returning (script_name, js).
+
+        If the patch needs code_size bytes of code or has vars, they are pooled by the session allocator near
+        module_name and passed to gen_js as patch_memory and var_addresses. A patch already called name is unloaded
+        (cleared and its memory freed) first, unless replace is False: then the new patch is created alongside it and
+        isn't added to patches, for the caller to swap in. Anything created is discarded if the patch fails to load.
+        """
+        if replace and name in self.patches:
+            logger.warning(f"Replacing patch '{name}' in '{self}'...")
+            await self.unload_patch(name)
+        timer = StageTimer()
+        code_address, var_addresses, patch_script = None, {}, None
+        try:
+            with timer.stage("alloc"):
+                code_address = await self.allocator.alloc(CODE, code_size, module_name) if code_size else None
+                for v in vars_spec:
+                    var_addresses[v.name] = await self.allocator.alloc(DATA, v.size, module_name)
+            with timer.stage("render"):
+                if code_size or vars_spec:
+                    script_name, js = gen_js(patch_memory=code_address, var_addresses=var_addresses)
+                else:
+                    script_name, js = gen_js()
+            logger.debug(f"Creating {script_name} script in '{self.session}'...")
+            with timer.stage("create_script"):
+                patch_script = await self.create_script(name=script_name, source_js=js,
+                                                        script_class=FAsyncPatcherScript, track=replace)
+            logger.success(f"Created {script_name} script in '{self.session}'")
+            logger.debug(f"Configuring log handler and binding callbacks for {script_name}...")
+            # Bind the handler and configure the callbacks xd
+            log_pf = functools.partial(generic_fridajs_log_handler, self.target, script_name)
+            patch_script.set_log_handler(log_pf)
+            msg_pf = functools.partial(generic_on_msg_log_handler, self.target, script_name)
+            patch_script.on("message", msg_pf)
+            # Remember how the patch was generated so it can be hot-reloaded
+            patch_script.template_name, patch_script.gen_js = template_name, gen_js
+            patch_script.allocator, patch_script.module_name = self.allocator, module_name
+            patch_script.code_size, patch_script.vars_spec = code_size, vars_spec
+            patch_script.code_address, patch_script.var_addresses = code_address, var_addresses
+            # Load the patch now!
+            with timer.stage("load"):
+                await patch_script.load()
+            agent_ms = await trio.to_thread.run_sync(patch_script.exports.load_timings)
+        except Exception:
+            await self._discard_patch_script(patch_script, code_address, var_addresses)
+            raise
+        patch_script.setup_timings = PatchTimings("setup", True, time.time(), timer.stages, agent_ms)
+        logger.debug(f"Patch '{name}' setup took {patch_script.setup_timings.total_ms:.2f} ms "
+                     f"{timer.stages} [agent: {agent_ms}]")
+        if replace:
+            self.patches[name] = patch_script
+        return patch_script
+
+    async def _discard_patch_script(self, patch_script: Optional[FAsyncPatcherScript], code_address: Optional[str],
+                                    var_addresses: dict[str, str]):
+        """Unload a never applied, untracked patch script (if created) and free the pooled memory it was given."""
+        if patch_script is not None and self.scripts.get(patch_script.name, None) is patch_script:
+            del self.scripts[patch_script.name]
+        try:
+            if patch_script is not None:
+                await patch_script.unload()
+            for address in [code_address, *var_addresses.values()]:
+                if address is not None:
+                    await self.allocator.free(address)
+        except Exception as e:
+            logger.opt(exception=e).error(f"Failed to discard patch script in '{self}': {e}")
 
     async def create_jmp_patch(self, name: str, module_name: str, target_pattern: str,
                                vars_spec: list[PatchVarSpec], relocate_target: bool,
@@ -177,44 +377,166 @@ class FAsyncSession(FAsyncSessionFoundation):
                                cw_patch_func: str) -> FAsyncPatcherScript:
         """Create a jmp patch (script) within the target session."""
         # TODO: make create_jmp_patch_js async again!
-        script_name, js = self._patch_builder.gen_jmp_patch_js(name, module_name, target_pattern,
-                                                               vars_spec, relocate_target,
-                                                               patch_mem_size, return_offset,
-                                                               cw_patch_func)
-        logger.debug(f"Creating {script_name} script in '{self.session}'...")
-        patch_script = await self.create_script(name=script_name, source_js=js,
-                                                script_class=FAsyncPatcherScript)
-        logger.success(f"Created {script_name} script in '{self.session}'")
-        logger.debug(f"Configuring log handler and binding callbacks for {script_name}...")
-        # Bind the handler and configure the callbacks xd
-        log_pf = functools.partial(generic_fridajs_log_handler, self.target, script_name)
-        patch_script.set_log_handler(log_pf)
-        msg_pf = functools.partial(generic_on_msg_log_handler, self.target, script_name)
-        patch_script.on("message", msg_pf)
-        # Load the patch now!
-        await patch_script.load()
-        self.patches[name] = patch_script
-        return patch_script
+        gen_js = functools.partial(self._patch_builder.gen_jmp_patch_js, name, module_name, target_pattern,
+                                   vars_spec, relocate_target, patch_mem_size, return_offset, cw_patch_func,
+                                   target_offset=self._planned_offset(name, module_name, target_pattern))
+        return await self._create_patch(name, PatchBuilder.JMP_PATCH_TEMPLATE, gen_js, module_name,
+                                        patch_mem_size, vars_spec)
 
     async def create_nop_patch(self, name: str, module_name: str, target_pattern: str,
                                nop_offset: int, nop_length: int) -> FAsyncPatcherScript:
         """Create a nop patch (script) within the target session."""
-        script_name, js = self._patch_builder.gen_nop_patch_js(name, module_name, target_pattern,
-                                                               nop_offset, nop_length)
+        gen_js = functools.partial(self._patch_builder.gen_nop_patch_js, name, module_name, target_pattern,
+                                   nop_offset, nop_length,
+                                   target_offset=self._planned_offset(name, module_name, target_pattern))
+        return await self._create_patch(name, PatchBuilder.NOP_PATCH_TEMPLATE, gen_js, module_name)
+
+    async def reload_patch(self, name: str) -> FAsyncPatcherScript:
+        """Regenerate patch name from its (possibly edited) template and swap it in, preserving applied state.
+
+        The new patch is created and loaded alongside the old one, which is only unloaded once the new one has taken
+        over. If the new patch fails to load or apply, it is discarded and the old one is kept (re-applied if it was
+        applied).
+        """
+        old_patch = self.patches[name]
+        was_applied = old_patch.applied
+        new_patch = await self._create_patch(name, old_patch.template_name, old_patch.gen_js, old_patch.module_name,
+                                             old_patch.code_size, old_patch.vars_spec, replace=False)
+        if was_applied:
+            await old_patch.clear()
+            if old_patch.applied:
+                await self._discard_patch_script(new_patch, new_patch.code_address, new_patch.var_addresses)
+                raise FridAsyncException(f"Can't reload patch '{name}', the old patch failed to clear")
+            await new_patch.apply()
+            if not new_patch.applied:
+                logger.error(f"Reloaded patch '{name}' failed to apply, re-applying the old patch")
+                await self._discard_patch_script(new_patch, new_patch.code_address, new_patch.var_addresses)
+                await old_patch.apply()
+                raise FridAsyncException(f"Can't reload patch '{name}', the new patch failed to apply")
+        await self.unload_patch(name)
+        self.patches[name], self.scripts[new_patch.name] = new_patch, new_patch
+        return new_patch
+
+    async def unload_patch(self, name: str):
+        """Unload patch name: clear it if applied, unload its script and return its pooled memory."""
+        patch = self.patches[name]
+        # forgotten only once unloaded, a patch that fails to clear must stay reachable to be cleared again
+        await patch.unload()
+        del self.patches[name]
+        self.scripts.pop(patch.name, None)
+        logger.debug(f"Unloaded patch '{name}' from '{self}'")
+
+    async def reload_patches(self, template_names: set[str]) -> list[FAsyncPatcherScript]:
+        """Reload every patch that was generated from one of template_names, returning those reloaded."""
+        names = [name for name, p in self.patches.items() if p.template_name in template_names]
+        reloaded = []
+        for name in names:
+            # a broken template leaves its patch as it was, it mustn't stop the other patches from reloading
+            try:
+                reloaded.append(await self.reload_patch(name))
+            except Exception as e:
+                logger.opt(exception=e).error(f"Failed to reload patch '{name}' in '{self}': {e}")
+        return reloaded
+
+    async def create_capture(self, spec: CaptureSpec) -> FAsyncCaptureScript:
+        """Create a capture (script) that hooks spec's target and records each call into an agent ring buffer."""
+        if spec.name in self.captures:
+            logger.warning(f"Replacing capture '{spec.name}' in '{self}'...")
+            await self.unload_capture(spec.name)
+        builder = CaptureBuilder(self.pointer_size)
+        script_name, js = builder.gen_capture_js(
+            spec, target_offset=self._planned_offset(spec.name, spec.module_name, spec.target_pattern))
         logger.debug(f"Creating {script_name} script in '{self.session}'...")
-        patch_script = await self.create_script(name=script_name, source_js=js,
-                                                script_class=FAsyncPatcherScript)
-        logger.success(f"Created {script_name} script in '{self.session}'")
-        logger.debug(f"Configuring log handler and binding callbacks for {script_name}...")
-        # Bind the handler and configure the callbacks xd
+        capture_script = await self.create_script(name=script_name, source_js=js, script_class=FAsyncCaptureScript)
         log_pf = functools.partial(generic_fridajs_log_handler, self.target, script_name)
-        patch_script.set_log_handler(log_pf)
+        capture_script.set_log_handler(log_pf)
         msg_pf = functools.partial(generic_on_msg_log_handler, self.target, script_name)
-        patch_script.on("message", msg_pf)
-        # Load the patch now!
-        await patch_script.load()
-        self.patches[name] = patch_script
-        return patch_script
+        capture_script.on("message", msg_pf)
+        capture_script.spec, capture_script.dtype = spec, builder.dtype(spec)
+        await capture_script.load()
+        logger.success(f"Created capture '{spec.name}' in '{self.session}' "
+                       f"[{capture_script.dtype.itemsize} byte records]")
+        self.captures[spec.name] = capture_script
+        return capture_script
+
+    async def unload_capture(self, name: str):
+        """Unload capture name, detaching its hook (unread records are lost, drain it first to keep them)."""
+        capture = self.captures.pop(name)
+        self.scripts.pop(capture.name, None)
+        await capture.unload()
+
+    async def drain_captures(self) -> dict[str, np.ndarray]:
+        """Drain the ring buffer of every capture, returning {capture name: records}."""
+        return {name: await capture.drain() for name, capture in self.captures.items()}
+
+    def _on_watch_message(self, message, data):
+        self.watcher.on_message(message, data)
+
+    async def watch(self, name: str, type_: str, address: str = None, module_name: str = None, offset: int = 0):
+        """Watch the type_ value at address (or module_name + offset) for writes, returning its current value.
+
+        Changes are delivered to subscribe_watches subscribers, the target is not polled.
+        """
+        if self.watcher is None:
+            script = await self._load_internal_js_script("_fridasync_watch.js", on_message=self._on_watch_message)
+            self.watcher = FAsyncWatcher(self.target, script, self._trio_token)
+        if address is None:
+            module = await trio.to_thread.run_sync(self._utils_script.exports.get_module_by_name, module_name)
+            address = hex(int(module["base"], 16) + offset)
+        return await self.watcher.add(name, address, type_)
+
+    async def unwatch(self, name: str) -> bool:
+        """Stop watching name."""
+        return await self.watcher.remove(name) if self.watcher else False
+
+    async def dispose_watcher(self):
+        """Stop every watch and unload the watch script, ending every subscription to them."""
+        if self.watcher is not None:
+            watcher, self.watcher = self.watcher, None
+            await watcher.dispose()
+
+    def subscribe_watches(self, names: list[str] = None, buffer: int = 256):
+        """Return an async context manager yielding a receive channel of WatchEvents for names (None for all)."""
+        if self.watcher is None:
+            raise FridAsyncException(f"'{self}' has no watches to subscribe to, add one with watch() first")
+        return self.watcher.subscribe(names, buffer)
+
+    async def _get_layout_reader(self) -> FAsyncLayoutReader:
+        if self.layout_reader is None:
+            script = await self._load_internal_js_script("_fridasync_layout.js")
+            self.layout_reader = FAsyncLayoutReader(script, self.pointer_size)
+        return self.layout_reader
+
+    async def read_layout(self, struct: Struct, address: str = None, chain: Chain = None) -> np.void:
+        """Read the struct graph at address (or at the end of chain) in one rpc, see layout.to_python."""
+        reader = await self._get_layout_reader()
+        if chain is not None:
+            return await reader.read_chain(struct, chain)
+        return await reader.read(struct, address)
+
+    async def read_layouts(self, struct: Struct, addresses: list[str]) -> np.ndarray:
+        """Read the struct graph at each of addresses in one rpc."""
+        return await (await self._get_layout_reader()).read_many(struct, addresses)
+
+    def garbage_report(self, alloc_stats: dict = None) -> dict:
+        """Return what the session holds in the target process, and what of it is garbage.
+
+        stale_scripts are tracked scripts that aren't loaded, orphan_patches/captures are ones whose script is no
+        longer tracked, and leaked_allocations are pooled allocations that no live patch accounts for. Pass
+        alloc_stats if allocator_stats was just read, rather than reading it again. Makes blocking rpcs.
+        """
+        expected_allocations = sum((p.code_address is not None) + len(p.var_addresses) for p in self.patches.values())
+        if alloc_stats is None:
+            alloc_stats = self.allocator_stats
+        allocations = alloc_stats.get("allocations", 0)
+        return {"scripts": len(self.scripts), "patches": len(self.patches), "captures": len(self.captures),
+                "stale_scripts": [name for name, s in self.scripts.items() if not s.loaded],
+                "orphan_patches": [name for name, p in self.patches.items() if self.scripts.get(p.name) is not p],
+                "orphan_captures": [name for name, c in self.captures.items() if self.scripts.get(c.name) is not c],
+                "allocations": allocations, "expected_allocations": expected_allocations,
+                "leaked_allocations": max(allocations - expected_allocations, 0),
+                "pooled_bytes_used": sum(alloc_stats[k]["used"] for k in (CODE, DATA) if k in alloc_stats),
+                "frida_heap_size": self.frida_heap_size}
 
     # TODO: perhaps clear_all_patches should call special clear_sync method instead?
     async def clear_all_patches(self):
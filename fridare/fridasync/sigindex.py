@@ -0,0 +1,218 @@
+"""Generates the shortest unique target pattern for a module address from a suffix array index of the module's image.
+
+The index is a suffix array over the bytes of the whole module image, headers and every section (read from the PE
+file on disk or from a live session), as patterns are scanned for over the whole module. It is sorted on the first
+max_length bytes of each suffix. Counting the matches of a pattern is then a binary search for its longest literal
+run plus a vectorised check of the remaining bytes of the few candidates, instead of a scan over the whole module.
+Suffix arrays are cached on disk per sha256 of the indexed bytes.
+"""
+import hashlib
+import pathlib
+from typing import Optional, Union
+
+import numpy as np
+
+from loguru import logger
+
+from .exceptions import FridAsyncException
+from .signatures import BytePattern, PEModule
+
+
+# the longest pattern the index can answer for, suffixes are only sorted up to this many bytes
+DEFAULT_MAX_LENGTH = 64
+
+
+def build_suffix_array(code: np.ndarray, max_length: int = DEFAULT_MAX_LENGTH) -> np.ndarray:
+    """Return the suffix array of code (uint8), sorted on the first max_length bytes, by prefix doubling."""
+    n = len(code)
+    # rank 0 is reserved for "past the end" so that a suffix sorts before every suffix it is a prefix of
+    rank = code.astype(np.int64) + 1
+    sa = np.argsort(rank)
+    k = 1
+    while k < max_length:
+        next_rank = np.zeros(n, dtype=np.int64)
+        next_rank[:n - k] = rank[k:]
+        key = rank * (n + 2) + next_rank
+        sa = np.argsort(key)
+        sorted_key = key[sa]
+        rank = np.empty(n, dtype=np.int64)
+        rank[sa] = np.concatenate(([1], 1 + np.cumsum(sorted_key[1:] != sorted_key[:-1])))
+        if rank[sa[-1]] == n:
+            # every suffix already has a distinct rank
+            break
+        k *= 2
+    return sa.astype(np.uint32)
+
+
+class SignatureIndex:
+    """A suffix array index over a module's code, answering pattern match counts and unique pattern queries."""
+
+    def __init__(self, module_name: str, code: bytes, segments: list[tuple[int, int, int]],
+                 relocated: np.ndarray, sa: np.ndarray, max_length: int = DEFAULT_MAX_LENGTH):
+        """Initialise an index over code, made up of segments (rva, start, end), with relocated byte mask."""
+        self.module_name = module_name
+        self.data = code
+        self.code = np.frombuffer(code, dtype=np.uint8)
+        self.segments = segments
+        self.relocated = relocated
+        self.sa = sa
+        self.max_length = max_length
+
+    @staticmethod
+    def code_sha256(code: bytes) -> str:
+        """Return the sha256 of indexed code, the key of its cached suffix array."""
+        return hashlib.sha256(code).hexdigest()
+
+    @classmethod
+    def build(cls, module_name: str, code: bytes, segments: list[tuple[int, int, int]], relocated: np.ndarray,
+              cache_dir: Union[str, pathlib.Path] = None, max_length: int = DEFAULT_MAX_LENGTH) -> "SignatureIndex":
+        """Build an index over code, loading/saving its suffix array in cache_dir if given."""
+        cache_path = None
+        if cache_dir is not None:
+            cache_dir = pathlib.Path(cache_dir)
+            cache_path = cache_dir / f"{cls.code_sha256(code)}.sa{max_length}.npy"
+            if cache_path.exists():
+                logger.debug(f"Loading cached suffix array for '{module_name}' from '{cache_path}'")
+                return cls(module_name, code, segments, relocated, np.load(cache_path, mmap_mode="r"), max_length)
+        logger.info(f"Building suffix array over {len(code)} bytes of '{module_name}' code...")
+        sa = build_suffix_array(np.frombuffer(code, dtype=np.uint8), max_length)
+        if cache_path is not None:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            np.save(cache_path, sa)
+            logger.debug(f"Cached suffix array for '{module_name}' in '{cache_path}'")
+        return cls(module_name, code, segments, relocated, sa, max_length)
+
+    @classmethod
+    def from_pe(cls, path: Union[str, pathlib.Path], module_name: str = None,
+                cache_dir: Union[str, pathlib.Path] = None,
+                max_length: int = DEFAULT_MAX_LENGTH) -> "SignatureIndex":
+        """Build an index over the headers and every section of the PE file at path, relocations from its .reloc.
+
+        The whole image is indexed, not just the executable sections, as patterns are scanned for over the whole
+        module: a pattern unique within the code could still match in the data.
+        """
+        path = pathlib.Path(path)
+        with PEModule(path) as pe:
+            chunks, segments, start = [], [], 0
+            for rva, file_start, file_end in pe.regions():
+                chunks.append(pe.data[file_start:file_end])
+                segments.append((rva, start, start + file_end - file_start))
+                start += file_end - file_start
+            code = b"".join(chunks)
+            relocated = np.zeros(len(code), dtype=bool)
+            for rva, size in pe.relocations():
+                for seg_rva, seg_start, seg_end in segments:
+                    if seg_rva <= rva and rva + size <= seg_rva + seg_end - seg_start:
+                        relocated[seg_start + rva - seg_rva:seg_start + rva - seg_rva + size] = True
+        return cls.build(module_name if module_name else path.name, code, segments, relocated, cache_dir, max_length)
+
+    @staticmethod
+    def pointer_mask(code: bytes, base: int, size: int) -> np.ndarray:
+        """Mark every 4 byte little endian value in code that points into [base, base + size), e.g. live code."""
+        c = np.frombuffer(code, dtype=np.uint8).astype(np.uint32)
+        relocated = np.zeros(len(c), dtype=bool)
+        if len(c) < 4:
+            return relocated
+        values = c[:-3] | (c[1:-2] << 8) | (c[2:-1] << 16) | (c[3:] << 24)
+        hits = np.flatnonzero((values >= base) & (values < base + size))
+        for i in range(4):
+            relocated[hits + i] = True
+        return relocated
+
+    def index_of(self, rva: int) -> tuple[int, int]:
+        """Return (index position, end of its segment) of rva, which must be in the indexed code."""
+        for seg_rva, start, end in self.segments:
+            if seg_rva <= rva < seg_rva + end - start:
+                return start + rva - seg_rva, end
+        raise FridAsyncException(f"RVA {rva:#x} is not in the indexed code of '{self.module_name}'")
+
+    def rva_of(self, position: int) -> int:
+        """Return the rva of index position."""
+        for seg_rva, start, end in self.segments:
+            if start <= position < end:
+                return seg_rva + position - start
+        raise FridAsyncException(f"Position {position} is outside the index of '{self.module_name}'")
+
+    def _sa_range(self, key: bytes) -> tuple[int, int]:
+        """Return the [lo, hi) range of the suffix array whose suffixes start with key (len(key) <= max_length)."""
+        data, sa, m = self.data, self.sa, len(key)
+        lo, hi = 0, len(sa)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            s = int(sa[mid])
+            if data[s:s + m] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        first, hi = lo, len(sa)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            s = int(sa[mid])
+            if data[s:s + m] <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return first, lo
+
+    def matches(self, pattern: BytePattern) -> np.ndarray:
+        """Return the index positions where pattern matches."""
+        try:
+            anchor_offset, anchor = pattern.anchor()
+        except FridAsyncException:
+            # nothing but wildcards, matches everywhere
+            return np.arange(len(self.code) - len(pattern) + 1)
+        anchor = anchor[:self.max_length]
+        lo, hi = self._sa_range(anchor)
+        candidates = self.sa[lo:hi].astype(np.int64) - anchor_offset
+        candidates = candidates[(candidates >= 0) & (candidates + len(pattern) <= len(self.code))]
+        for j, (v, m) in enumerate(zip(pattern.values, pattern.mask)):
+            if m == 0x00 or anchor_offset <= j < anchor_offset + len(anchor):
+                continue
+            candidates = candidates[(self.code[candidates + j] & m) == v]
+        return np.sort(candidates)
+
+    def count(self, pattern: BytePattern) -> int:
+        """Return how many times pattern matches in the indexed code."""
+        return len(self.matches(pattern))
+
+    def pattern_at(self, rva: int, length: int, wildcard_relocations: bool = False) -> BytePattern:
+        """Return the length byte pattern of the code at rva, with relocated operands wildcarded if asked."""
+        position, _ = self.index_of(rva)
+        values = self.data[position:position + length]
+        if wildcard_relocations:
+            mask = bytes(0x00 if r else 0xFF for r in self.relocated[position:position + length])
+        else:
+            mask = b"\xFF" * len(values)
+        return BytePattern.from_bytes(values, mask)
+
+    def unique_pattern(self, rva: int, min_length: int = 1, wildcard_relocations: bool = False,
+                       max_length: int = None) -> Optional[BytePattern]:
+        """Return the shortest pattern starting at rva that matches only there, or None if there is none.
+
+        min_length is the shortest pattern wanted, e.g. 5 for a jmp patch target (Patch._find takes the match size
+        as the target size). Matches only get rarer as the pattern grows, so the shortest length is found by
+        binary search.
+        """
+        position, end = self.index_of(rva)
+        max_length = min(max_length if max_length else self.max_length, self.max_length, end - position)
+        if min_length > max_length:
+            return None
+
+        def unique(length):
+            return len(self.matches(self.pattern_at(rva, length, wildcard_relocations))) == 1
+
+        if not unique(max_length):
+            return None
+        lo, hi = min_length, max_length
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if unique(mid):
+                hi = mid
+            else:
+                lo = mid + 1
+        return self.pattern_at(rva, lo, wildcard_relocations)
+
+    def unique_patterns(self, rvas: list[int], min_length: int = 1,
+                        wildcard_relocations: bool = False) -> dict[int, Optional[BytePattern]]:
+        """Return {rva: shortest unique pattern or None} for every rva."""
+        return {rva: self.unique_pattern(rva, min_length, wildcard_relocations) for rva in rvas}
@@ -0,0 +1,326 @@
+"""Resolves patch target patterns offline, against a PE module file on disk, into a precomputed patch plan.
+
+The plan records the module-relative offset (RVA) and expected bytes for every patch so that, at attach time,
+a patch only needs to verify its target in place instead of scanning the whole module in the game process.
+"""
+import dataclasses
+import hashlib
+import json
+import mmap
+import pathlib
+import struct
+from collections import deque
+from typing import Optional, Union
+
+from loguru import logger
+
+from .exceptions import FridAsyncException
+
+
+@dataclasses.dataclass
+class BytePattern:
+    """A frida Memory.scan style pattern parsed into value and mask bytes (mask 0x00 = wildcard)."""
+
+    source: str
+    values: bytes
+    mask: bytes
+
+    @classmethod
+    def parse(cls, pattern: str) -> "BytePattern":
+        """Parse a pattern like 'D9 44 ?? 08 5?' (full and nibble wildcards) into a BytePattern."""
+        values, mask = bytearray(), bytearray()
+        for token in pattern.split():
+            if len(token) != 2:
+                raise FridAsyncException(f"Can't parse pattern token '{token}' in '{pattern}'")
+            v, m = 0, 0
+            for i, nibble in enumerate(token):
+                shift = 4 if i == 0 else 0
+                if nibble != "?":
+                    try:
+                        v |= int(nibble, 16) << shift
+                    except ValueError:
+                        raise FridAsyncException(f"Can't parse pattern token '{token}' in '{pattern}'")
+                    m |= 0xF << shift
+            values.append(v)
+            mask.append(m)
+        if not values:
+            raise FridAsyncException(f"Empty pattern '{pattern}'")
+        return cls(pattern, bytes(values), bytes(mask))
+
+    @classmethod
+    def from_bytes(cls, values: bytes, mask: bytes) -> "BytePattern":
+        """Build a BytePattern (and its pattern string) from value and mask bytes, only 0x00/0xFF masks."""
+        values = bytes(v & m for v, m in zip(values, mask))
+        source = " ".join(f"{v:02X}" if m == 0xFF else "??" for v, m in zip(values, mask))
+        return cls(source, values, bytes(mask))
+
+    def __len__(self) -> int:
+        """Return the pattern length in bytes."""
+        return len(self.values)
+
+    def anchor(self) -> tuple[int, bytes]:
+        """Return (offset, bytes) of the longest run of fully specified bytes, used to drive the automaton."""
+        best_start, best_len, start = 0, 0, None
+        # a trailing 0x00 closes a run of specified bytes at the end of the pattern
+        for i, m in enumerate([*self.mask, 0x00]):
+            if m == 0xFF and start is None:
+                start = i
+            elif m != 0xFF and start is not None:
+                if i - start > best_len:
+                    best_start, best_len = start, i - start
+                start = None
+        if best_len == 0:
+            raise FridAsyncException(f"Pattern '{self.source}' has no fully specified byte to anchor on")
+        return best_start, self.values[best_start:best_start + best_len]
+
+    def matches_at(self, data, pos: int) -> bool:
+        """Return whether the pattern matches data at pos."""
+        if pos < 0 or pos + len(self.values) > len(data):
+            return False
+        for i, (v, m) in enumerate(zip(self.values, self.mask)):
+            if data[pos + i] & m != v:
+                return False
+        return True
+
+
+class MultiPatternMatcher:
+    """Matches many BytePatterns in a single pass with an Aho-Corasick automaton over their anchors.
+
+    Each pattern contributes its longest literal run (anchor) to the automaton; when an anchor is seen the full
+    pattern, wildcards included, is verified at the implied start position. The automaton uses a dense 256-way
+    transition table so the scan loop is one list index per input byte.
+    """
+
+    def __init__(self, patterns: list[BytePattern]):
+        """Build the automaton for patterns."""
+        self.patterns = patterns
+        self._delta: list[list[int]] = [[0] * 256]
+        self._out: list[list[tuple[int, int, int]]] = [[]]
+        goto: list[dict[int, int]] = [{}]
+        for index, pattern in enumerate(patterns):
+            anchor_offset, anchor = pattern.anchor()
+            state = 0
+            for b in anchor:
+                if b not in goto[state]:
+                    goto.append({})
+                    self._out.append([])
+                    goto[state][b] = len(goto) - 1
+                state = goto[state][b]
+            self._out[state].append((index, anchor_offset, len(anchor)))
+        # breadth first construction of failure links, folded straight into the dense delta table
+        self._delta = [[0] * 256 for _ in goto]
+        fail = [0] * len(goto)
+        queue = deque()
+        for b, s in goto[0].items():
+            self._delta[0][b] = s
+            queue.append(s)
+        while queue:
+            state = queue.popleft()
+            self._out[state] = self._out[state] + self._out[fail[state]]
+            for b in range(256):
+                if (s := goto[state].get(b)) is not None:
+                    fail[s] = self._delta[fail[state]][b]
+                    self._delta[state][b] = s
+                    queue.append(s)
+                else:
+                    self._delta[state][b] = self._delta[fail[state]][b]
+
+    def scan(self, data, base: int = 0) -> dict[int, list[int]]:
+        """Scan data once, returning {pattern index: [base + match position, ...]}."""
+        hits: dict[int, list[int]] = {i: [] for i in range(len(self.patterns))}
+        delta, out, patterns = self._delta, self._out, self.patterns
+        state = 0
+        for pos, b in enumerate(data):
+            state = delta[state][b]
+            if out[state]:
+                for index, anchor_offset, anchor_len in out[state]:
+                    start = pos - anchor_len + 1 - anchor_offset
+                    if patterns[index].matches_at(data, start):
+                        hits[index].append(base + start)
+        return hits
+
+
+@dataclasses.dataclass
+class PESection:
+    """A PE section header mapped to its file data."""
+
+    name: str
+    rva: int
+    virtual_size: int
+    raw_offset: int
+    raw_size: int
+    characteristics: int
+
+    @property
+    def executable(self) -> bool:
+        """Return whether the section is marked IMAGE_SCN_MEM_EXECUTE."""
+        return bool(self.characteristics & 0x20000000)
+
+
+class PEModule:
+    """Memory-maps a PE file (e.g. a copy of rwr_game.exe) and maps its sections to RVAs."""
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        """Open and parse the PE headers of the file at path."""
+        self.path = pathlib.Path(path)
+        self._f = self.path.open("rb")
+        self.data = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:2] != b"MZ":
+            raise FridAsyncException(f"'{self.path}' is not a PE file (no MZ header)")
+        pe_offset = struct.unpack_from("<I", self.data, 0x3C)[0]
+        if self.data[pe_offset:pe_offset + 4] != b"PE\0\0":
+            raise FridAsyncException(f"'{self.path}' is not a PE file (no PE signature)")
+        coff = pe_offset + 4
+        self.machine, n_sections, self.timestamp, _, _, opt_size, _ = struct.unpack_from("<HHIIIHH", self.data, coff)
+        opt = coff + 20
+        magic = struct.unpack_from("<H", self.data, opt)[0]
+        if magic == 0x10B:  # PE32
+            self.image_base = struct.unpack_from("<I", self.data, opt + 28)[0]
+            data_directories = opt + 92
+        elif magic == 0x20B:  # PE32+
+            self.image_base = struct.unpack_from("<Q", self.data, opt + 24)[0]
+            data_directories = opt + 108
+        else:
+            raise FridAsyncException(f"'{self.path}' has unknown optional header magic {magic:#x}")
+        self.size_of_image, self.size_of_headers = struct.unpack_from("<II", self.data, opt + 56)
+        n_directories = struct.unpack_from("<I", self.data, data_directories)[0]
+        self.data_directories = [struct.unpack_from("<II", self.data, data_directories + 4 + i * 8)
+                                 for i in range(n_directories)]
+        self.sections = []
+        for i in range(n_sections):
+            name, vsize, rva, raw_size, raw_offset = struct.unpack_from("<8sIIII", self.data, opt + opt_size + i * 40)
+            characteristics = struct.unpack_from("<I", self.data, opt + opt_size + i * 40 + 36)[0]
+            self.sections.append(PESection(name.rstrip(b"\0").decode("ascii", "replace"), rva, vsize,
+                                           raw_offset, raw_size, characteristics))
+
+    def close(self):
+        """Unmap and close the file."""
+        self.data.close()
+        self._f.close()
+
+    def __enter__(self):
+        """Enter a with block."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the module on leaving a with block."""
+        self.close()
+
+    def sha256(self) -> str:
+        """Return the sha256 of the whole file."""
+        return hashlib.sha256(self.data).hexdigest()
+
+    def regions(self) -> list[tuple[int, int, int]]:
+        """Return (rva, file start, file end) for the headers and each section's file-backed data."""
+        regions = [(0, 0, self.size_of_headers)]
+        for s in self.sections:
+            size = min(s.raw_size, s.virtual_size) if s.virtual_size else s.raw_size
+            regions.append((s.rva, s.raw_offset, s.raw_offset + size))
+        return regions
+
+    def scan(self, matcher: "MultiPatternMatcher") -> dict[int, list[int]]:
+        """Scan every region in place (no copies of the mapping), returning {pattern index: [rva, ...]}."""
+        hits = {i: [] for i in range(len(matcher.patterns))}
+        for rva, start, end in self.regions():
+            with memoryview(self.data) as view, view[start:end] as data:
+                for i, region_hits in matcher.scan(data, rva).items():
+                    hits[i].extend(region_hits)
+        return hits
+
+    def relocations(self) -> list[tuple[int, int]]:
+        """Return (rva, size) of every absolute address the loader fixes up, from the base relocation table."""
+        if len(self.data_directories) <= 5 or self.data_directories[5][1] == 0:
+            return []
+        rva, size = self.data_directories[5]
+        table, relocations, pos = self.read_rva(rva, size), [], 0
+        while pos + 8 <= len(table):
+            page_rva, block_size = struct.unpack_from("<II", table, pos)
+            if block_size < 8:
+                break
+            for entry in struct.unpack_from(f"<{(block_size - 8) // 2}H", table, pos + 8):
+                kind, offset = entry >> 12, entry & 0xFFF
+                if kind == 3:  # IMAGE_REL_BASED_HIGHLOW
+                    relocations.append((page_rva + offset, 4))
+                elif kind == 10:  # IMAGE_REL_BASED_DIR64
+                    relocations.append((page_rva + offset, 8))
+            pos += block_size
+        return relocations
+
+    def read_rva(self, rva: int, size: int) -> bytes:
+        """Return size bytes of file data at rva."""
+        for region_rva, start, end in self.regions():
+            if region_rva <= rva and rva + size <= region_rva + end - start:
+                return self.data[start + rva - region_rva:start + rva - region_rva + size]
+        raise FridAsyncException(f"RVA {rva:#x} (+{size}) is not backed by data in '{self.path.name}'")
+
+
+@dataclasses.dataclass
+class PatchPlanEntry:
+    """The offline resolution of a single patch target pattern."""
+
+    name: str
+    module_name: str
+    target_pattern: str
+    offset: Optional[int] = None
+    expected_bytes: Optional[str] = None
+    matches: int = 0
+
+    @property
+    def resolved(self) -> bool:
+        """Return whether the pattern matched exactly once, as Patch._find requires."""
+        return self.matches == 1
+
+
+@dataclasses.dataclass
+class PatchPlan:
+    """Precomputed module-relative patch targets for one build of a module."""
+
+    module_name: str
+    module_sha256: str
+    size_of_image: int
+    timestamp: int
+    entries: dict[str, PatchPlanEntry]
+
+    @property
+    def ok(self) -> bool:
+        """Return whether every patch target resolved uniquely."""
+        return all(e.resolved for e in self.entries.values())
+
+    def offset(self, name: str) -> Optional[int]:
+        """Return the resolved offset for patch name, or None if it isn't planned/resolved."""
+        entry = self.entries.get(name, None)
+        return entry.offset if entry and entry.resolved else None
+
+    def save(self, path: Union[str, pathlib.Path]):
+        """Write the plan as json to path."""
+        pathlib.Path(path).write_text(json.dumps(dataclasses.asdict(self), indent=2), encoding="utf8")
+
+    @classmethod
+    def load(cls, path: Union[str, pathlib.Path]) -> "PatchPlan":
+        """Read a plan written by save from path."""
+        d = json.loads(pathlib.Path(path).read_text(encoding="utf8"))
+        d["entries"] = {name: PatchPlanEntry(**e) for name, e in d["entries"].items()}
+        return cls(**d)
+
+
+def resolve_patch_plan(module_path: Union[str, pathlib.Path], signatures: dict[str, str],
+                       module_name: str = None) -> PatchPlan:
+    """Resolve {patch name: target pattern} against the PE file at module_path in a single pass."""
+    module_path = pathlib.Path(module_path)
+    module_name = module_name if module_name else module_path.name
+    names = list(signatures)
+    patterns = [BytePattern.parse(signatures[name]) for name in names]
+    matcher = MultiPatternMatcher(patterns)
+    with PEModule(module_path) as pe:
+        hits = pe.scan(matcher)
+        entries = {}
+        for i, name in enumerate(names):
+            entry = PatchPlanEntry(name, module_name, signatures[name], matches=len(hits[i]))
+            if entry.resolved:
+                entry.offset = hits[i][0]
+                entry.expected_bytes = pe.read_rva(entry.offset, len(patterns[i])).hex(" ").upper()
+            else:
+                logger.warning(f"Patch '{name}' pattern '{signatures[name]}' matched {entry.matches} times "
+                               f"in '{module_path.name}', pattern must be unique")
+            entries[name] = entry
+        return PatchPlan(module_name, pe.sha256(), pe.size_of_image, pe.timestamp, entries)
@@ -0,0 +1,138 @@
+"""Defines an in-memory cache for fridajs sources (scripts and templates) validated by file mtime/size and hash."""
+import dataclasses
+import hashlib
+import os
+import pathlib
+from typing import Callable, Union
+
+import aiopath
+import jinja2
+import jinja2.meta
+
+from loguru import logger
+
+from .exceptions import FridAsyncException
+
+
+@dataclasses.dataclass
+class FridaJSSource:
+    """Holds the cached text of a fridajs source file and the file state it was read at."""
+
+    path: pathlib.Path
+    text: str
+    digest: str
+    mtime_ns: int
+    size: int
+
+
+def _digest(text: str) -> str:
+    """Return the content hash used to decide whether a source has really changed."""
+    return hashlib.blake2b(text.encode("utf8"), digest_size=16).hexdigest()
+
+
+class FridaJSSourceCache:
+    """Caches fridajs sources in memory so they are only re-read from disk when they have changed."""
+
+    def __init__(self):
+        """Initialise an empty source cache."""
+        self._sources: dict[pathlib.Path, FridaJSSource] = {}
+
+    def __contains__(self, path) -> bool:
+        """Return whether there is a cached source for path."""
+        return pathlib.Path(path) in self._sources
+
+    def _store(self, path: pathlib.Path, text: str, st: os.stat_result) -> FridaJSSource:
+        source = FridaJSSource(path, text, _digest(text), st.st_mtime_ns, st.st_size)
+        self._sources[path] = source
+        return source
+
+    def peek(self, path) -> Union[FridaJSSource, None]:
+        """Return the cached source for path without touching the filesystem."""
+        return self._sources.get(pathlib.Path(path), None)
+
+    def get(self, path) -> FridaJSSource:
+        """Return the source for path, reading it (synchronously) only if it is not cached yet."""
+        path = pathlib.Path(path)
+        if (source := self._sources.get(path, None)) is None:
+            st = path.stat()
+            source = self._store(path, path.read_text(encoding="utf8"), st)
+        return source
+
+    async def aget(self, path) -> FridaJSSource:
+        """Return the source for path, (async) re-reading it only if its mtime/size differ from the cached copy."""
+        js_path: aiopath.AsyncPath = aiopath.AsyncPath(path)
+        if not await js_path.exists():
+            logger.error(f"Can't load js from non-existent path '{path}'")
+            raise FridAsyncException(f"Can't load js from non-existent path '{path}'")
+        path = pathlib.Path(path)
+        st = await js_path.stat()
+        source = self._sources.get(path, None)
+        if source is None or (source.mtime_ns, source.size) != (st.st_mtime_ns, st.st_size):
+            source = self._store(path, await js_path.read_text(encoding="utf8"), st)
+        return source
+
+    def refresh(self, path) -> bool:
+        """Revalidate path against the filesystem, returning True if its content has changed."""
+        path = pathlib.Path(path)
+        source = self._sources.get(path, None)
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return False
+        if source is not None and (source.mtime_ns, source.size) == (st.st_mtime_ns, st.st_size):
+            return False
+        old_digest = source.digest if source else None
+        # editors like to touch files without changing them, so only the content hash counts as a change
+        return self._store(path, path.read_text(encoding="utf8"), st).digest != old_digest
+
+    def invalidate(self, path):
+        """Keep the cached text of path but forget its file state, so the next refresh reports it as changed again."""
+        path = pathlib.Path(path)
+        if (source := self._sources.get(path, None)) is not None:
+            self._sources[path] = dataclasses.replace(source, digest="", mtime_ns=-1, size=-1)
+
+    def refresh_all(self, extra_paths=()) -> list[pathlib.Path]:
+        """Revalidate all cached sources (and any extra_paths), returning the paths whose content changed."""
+        paths = set(self._sources) | {pathlib.Path(p) for p in extra_paths}
+        return sorted(p for p in paths if self.refresh(p))
+
+
+class FridaJSTemplateLoader(jinja2.BaseLoader):
+    """Loads fridajs templates through a FridaJSSourceCache instead of stat'ing the file on every get_template."""
+
+    def __init__(self, searchpath, cache: FridaJSSourceCache):
+        """Initialise a loader for templates in searchpath, cached in cache."""
+        self._searchpath = pathlib.Path(searchpath)
+        self._cache = cache
+
+    @property
+    def searchpath(self) -> pathlib.Path:
+        """Return the directory templates are loaded from."""
+        return self._searchpath
+
+    def get_source(self, environment: jinja2.Environment, template: str) -> tuple[str, str, Callable[[], bool]]:
+        """Return the cached template source, with an uptodate check that compares hashes in memory."""
+        path = self._searchpath / template
+        if path not in self._cache and not path.is_file():
+            raise jinja2.TemplateNotFound(template)
+        source = self._cache.get(path)
+        digest = source.digest
+        return source.text, str(path), lambda: self._cache.peek(path).digest == digest
+
+    def list_templates(self) -> list[str]:
+        """Return the names of the templates in searchpath."""
+        return sorted(p.name for p in self._searchpath.glob("*.js"))
+
+
+def find_dependent_templates(env: jinja2.Environment, changed: set[str]) -> set[str]:
+    """Return the changed templates plus every template that (transitively) extends or includes one of them."""
+    references = {}
+    for name in env.list_templates():
+        source = env.loader.get_source(env, name)[0]
+        references[name] = set(jinja2.meta.find_referenced_templates(env.parse(source)))
+    dependent = set(changed)
+    while True:
+        more = {name for name, refs in references.items() if refs & dependent} - dependent
+        if not more:
+            return dependent
+        dependent |= more
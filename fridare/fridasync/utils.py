@@ -1,15 +1,28 @@
 """Defines some fridasync utility coroutines."""
-import aiopath
+import contextlib
+import time
 
-from loguru import logger
-
-from .exceptions import FridAsyncException
+from . import fridajs_sources
 
 
 async def load_js_from_file(path: str):
-    """Load javascript from a specified file path with aiopath."""
-    js_path: aiopath.AsyncPath = aiopath.AsyncPath(path)
-    if not await js_path.exists():
-        logger.error(f"Can't load js from non-existent path '{path}'")
-        raise FridAsyncException(f"Can't load js from non-existent path '{path}'")
-    return await js_path.read_text(encoding="utf8")
+    """Load javascript from a specified file path, via the in-memory fridajs source cache."""
+    source = await fridajs_sources.aget(path)
+    return source.text
+
+
+class StageTimer:
+    """Accumulates wall clock milliseconds per named stage."""
+
+    def __init__(self):
+        """Initialise an empty set of stage timings."""
+        self.stages: dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Time the body of a with block as stage name."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - t0) * 1000
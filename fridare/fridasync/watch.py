@@ -0,0 +1,117 @@
+"""Delivers memory write watch events from the _fridasync_watch.js agent script to async subscribers."""
+import contextlib
+import dataclasses
+from typing import Optional
+
+import frida
+import trio
+
+from loguru import logger
+
+
+@dataclasses.dataclass
+class WatchEvent:
+    """A change of a watched value, seen by the agent at time (ms since the epoch)."""
+
+    name: str
+    old: object
+    value: object
+    time: float
+
+
+class FAsyncWatcher:
+    """Wraps the _fridasync_watch.js script of a session, fanning out its change messages to subscribers."""
+
+    def __init__(self, target: str, script: frida.core.Script, trio_token: trio.lowlevel.TrioToken):
+        """Wrap the loaded watch script, whose messages are delivered back into trio via trio_token."""
+        self._target = target
+        self._script = script
+        self._trio_token = trio_token
+        # [(names or None for all, send channel)]
+        self._subscribers: list[tuple[Optional[set[str]], trio.MemorySendChannel]] = []
+        self.values: dict[str, object] = {}
+        self.dropped = 0
+        self.closed = False
+
+    def on_message(self, message, data):
+        """Handle a frida script message (in a frida thread), passing watch changes into trio."""
+        if message["type"] == "send" and message["payload"].get("type", None) == "watch":
+            self._trio_token.run_sync_soon(self._dispatch, message["payload"])
+        else:
+            logger.bind(target=self._target, script="_fridasync_watch.js").info(
+                f"[{self._target}:_fridasync_watch.js]: {message}, data: '{data}'")
+
+    def _dispatch(self, payload: dict):
+        """Send the changes of a watch message to every interested subscriber, without waiting on any of them."""
+        for change in payload["changes"]:
+            event = WatchEvent(change["name"], change["old"], change["value"], payload["time"])
+            self.values[event.name] = event.value
+            for names, send_channel in self._subscribers:
+                if names is not None and event.name not in names:
+                    continue
+                try:
+                    send_channel.send_nowait(event)
+                except trio.WouldBlock:
+                    # a slow subscriber loses events rather than holding up the others
+                    self.dropped += 1
+                    logger.warning(f"Watch subscriber is full, dropped '{event.name}' change in '{self._target}'")
+                except trio.BrokenResourceError:
+                    pass
+
+    async def add(self, name: str, address: str, type_: str) -> object:
+        """Watch the type_ value at address as name, returning its current value."""
+        value = await trio.to_thread.run_sync(self._script.exports.add, name, address, type_)
+        self.values[name] = value
+        logger.debug(f"Watching '{name}' ({type_} @ {address}) in '{self._target}', currently {value}")
+        return value
+
+    async def remove(self, name: str) -> bool:
+        """Stop watching name."""
+        self.values.pop(name, None)
+        return await trio.to_thread.run_sync(self._script.exports.remove, name)
+
+    async def set_min_interval(self, ms: int):
+        """Set how long the agent waits after an access before re-checking values and re-arming pages."""
+        await trio.to_thread.run_sync(self._script.exports.set_min_interval, ms)
+
+    def stats(self) -> dict:
+        """Return the agent side watch, page, access and change counters."""
+        return self._script.exports.stats()
+
+    def close(self):
+        """End every subscription, so subscribers see the end of their channel, e.g. once the session detached."""
+        self.closed = True
+        for _, send_channel in self._subscribers:
+            send_channel.close()
+        self._subscribers.clear()
+
+    async def dispose(self):
+        """Stop every watch and unload the watch script, ending every subscription."""
+        self.close()
+        self.values.clear()
+        try:
+            await trio.to_thread.run_sync(self._script.exports.dispose)
+            await trio.to_thread.run_sync(self._script.unload)
+        except frida.InvalidOperationError:
+            # the session already detached, taking the script with it
+            pass
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, names: list[str] = None, buffer: int = 256):
+        """Yield a receive channel of WatchEvents for names (all watches if None) until the with block exits.
+
+        The channel ends when the watcher is closed, e.g. when the game exits.
+        """
+        send_channel, receive_channel = trio.open_memory_channel(buffer)
+        subscriber = (set(names) if names is not None else None, send_channel)
+        if self.closed:
+            send_channel.close()
+        else:
+            self._subscribers.append(subscriber)
+        try:
+            async with receive_channel:
+                yield receive_channel
+        finally:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+            await send_channel.aclose()
@@ -0,0 +1,113 @@
+"""Keeps in memory latency histograms and throughput counters of web app requests, for the /api/metrics view."""
+import bisect
+import collections
+import time
+
+
+# request latency bucket upper bounds in ms, roughly logarithmic like the default prometheus buckets
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Counts latencies into fixed buckets, so quantiles can be estimated without keeping every sample."""
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS_MS):
+        """Initialise an empty histogram with bucket upper bounds (ms), plus an overflow bucket."""
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        """Count a latency of ms."""
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float) -> float:
+        """Estimate quantile q (0-1) by interpolating within the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            if n and cumulative + n >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                # the overflow bucket has no upper bound, the max seen is the best guess at one
+                upper = self.bounds[i] if i < len(self.bounds) else self.max_ms
+                return lower + (upper - lower) * (rank - cumulative) / n
+            cumulative += n
+        return self.max_ms
+
+    def snapshot(self) -> dict:
+        """Return the counts, mean and estimated quantiles as a dict."""
+        return {"count": self.count, "mean_ms": self.sum_ms / self.count if self.count else 0.0,
+                "max_ms": self.max_ms, "p50_ms": self.quantile(0.5), "p90_ms": self.quantile(0.9),
+                "p99_ms": self.quantile(0.99),
+                "buckets": {f"le_{b}": n for b, n in zip([*self.bounds, "inf"], self.counts)}}
+
+
+class RouteStats:
+    """The latency histogram, status and byte counters of one route."""
+
+    def __init__(self):
+        """Initialise empty stats."""
+        self.latency = LatencyHistogram()
+        self.statuses: collections.Counter = collections.Counter()
+        self.bytes = 0
+
+    def snapshot(self) -> dict:
+        """Return the stats as a dict."""
+        return {**self.latency.snapshot(), "statuses": {str(k): v for k, v in sorted(self.statuses.items())},
+                "bytes": self.bytes}
+
+
+class RequestMetrics:
+    """Per route latency histograms and throughput of the requests served, fed by LoguruHypercornProxy.access."""
+
+    def __init__(self, window: int = 60):
+        """Initialise empty metrics, measuring throughput over the last window seconds."""
+        self.window = window
+        self.routes: dict[tuple[str, str], RouteStats] = collections.defaultdict(RouteStats)
+        self.started = time.time()
+        self.requests = 0
+        self.bytes = 0
+        # [second, requests, bytes] of each whole second with requests in the last window seconds
+        self._seconds: collections.deque = collections.deque()
+
+    def record(self, method: str, route: str, status: int, ms: float, nbytes: int):
+        """Record a served request."""
+        stats = self.routes[(method, route)]
+        stats.latency.observe(ms)
+        stats.statuses[status] += 1
+        stats.bytes += nbytes
+        self.requests += 1
+        self.bytes += nbytes
+        now = int(time.time())
+        if self._seconds and self._seconds[-1][0] == now:
+            self._seconds[-1][1] += 1
+            self._seconds[-1][2] += nbytes
+        else:
+            self._seconds.append([now, 1, nbytes])
+        self._expire(now)
+
+    def _expire(self, now: int):
+        while self._seconds and self._seconds[0][0] <= now - self.window:
+            self._seconds.popleft()
+
+    def throughput(self) -> dict:
+        """Return the mean requests and bytes per second over the last window seconds."""
+        self._expire(int(time.time()))
+        # the first window after startup is shorter than the window
+        seconds = max(min(self.window, time.time() - self.started), 1)
+        return {"window_s": self.window, "requests_per_s": sum(s[1] for s in self._seconds) / seconds,
+                "bytes_per_s": sum(s[2] for s in self._seconds) / seconds}
+
+    def snapshot(self) -> dict:
+        """Return every counter, the throughput and each route's stats as a dict."""
+        return {"uptime_s": time.time() - self.started, "requests": self.requests, "bytes": self.bytes,
+                "throughput": self.throughput(),
+                "routes": {f"{method} {route}": stats.snapshot()
+                           for (method, route), stats in sorted(self.routes.items())}}
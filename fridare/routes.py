@@ -1,13 +1,16 @@
 """Defines routes for FRIDARE."""
 # TODO: separate fridrwr routes out into blueprint
+import trio
 from loguru import logger
 
 from quart import g, session, request
 from quart import render_template, abort, flash, redirect, url_for
-from quart import websocket
+from quart import websocket, send_from_directory
 
-from . import app, fa
+from . import app, fa, trace_recorder, request_metrics
 from . import db_connect
+from .db import query_logs
+from .fridasync.logging import ROUTE_SCOPE_KEY
 
 
 def get_db():
@@ -17,13 +20,32 @@ def get_db():
     return g.fridare_db
 
 
+@app.before_request
+def _tag_request_route():
+    """Put the matched url rule in the request scope, so the access log aggregates metrics by route."""
+    if request.url_rule is not None:
+        request.scope[ROUTE_SCOPE_KEY] = request.url_rule.rule
+
+
 def _log_request_view():
     """Log access data for current context request."""
-    # logger.debug(dir(request))
+    # the access log has the timing and outcome of every request, this only marks which view handled it
     r = request
-    logger.info(f"Processing [HTTP{r.http_version}:{r.endpoint}]'{r.url}' request from '{r.remote_addr}'...")
-    logger.debug(f"{r.is_secure=} {r.authorization=} {r.cookies=}")
-    # logger.debug(f"{r.access_control_request_headers=}")
+    logger.debug(f"Processing [HTTP{r.http_version}:{r.endpoint}]'{r.path}' request...")
+
+
+def _session_stats(fasession) -> dict:
+    """Gather the live stats of fasession shown by the index, all blocking rpcs so call it in a bg thread."""
+    if not fasession.init_complete:
+        return {}
+    stats = {"debugger_attached": fasession.debugger_attached, "allocator": {}, "garbage": None}
+    if fasession.allocator:
+        stats["allocator"] = fasession.allocator_stats
+        stats["garbage"] = fasession.garbage_report(stats["allocator"])
+        stats["frida_heap_size"] = stats["garbage"]["frida_heap_size"]
+    else:
+        stats["frida_heap_size"] = fasession.frida_heap_size
+    return stats
 
 
 @app.route("/")
@@ -31,7 +53,10 @@ async def index_view():
     """Render the index/home view."""
     _log_request_view()
     # logger.info(f"Serving '{request.host_url}' to '{request.remote_addr}' [{request.user_agent}]...")
-    return await render_template("index.html", title="Index", fa=fa)
+    # the stats take rpcs to the target, they are gathered off the trio thread rather than while rendering
+    sessions = [(fasession, await trio.to_thread.run_sync(_session_stats, fasession))
+                for fasession in list(fa.sessions.values())]
+    return await render_template("index.html", title="Index", fa=fa, sessions=sessions)
 
 
 @app.route("/fridrwr")
@@ -41,3 +66,77 @@ async def fridrwr_view():
     # logger.info(f"Serving '{request.host_url}' to '{request.remote_addr}' [{request.user_agent}]...")
     rwr_session = fa.sessions.get("rwr_game.exe", None)
     return await render_template("fridrwr.html", title="RWR", rwr_session=rwr_session)
+
+
+@app.route("/trace")
+async def trace_view():
+    """Render the trio trace recording view."""
+    _log_request_view()
+    return await render_template("trace.html", title="Trace", recorder=trace_recorder,
+                                 max_seconds=app.config["TRACE_MAX_SECONDS"])
+
+
+@app.route("/trace/record", methods=["POST"])
+async def trace_record_view():
+    """Start recording a trio trace in the background for the posted number of seconds."""
+    _log_request_view()
+    form = await request.form
+    try:
+        seconds = float(form.get("seconds", 5))
+    except ValueError:
+        abort(400)
+    if not 0 < seconds <= app.config["TRACE_MAX_SECONDS"]:
+        abort(400)
+    # reserved here rather than in the background task, or a second request could start one before it runs
+    if trace_recorder.reserve():
+        app.add_background_task(trace_recorder.record, seconds, reserved=True)
+    return redirect(url_for("trace_view"))
+
+
+@app.route("/trace/<string:filename>")
+async def trace_download_view(filename: str):
+    """Download a recorded trace file."""
+    _log_request_view()
+    if filename not in (p.name for p in trace_recorder.traces()):
+        abort(404)
+    return await send_from_directory(trace_recorder.trace_dir, filename, as_attachment=True)
+
+
+async def _query_request_logs():
+    """Query the log store with filters from the current request args, off the trio loop."""
+    args = request.args
+    try:
+        min_level = logger.level(args["level"]).no if args.get("level") else None
+        before_id = int(args["before"]) if args.get("before") else None
+        limit = min(int(args.get("limit", 100)), 1000)
+    except ValueError:
+        abort(400)
+    return await trio.to_thread.run_sync(
+        lambda: query_logs(app.config["LOG_STORE_PATH"], min_level=min_level, target=args.get("target"),
+                           script=args.get("script"), search=args.get("q"), before_id=before_id, limit=limit))
+
+
+@app.route("/logs")
+async def logs_view():
+    """Render a page of the log store, filtered by the request args."""
+    _log_request_view()
+    records = await _query_request_logs()
+    # the args for the next (older) page keep the filters and move the keyset cursor
+    older_args = {**request.args.to_dict(), "before": records[-1]["id"]} if records else None
+    return await render_template("logs.html", title="Logs", records=records, args=request.args,
+                                 older_args=older_args)
+
+
+@app.route("/api/logs")
+async def logs_api_view():
+    """Return a page of the log store as json, filtered by the request args."""
+    records = await _query_request_logs()
+    return {"records": records, "before": records[-1]["id"] if records else None}
+
+
+@app.route("/api/metrics")
+async def metrics_api_view():
+    """Return the request latency histograms and throughput, and the background job metrics, as json."""
+    return {"requests": request_metrics.snapshot(),
+            "jobs": {"fridasync": fa.scheduler.metrics(),
+                     **{s.target: s.scheduler.metrics() for s in fa.sessions.values()}}}
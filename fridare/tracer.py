@@ -1,4 +1,9 @@
-"""Defines a trio tracing instrument that logs via loguru."""
+"""Defines trio tracing instruments that log via loguru or record Chrome trace-event data."""
+import datetime
+import json
+import pathlib
+import time
+
 import trio
 from loguru import logger
 
@@ -80,3 +85,174 @@ class TracerInstrument(trio.abc.Instrument):
     def after_run(self):
         """Log after trio finishes running a cacophony of tasks."""
         logger.log(TRIO_TRACE_LVL.name, "📢  Finished async magic")
+
+
+# Chrome trace event kinds recorded by ChromeTraceInstrument
+TRACE_SPAWN, TRACE_STEP_BEGIN, TRACE_STEP_END, TRACE_EXIT, TRACE_IO_BEGIN, TRACE_IO_END = range(6)
+# Task steps and io waits are paired begin/end events, spawn and exit are instants
+_TRACE_BEGINS = (TRACE_STEP_BEGIN, TRACE_IO_BEGIN)
+_TRACE_ENDS = (TRACE_STEP_END, TRACE_IO_END)
+# The io wait lane in the trace, tasks get tids from 1 upwards
+_IO_WAIT_TID = 0
+
+
+class ChromeTraceInstrument(trio.abc.Instrument):
+    """Records trio scheduler events into a preallocated buffer, exported later as Chrome trace-event json.
+
+    The hooks only write three ints into preallocated lists, all formatting happens in write_chrome_trace once
+    recording has stopped. Events beyond capacity are counted as dropped rather than growing the buffer.
+    """
+
+    def __init__(self, capacity: int):
+        """Preallocate a buffer for capacity events."""
+        self._capacity = capacity
+        self._kinds = [0] * capacity
+        self._times = [0] * capacity
+        self._tids = [0] * capacity
+        self._n = 0
+        self.dropped = 0
+        # begin/end events left out of the export for want of their other half
+        self.unpaired = 0
+        self._task_tids = {}
+        self._task_names = {_IO_WAIT_TID: "trio io wait"}
+
+    @property
+    def recorded(self) -> int:
+        """Return the number of events recorded."""
+        return self._n
+
+    def _tid(self, task) -> int:
+        # tasks that were spawned before recording started get a lane the first time they are seen
+        tid = self._task_tids.get(task, None)
+        if tid is None:
+            tid = self._task_tids[task] = len(self._task_tids) + 1
+            self._task_names[tid] = task.name
+        return tid
+
+    def _record(self, kind: int, tid: int):
+        n = self._n
+        if n < self._capacity:
+            self._kinds[n] = kind
+            self._times[n] = time.perf_counter_ns()
+            self._tids[n] = tid
+            self._n = n + 1
+        else:
+            self.dropped += 1
+
+    def task_spawned(self, task):
+        """Record when a task is spawned."""
+        self._record(TRACE_SPAWN, self._tid(task))
+
+    def before_task_step(self, task):
+        """Record the start of a task step."""
+        self._record(TRACE_STEP_BEGIN, self._tid(task))
+
+    def after_task_step(self, task):
+        """Record the end of a task step."""
+        self._record(TRACE_STEP_END, self._tid(task))
+
+    def task_exited(self, task):
+        """Record when a task exits."""
+        self._record(TRACE_EXIT, self._tid(task))
+
+    def before_io_wait(self, timeout):
+        """Record the start of an io wait."""
+        self._record(TRACE_IO_BEGIN, _IO_WAIT_TID)
+
+    def after_io_wait(self, timeout):
+        """Record the end of an io wait."""
+        self._record(TRACE_IO_END, _IO_WAIT_TID)
+
+    def chrome_trace_events(self) -> list[dict]:
+        """Convert the recorded buffer to a list of Chrome trace events.
+
+        Each task step and io wait is paired into a complete ("X") event. Recording starts and stops partway through
+        a step, and events beyond capacity are dropped, so the halves that have no pair are left out and counted in
+        unpaired rather than shown as bogus or unbounded slices.
+        """
+        events = [{"name": "process_name", "ph": "M", "pid": 1, "tid": 0, "args": {"name": "fridrwr trio"}}]
+        for tid, name in self._task_names.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}})
+        t0 = self._times[0] if self._n else 0
+        # tid -> buffer index of the begin of its step (or io wait) in progress
+        begins = {}
+        self.unpaired = 0
+        for i in range(self._n):
+            kind, tid = self._kinds[i], self._tids[i]
+            name = "io wait" if tid == _IO_WAIT_TID else self._task_names[tid]
+            if kind in _TRACE_BEGINS:
+                if tid in begins:
+                    self.unpaired += 1
+                begins[tid] = i
+            elif kind in _TRACE_ENDS:
+                begin = begins.pop(tid, None)
+                if begin is None:
+                    self.unpaired += 1
+                    continue
+                events.append({"name": name, "ph": "X", "ts": (self._times[begin] - t0) / 1000,
+                               "dur": (self._times[i] - self._times[begin]) / 1000, "pid": 1, "tid": tid})
+            else:
+                name = f"spawn {name}" if kind == TRACE_SPAWN else f"exit {name}"
+                events.append({"name": name, "ph": "i", "s": "t", "ts": (self._times[i] - t0) / 1000, "pid": 1,
+                               "tid": tid})
+        self.unpaired += len(begins)
+        return events
+
+    def write_chrome_trace(self, path: pathlib.Path):
+        """Write the recorded events to path as Chrome trace-event json (opens in chrome://tracing or Perfetto)."""
+        trace = {"traceEvents": self.chrome_trace_events(), "displayTimeUnit": "ms",
+                 "otherData": {"recorded": self._n, "dropped": self.dropped, "unpaired": self.unpaired}}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf8") as f:
+            json.dump(trace, f)
+
+
+class TraceRecorder:
+    """Records bounded windows of trio scheduler activity, one at a time, into Chrome trace files."""
+
+    def __init__(self, trace_dir: pathlib.Path, capacity: int):
+        """Initialise a TraceRecorder that writes traces into trace_dir."""
+        self.trace_dir = trace_dir
+        self.capacity = capacity
+        self.recording = False
+        self.last_trace = None
+
+    def traces(self) -> list[pathlib.Path]:
+        """Return the recorded trace files, newest first."""
+        if not self.trace_dir.exists():
+            return []
+        return sorted(self.trace_dir.glob("*.json"), reverse=True)
+
+    def reserve(self) -> bool:
+        """Claim the recorder for a recording, returning False if a trace is already being (or about to be) recorded.
+
+        It is synchronous, so a request can claim the recorder before the recording starts in a background task.
+        """
+        if self.recording:
+            return False
+        self.recording = True
+        return True
+
+    async def record(self, seconds: float, reserved: bool = False) -> pathlib.Path:
+        """Record scheduler events for seconds, then write them to a trace file off the trio loop.
+
+        Pass reserved=True if the recorder was already claimed with reserve().
+        """
+        if not reserved and not self.reserve():
+            raise RuntimeError("A trace is already being recorded")
+        try:
+            instrument = ChromeTraceInstrument(self.capacity)
+            logger.info(f"Recording trio trace for {seconds} seconds...")
+            trio.lowlevel.add_instrument(instrument)
+            try:
+                await trio.sleep(seconds)
+            finally:
+                trio.lowlevel.remove_instrument(instrument)
+            path = self.trace_dir / f"trio-trace-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+            await trio.to_thread.run_sync(instrument.write_chrome_trace, path)
+            logger.success(f"Wrote trio trace of {instrument.recorded} events "
+                           f"({instrument.dropped} dropped, {instrument.unpaired} unpaired) to '{path}'")
+            self.last_trace = path
+            return path
+        finally:
+            self.recording = False
@@ -1,18 +1,33 @@
-"""FRIDRWR app constructor."""
+"""FRIDRWR app constructor.
+
+Usage:
+    fridrwr.py
+    fridrwr.py plan <rwr_game_exe> [-o <plan_json>]
+    fridrwr.py sig <rwr_game_exe> <rva>... [-m <min_length>] [-r]
+
+Options:
+    -o <plan_json>   Where to write the patch plan, by default next to fridrwr.py where sessions load it from
+    -m <min_length>  The shortest pattern wanted, at least 5 for a jmp patch target [default: 5]
+    -r               Wildcard relocated operands (absolute addresses), so patterns survive rebasing
+"""
+import functools
 import pathlib
 import sys
+import time
 
 import frida
 import trio
 import hypercorn
 import hypercorn.trio
 
-from typing import Optional
+from typing import Optional, Union
 
+from docopt import docopt
 from loguru import logger
 
-from fridare import fa, app, TracerInstrument
-from fridare.fridasync import FridAsyncException, FAsyncSession, PatchBuilder, PatchVarSpec
+from fridare import fa, app, request_metrics, TracerInstrument, LogStore, CaptureStore
+from fridare.fridasync import FAsyncSession, FridAsyncException, PatchBuilder, PatchVarSpec
+from fridare.fridasync import PatchPlan, resolve_patch_plan, CaptureSpec, SignatureIndex
 from fridare.fridasync.logging import LoguruHypercornProxy
 
 # this magic allows for Ctrl+C to PyCharm run console to be handled nicely
@@ -22,8 +37,10 @@ except ImportError:
     pass
 
 SCRIPT_DIR = pathlib.Path(__file__).parent
+PATCH_PLAN_PATH = SCRIPT_DIR / "rwr_game_patch_plan.json"
 
 
+anti_fog_pattern = "D9 44 24 08 D9 59 4C D9 44 24 04 D9 59 50"
 anti_fog_range_var = PatchVarSpec("range", "float", 4, "600.0")
 anti_fog_offset_var = PatchVarSpec("offset", "float", 4, "-100.0")
 anti_fog_patch_cw_func = """
@@ -44,66 +61,135 @@ cw.putBytes([0x50]);
 cw.flush();
 """
 
+# the target patterns of every fridrwr patch in rwr_game.exe, resolved offline by `fridrwr.py plan`
+FRIDRWR_SIGNATURES = {"anti_fog": anti_fog_pattern}
 
-async def fridrwr_manage_session(game: FAsyncSession):
-    """Manage a FAsyncSession 'game' that is targeting a RWR client game."""
+# functions whose arguments/return values are recorded in every managed session, e.g.
+# CaptureSpec("fog_update", "rwr_game.exe", anti_fog_pattern, [CaptureField("this", "pointer", "ecx"),
+#             CaptureField("range", "float", 0)], pattern_offset=<offset of the function start from the match>)
+FRIDRWR_CAPTURES: list[CaptureSpec] = []
 
-    logger.debug("Creating anti fog patch...")
-    anti_fog_patch = await game.create_jmp_patch("anti_fog", "rwr_game.exe",
-                                                 "D9 44 24 08 D9 59 4C D9 44 24 04 D9 59 50",
-                                                 [anti_fog_range_var, anti_fog_offset_var],
-                                                 False, 32, 14, anti_fog_patch_cw_func)
-    logger.success(f"Created anti fog patch: {anti_fog_patch}")
+# how often to look for the game when there is no session with it
+FRIDRWR_ATTACH_INTERVAL = 15
+# how many times a failed setup of a new session is retried (backing off) before it is left to the web UI
+FRIDRWR_MANAGE_RETRIES = 5
+
+
+async def fridrwr_manage_session(game: FAsyncSession):
+    """Manage a FAsyncSession 'game' that is targeting a RWR client game.
+
+    Run as a retried job, so a rerun only does what a failed run didn't get to.
+    """
+    if PATCH_PLAN_PATH.exists():
+        # resolved targets only need verifying in the game rather than scanning all of rwr_game.exe for them
+        await game.load_patch_plan(PatchPlan.load(PATCH_PLAN_PATH))
+
+    if "anti_fog" not in game.patches:
+        logger.debug("Creating anti fog patch...")
+        await game.create_jmp_patch("anti_fog", "rwr_game.exe", anti_fog_pattern,
+                                    [anti_fog_range_var, anti_fog_offset_var],
+                                    False, 32, 14, anti_fog_patch_cw_func)
+        logger.success(f"Created anti fog patch: {game.patches['anti_fog']}")
+    anti_fog_patch = game.patches["anti_fog"]
 
     # logger.debug(f"{game=}\n{game.scripts=}\n{game.patches=}")
     # apply the following patches by default in the managed session
-    await anti_fog_patch.apply()
-    if anti_fog_patch.applied:
+    if not anti_fog_patch.applied:
+        await anti_fog_patch.apply()
+        if not anti_fog_patch.applied:
+            raise FridAsyncException("Anti fog patch failed to apply")
         logger.success("Applied anti fog patch")
 
+    for spec in FRIDRWR_CAPTURES:
+        if spec.name not in game.captures:
+            await game.create_capture(spec)
+
+
+async def fridrwr_attach(target: str = "rwr_game.exe"):
+    """Attempt creation of a target session and manage it if created successfully, unless there already is one."""
+    if target in fa.sessions:
+        # nothing to do until the game exits and frida tells us the session detached
+        return
+    logger.debug(f"FRIDRWR creating session for '{target}'... ")
+    try:
+        game = await fa.create_session(target)
+    except frida.ProcessNotFoundError:
+        logger.warning(f"FRIDRWR target '{target}' process not found, retry in {FRIDRWR_ATTACH_INTERVAL} seconds... :)")
+        return
+    if game:
+        logger.success(f"We have a rwr_game session with pid '{game.pid}'!")
+        # managed in the session's own scheduler, retried on failure (the session is already in fa.sessions, so
+        # fridrwr_attach won't come back to it) and cancelled if the game exits
+        game.scheduler.once("fridrwr_manage", functools.partial(fridrwr_manage_session, game),
+                            timeout=FRIDRWR_ATTACH_INTERVAL * 4, retries=FRIDRWR_MANAGE_RETRIES)
+
 
 async def fridrwr_setup():
-    """Attempt creation of "rwr_game.exe" session and manage if created successfully."""
+    """Attach to "rwr_game.exe" whenever it is running, clearing applied patches when FRIDRWR is cancelled."""
     target = "rwr_game.exe"
-    game = None
-    while True:
-        try:
-            if target not in fa.sessions:
-                logger.debug(f"FRIDRWR creating session for '{target}'... ")
-                game = await fa.create_session(target)
-                if game:
-                    logger.success(f"We have a rwr_game session with pid '{game.pid}'!")
-                    await fridrwr_manage_session(game)
-            else:
-                # wait some time before checking again...
-                await trio.sleep(15)
-        except FridAsyncException as e:
-            logger.error(f"FRIDRWR setup! fridasync exception: {e}")
-            break
-        except frida.ProcessNotFoundError as e:
-            logger.warning(f"FRIDRWR target '{target}' process not found, wait 15 seconds and retry... :)")
-            await trio.sleep(15)
-        except trio.Cancelled:
-            g = fa.sessions.get(target, None)
-            if g:
-                # clear all patches from session so that target doesn't get memory access exception
-                # when frida has left but the edits to game memory at patch point still exist
-                logger.info("FRIDRWR setup cancelled, clearing applied patches...")
-                await g.clear_all_patches()
-            else:
-                logger.debug("FRIDRWR setup cancelled, no patches applied so nothing to clear :)")
-            raise
+    fa.scheduler.every("fridrwr_attach", functools.partial(fridrwr_attach, target), FRIDRWR_ATTACH_INTERVAL,
+                       jitter=1, timeout=FRIDRWR_ATTACH_INTERVAL * 4)
+    try:
+        await trio.sleep_forever()
+    except trio.Cancelled:
+        g = fa.sessions.get(target, None)
+        if g:
+            # clear all patches from session so that target doesn't get memory access exception
+            # when frida has left but the edits to game memory at patch point still exist
+            logger.info("FRIDRWR setup cancelled, clearing applied patches...")
+            await g.clear_all_patches()
+        else:
+            logger.debug("FRIDRWR setup cancelled, no patches applied so nothing to clear :)")
+        raise
 
 
 async def start_fridrwr_app(hypercorn_config: hypercorn.Config):
     """Open app server nursery that starts FRIDRWR and the web app server."""
     async with trio.open_nursery() as tn_app_server:
+        await tn_app_server.start(fa.serve)
         tn_app_server.start_soon(fridrwr_setup)
+        if app.config["FRIDAJS_HOT_RELOAD"]:
+            tn_app_server.start_soon(fa.hot_reload)
+        capture_store = CaptureStore(app.config["DATABASE"]) if app.config["CAPTURE_PERSIST"] else None
+        fa.drain_captures(app.config["CAPTURE_DRAIN_INTERVAL"], capture_store.write if capture_store else None)
         tn_app_server.start_soon(hypercorn.trio.serve, app, hypercorn_config)
 
 
+def plan_fridrwr_patches(rwr_game_exe: str, plan_path: Union[str, pathlib.Path]) -> bool:
+    """Resolve FRIDRWR_SIGNATURES against a rwr_game.exe file and write the patch plan to plan_path."""
+    logger.info(f"Resolving {len(FRIDRWR_SIGNATURES)} patch signatures in '{rwr_game_exe}'...")
+    plan = resolve_patch_plan(rwr_game_exe, FRIDRWR_SIGNATURES, module_name="rwr_game.exe")
+    for entry in plan.entries.values():
+        if entry.resolved:
+            logger.success(f"{entry.name}: rwr_game.exe+{entry.offset:#x} [{entry.expected_bytes}]")
+        else:
+            logger.error(f"{entry.name}: '{entry.target_pattern}' matched {entry.matches} times")
+    plan.save(plan_path)
+    logger.info(f"Wrote patch plan to '{plan_path}'")
+    return plan.ok
+
+
+def generate_fridrwr_signatures(rwr_game_exe: str, rvas: list[int], min_length: int, wildcard: bool) -> bool:
+    """Print the shortest unique target pattern for each rva in a rwr_game.exe file."""
+    t0 = time.perf_counter()
+    index = SignatureIndex.from_pe(rwr_game_exe, "rwr_game.exe", cache_dir=app.config["SIG_INDEX_DIR"])
+    t1 = time.perf_counter()
+    patterns = index.unique_patterns(rvas, min_length, wildcard)
+    t2 = time.perf_counter()
+    for rva, pattern in patterns.items():
+        if pattern:
+            logger.success(f"rwr_game.exe+{rva:#x}: \"{pattern.source}\" [{len(pattern)} bytes]")
+        else:
+            logger.error(f"rwr_game.exe+{rva:#x}: no unique pattern of up to {index.max_length} bytes")
+    logger.info(f"Index ready in {(t1 - t0) * 1000:.0f} ms, {len(rvas)} pattern(s) in {(t2 - t1) * 1000:.1f} ms")
+    return all(patterns.values())
+
+
 if __name__ == '__main__':
-    suppressed_task_names = ["__main__.start_fridrwr_app", "__main__.fridrwr_setup"]
+    args = docopt(__doc__)
+    suppressed_task_names = ["__main__.start_fridrwr_app", "__main__.fridrwr_setup",
+                             "fridare.fridasync.fridasync.FridAsync.hot_reload",
+                             "fridare.fridasync.fridasync.FridAsync.serve", "Scheduler("]
 
     # configure logging
     log_fmt_c = "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | " \
@@ -116,15 +202,32 @@ if __name__ == '__main__':
     logger.remove()
     logger.configure(handlers=[{"sink": sys.stderr, "format": log_fmt_c, "level": "TRIOINS"}])
     logger.add("fridrwr.log", format=log_fmt_f, level="DEBUG", retention="1 day", rotation="12 hours")
+    # also log into the indexed sqlite log store that backs the /logs view
+    log_store = LogStore(app.config["LOG_STORE_PATH"], app.config["LOG_STORE_MAX_RECORDS"],
+                         app.config["LOG_STORE_MAX_BYTES"]).start()
+    logger.add(log_store.sink, level="DEBUG")
     logger.level("INFO", icon="🔔")
     # enable the library logging for CLI mode
     logger.enable("fridare")
 
+    if args["plan"]:
+        # exit non-zero if any patch no longer resolves uniquely, so this doubles as a check for a new game build
+        sys.exit(0 if plan_fridrwr_patches(args["<rwr_game_exe>"], args["-o"] or PATCH_PLAN_PATH) else 1)
+
+    if args["sig"]:
+        rvas = [int(rva, 16) for rva in args["<rva>"]]
+        sys.exit(0 if generate_fridrwr_signatures(args["<rwr_game_exe>"], rvas, int(args["-m"]), args["-r"]) else 1)
+
     logger.info(f"Starting FRIDRWR...")
-    hypercorn_cfg = hypercorn.Config()
-    hypercorn_cfg.logger_class = LoguruHypercornProxy
-    hypercorn_cfg.bind = ["127.0.0.1:5000"]
+    # serving settings come from the app config selected by FRIDARE_ENV (see fridare/config.py)
+    hypercorn_cfg = hypercorn.Config.from_mapping(app.config["HYPERCORN"])
+    hypercorn_cfg.logger_class = functools.partial(LoguruHypercornProxy, metrics=request_metrics,
+                                                   sample_rate=app.config["ACCESS_LOG_SAMPLE_RATE"],
+                                                   slow_ms=app.config["ACCESS_LOG_SLOW_MS"])
+    logger.info(f"Serving {'DEBUG' if app.debug else 'PRODUCTION'} app on {', '.join(hypercorn_cfg.bind)}")
     try:
         trio.run(start_fridrwr_app, hypercorn_cfg, instruments=[TracerInstrument(suppressed_task_names)])
     except KeyboardInterrupt:
         logger.info(f"FRIDRWR was cancelled by KeyboardInterrupt")
+    finally:
+        log_store.close()
@@ -1,7 +1,7 @@
 """Checks project for pycodestyle and pydocstyle infractions.
 
 Usage:
-    pystyleproj.py [-c|-s|-r|-f] [-d] [-n] [-v]
+    pystyleproj.py [-c|-s|-r|-f] [-d] [-n] [-v] [-p [-j <jobs>]]
 
 Options:
     -c     Count infractions
@@ -13,9 +13,19 @@ Options:
     -n     Include SLOC analysis
 
     -v     Verbose output from py{code,doc}style
+
+    -p     Parallel, incremental mode: check files on a process pool and cache results by file content hash
+    -j <jobs>  Number of worker processes for -p, 0 for one per cpu [default: 0]
 """
+import collections
+import concurrent.futures
 import configparser
+import contextlib
+import fnmatch
+import hashlib
+import io
 import itertools
+import json
 import platform
 import subprocess
 from pathlib import Path
@@ -24,6 +34,7 @@ from docopt import docopt
 
 
 path_here = Path(__file__).parent / Path(".")
+cache_p = path_here / ".pystyleproj_cache.json"
 
 
 def pyxstyle_path(x, venv_dir="venv"):
@@ -52,12 +63,164 @@ def _load_exclusions(tox_p):
     return excludes
 
 
+def _load_max_line_length(tox_p):
+    """Load pycodestyle max-line-length from tox.ini at tox_p."""
+    tox_config = configparser.ConfigParser()
+    tox_config.read(tox_p)
+    return tox_config.getint("pycodestyle", "max-line-length", fallback=79)
+
+
 def _find_analysis_paths(root_p, excludes):
     """Find folders and files at top level that are not excluded."""
     folders = (x for x in root_p.iterdir() if x.is_dir() and x.name not in excludes)
     return list(itertools.chain(path_here.glob("*.py"), folders))
 
 
+def _find_py_files(analysis_paths, excludes):
+    """Find the .py files within analysis_paths, skipping any path with an excluded part."""
+    py_files = []
+    for analysis_path in analysis_paths:
+        if analysis_path.is_file():
+            py_files.append(analysis_path)
+        elif analysis_path.is_dir():
+            py_files.extend(analysis_path.rglob("*.py"))
+    return sorted(p for p in py_files if not any(fnmatch.fnmatch(part, e) for e in excludes for part in p.parts))
+
+
+def count_sloc(lines):
+    """Count blank, docstring, comment and code lines in lines."""
+    blank, docstring, comment, code = 0, 0, 0, 0
+    docstring_mode = False
+    for i, line in enumerate(lines, 1):
+        # If the line is just whitespace, consider it to be a blank line
+        if line.isspace():
+            blank += 1
+            continue
+        # Strip leading whitespace from the line for remaining checks
+        line = line.strip()
+        # Process docstrings
+        if line.startswith("\"\"\"") or docstring_mode:
+            # print(f"{str(i).zfill(3)}: {repr(line)}")
+            if not docstring_mode:
+                # If find == rfind then there is only one """ in the line, so enter docstring_mode
+                if line.find("\"\"\"") == line.rfind("\"\"\""):
+                    docstring_mode = True
+            else:
+                # If """ is in the line when in docstring_mode it must be the end, so exit docstring_mode
+                if "\"\"\"" in line:
+                    docstring_mode = False
+            docstring += 1
+            continue
+        # If the line starts with a #, consider it to be a comment line
+        if line.startswith("#"):
+            comment += 1
+            continue
+        code += 1
+    return blank, docstring, comment, code
+
+
+def check_file(path, max_line_length, with_doc):
+    """Check a single file with pycodestyle (and pydocstyle if with_doc), returning cacheable results.
+
+    Runs in a process pool worker, so the checkers are imported from the venv as libraries here rather than
+    being run as a subprocess per file.
+    """
+    import pycodestyle
+    import pydocstyle
+
+    class _CaptureReport(pycodestyle.BaseReport):
+        def __init__(self, options):
+            super().__init__(options)
+            self.results = []
+
+        def error(self, line_number, offset, text, check):
+            code = super().error(line_number, offset, text, check)
+            if code:
+                self.results.append([line_number, offset + 1, code, text[5:]])
+            return code
+
+    lines = Path(path).read_text(encoding="utf-8").splitlines(keepends=True)
+    result = {"sloc": count_sloc(lines), "code": [], "doc": None}
+    style = pycodestyle.StyleGuide(max_line_length=max_line_length, reporter=_CaptureReport, quiet=True)
+    checker = pycodestyle.Checker(path, lines=lines, options=style.options, report=style.init_report())
+    checker.check_all()
+    result["code"] = checker.report.results
+    if with_doc:
+        # pydocstyle logs its own warnings (e.g. parse errors) to stderr, keep the worker quiet
+        with contextlib.redirect_stderr(io.StringIO()):
+            errors = [e for e in pydocstyle.check([path]) if isinstance(e, pydocstyle.Error)]
+        result["doc"] = [[e.line, 0, e.code, e.message[len(e.code) + 2:], e.definition.name] for e in errors]
+    return result
+
+
+def _load_cache(cache_key):
+    """Load the per-file results cache, discarding it if it was made with different tools or options."""
+    try:
+        cache = json.loads(cache_p.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+    return cache["files"] if cache.get("key") == cache_key else {}
+
+
+def check_files_parallel(py_files, max_line_length, with_doc, jobs=None, verbose=False):
+    """Check py_files on a process pool, reusing cached results for files whose content hash is unchanged."""
+    import pycodestyle
+    import pydocstyle
+    cache_key = f"pycodestyle-{pycodestyle.__version__}:pydocstyle-{pydocstyle.__version__}:{max_line_length}"
+    cache = _load_cache(cache_key)
+    results, stale = {}, {}
+    for py_file in py_files:
+        rel = py_file.relative_to(path_here).as_posix()
+        digest = hashlib.sha256(py_file.read_bytes()).hexdigest()
+        cached = cache.get(rel)
+        # a cached result without doc results can't be reused when doc checks are asked for
+        if cached and cached["digest"] == digest and (not with_doc or cached["doc"] is not None):
+            results[rel] = cached
+        else:
+            stale[rel] = digest
+    if verbose:
+        print(f"{len(results)} cached, {len(stale)} to check")
+    if stale:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {rel: pool.submit(check_file, str(path_here / rel), max_line_length, with_doc)
+                       for rel in stale}
+            for rel, future in futures.items():
+                results[rel] = {"digest": stale[rel], **future.result()}
+        cache_p.write_text(json.dumps({"key": cache_key, "files": {**cache, **results}}), encoding="utf-8")
+    # always merge in path order so output doesn't depend on which worker finished first
+    return dict(sorted(results.items()))
+
+
+def print_parallel_results(results, with_doc, count=False, show_source=False, first=False):
+    """Print merged results in pycodestyle/pydocstyle-like formats."""
+    infractions = []
+    for rel, result in results.items():
+        for line, col, code, text in result["code"]:
+            infractions.append((rel, line, col, code, text))
+        if with_doc:
+            for line, col, code, text, definition in result["doc"]:
+                infractions.append((rel, line, col, code, f"{text} (in `{definition}`)"))
+    infractions.sort()
+    if count:
+        counter = collections.Counter(i[3] for i in infractions)
+        messages = {i[3]: i[4] for i in reversed(infractions)}
+        for code, n in sorted(counter.items()):
+            print(f"{n:<7} {code} {messages[code]}")
+        print(len(infractions))
+        return
+    seen = set()
+    for rel, line, col, code, text in infractions:
+        if first:
+            if code in seen:
+                continue
+            seen.add(code)
+        print(f"{rel}:{line}:{col}: {code} {text}")
+        if show_source:
+            source = (path_here / rel).read_text(encoding="utf-8").splitlines()[line - 1]
+            print(source)
+            print(" " * max(col - 1, 0) + "^")
+
+
 if __name__ == '__main__':
     args = docopt(__doc__)
 
@@ -65,6 +228,27 @@ if __name__ == '__main__':
     excludes = _load_exclusions(tox_p)
     analysis_paths = _find_analysis_paths(path_here, excludes)
     print(f"Excluding {', '.join(excludes)}")
+
+    if args["-p"]:
+        py_files = _find_py_files(analysis_paths, excludes)
+        jobs = int(args["-j"]) or None
+        results = check_files_parallel(py_files, _load_max_line_length(tox_p), args["-d"], jobs, args["-v"])
+        print_parallel_results(results, args["-d"], count=args["-c"], show_source=args["-s"] or args["-r"],
+                               first=args["-f"])
+        if args["-n"]:
+            print("Performing SLOC analysis...")
+            totals = [0, 0, 0, 0]
+            for rel, result in results.items():
+                # skip this file to avoid including its contents in SLOC analysis, as below
+                if rel == "pystyleproj.py":
+                    continue
+                totals = [t + n for t, n in zip(totals, result["sloc"])]
+                if args["-v"]:
+                    print(f"{rel}: {result['sloc'][0]} blank, {result['sloc'][1]} docstring, "
+                          f"{result['sloc'][2]} comment, {result['sloc'][3]} code")
+            print(f"Lines: {totals[0]} blank, {totals[1]} docstring, {totals[2]} comment, {totals[3]} code")
+        raise SystemExit(0)
+
     cmds = []
 
     # Create the pycodestyle command
@@ -109,34 +293,8 @@ if __name__ == '__main__':
 
         total_blank, total_docstring, total_comment, total_code = 0, 0, 0, 0
         for py_file in py_files:
-            blank, docstring, comment, code = 0, 0, 0, 0
             with py_file.open("r", encoding="utf-8") as f:
-                docstring_mode = False
-                for i, line in enumerate(f, 1):
-                    # If the line is just whitespace, consider it to be a blank line
-                    if line.isspace():
-                        blank += 1
-                        continue
-                    # Strip leading whitespace from the line for remaining checks
-                    line = line.strip()
-                    # Process docstrings
-                    if line.startswith("\"\"\"") or docstring_mode:
-                        # print(f"{str(i).zfill(3)}: {repr(line)}")
-                        if not docstring_mode:
-                            # If find == rfind then there is only one """ in the line, so enter docstring_mode
-                            if line.find("\"\"\"") == line.rfind("\"\"\""):
-                                docstring_mode = True
-                        else:
-                            # If """ is in the line when in docstring_mode it must be the end, so exit docstring_mode
-                            if "\"\"\"" in line:
-                                docstring_mode = False
-                        docstring += 1
-                        continue
-                    # If the line starts with a #, consider it to be a comment line
-                    if line.startswith("#"):
-                        comment += 1
-                        continue
-                    code += 1
+                blank, docstring, comment, code = count_sloc(f)
 
             total_blank += blank
             total_docstring += docstring